@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+module_rules 基准测试：对比逐文件逐规则匹配与编译后的单次匹配
+
+用法: python scripts/bench_module_rules.py [--entries 100000] [--rounds 3] [--seed 1]
+"""
+
+import argparse
+import random
+import re
+import time
+
+from module_rules import (ANTIFEATURE_RULES, CATEGORY_RULES, EXACT, SUBSTRING,
+                          match_antifeatures, match_categories)
+
+# 生成文件名使用的片段：大多数是不命中任何规则的普通词汇
+FILLER = ['lib', 'res', 'bin', 'arm64', 'x86', 'pinyin', 'dict', 'words', 'zh', 'cn',
+          'a', 'b', 'c', 'common', 'main', 'part', 'shard', 'v2', 'release', 'misc']
+EXTENSIONS = ['.txt', '.so', '.dex', '.bin', '.dat', '.xml', '.json', '.prop', '.sh']
+
+
+def naive_match(rules, files):
+    """与原实现相同的逐文件逐规则匹配，用作基准和正确性对照"""
+    labels = []
+    for label, kind, patterns in rules:
+        if kind == EXACT:
+            hit = any(f.lower() in [p.lower() for p in patterns] for f in files)
+        elif kind == SUBSTRING:
+            hit = any(any(p in f.lower() for p in patterns) for f in files)
+        else:
+            hit = any(any(re.search(p, f, re.I) for p in patterns) for f in files)
+        if hit and label not in labels:
+            labels.append(label)
+    return labels
+
+
+def naive_antifeatures(files):
+    labels = naive_match(ANTIFEATURE_RULES, files)
+    if '_adblocker' in labels:
+        labels = [label for label in labels if label != 'ads']
+    return [label for label in labels if not label.startswith('_')]
+
+
+def rule_words(rules):
+    words = []
+    for _, kind, patterns in rules:
+        for p in patterns:
+            if kind == SUBSTRING or kind == EXACT:
+                words.append(p)
+            elif re.fullmatch(r'[\w.\-]+', p):
+                words.append(p)
+    return words
+
+
+def synthetic_files(count, rng, hit_rate):
+    """生成 count 个文件名，其中约 hit_rate 比例包含规则关键词"""
+    words = rule_words(CATEGORY_RULES) + rule_words(ANTIFEATURE_RULES)
+    files = []
+    for _ in range(count):
+        parts = [rng.choice(FILLER) for _ in range(rng.randint(1, 3))]
+        if rng.random() < hit_rate:
+            parts.insert(rng.randrange(len(parts) + 1), rng.choice(words))
+        files.append(rng.choice(['_', '-', '']).join(parts) + rng.choice(EXTENSIONS))
+    return files
+
+
+def timed(func, files, rounds):
+    best = None
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = func(files)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=100000)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    scenarios = [
+        ('no hits', 0.0),
+        ('sparse hits', 0.0005),
+        ('dense hits', 0.2),
+    ]
+    print(f"{'scenario':<14}{'classifier':<14}{'naive (s)':>12}{'compiled (s)':>14}{'speedup':>10}")
+    for name, hit_rate in scenarios:
+        files = synthetic_files(args.entries, rng, hit_rate)
+        for label, naive, compiled in (
+            ('categories', lambda f: naive_match(CATEGORY_RULES, f), match_categories),
+            ('antifeatures', naive_antifeatures, match_antifeatures),
+        ):
+            naive_time, expected = timed(naive, files, 1)
+            compiled_time, actual = timed(compiled, files, args.rounds)
+            if set(expected) != set(actual):
+                raise SystemExit(f"mismatch in {name}/{label}: {sorted(expected)} != {sorted(actual)}")
+            print(f"{name:<14}{label:<14}{naive_time:>12.3f}{compiled_time:>14.4f}{naive_time / compiled_time:>9.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,712 @@
+#!/usr/bin/env python3
+"""
+同步流程的离线基准测试
+
+在本地启动一个替身 HTTP 服务器，模拟同步脚本访问的全部外部服务：
+- api.github.com: GraphQL 批量查询、/repos、/contents、/security/advisories（支持 ETag）
+- raw.githubusercontent.com: 各模块的 update.json
+- github.com / objects.githubusercontent.com: release 下载先 302 跳转，再由对象存储返回
+  zip 和更新日志，支持 Range、If-Range 和 If-None-Match
+- api.telegram.org: sendMessage / sendPhoto / sendMediaGroup
+每个请求可注入固定延迟。
+
+为每个规模生成合成模块目录（zip 大小和文件数按对数正态分布），在临时目录中复制一份
+scripts/ 组成独立的仓库树，然后依次在独立进程中运行 update_tracks、fix_modules
+（ModuleUpdater.fix_module）、build_index 和 check_for_module_updates，与 CI 中
+逐个运行脚本的方式一致：
+- cold: 空缓存、空仓库的首次同步
+- warm: 服务器上 --update-ratio 比例的模块发布新版本后的增量同步
+
+每个阶段记录耗时、按主机统计的请求数和传输字节数（在替身服务器端统计）以及进程的
+峰值 RSS，结果写入 JSON 基线文件；--compare 与之前提交生成的基线逐项对比。
+各阶段内部的 span 汇总（见 tracing.py）一并写入基线；--profile 为每个阶段保存 cProfile 结果。
+Telegram 的发送节流在基准中关闭，notify 阶段的耗时不包含按频率限制的等待。
+
+用法: python scripts/bench_sync.py [--modules 10,100,1000] [--latency 20] [--update-ratio 0.05]
+                                   [--output PATH] [--compare PATH] [--profile DIR] [--keep]
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+
+from http_cache import CACHE_ROOT
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+REPO_ROOT = SCRIPTS_DIR.parent
+STAGES = ('tracks', 'fix', 'index', 'notify')
+# 各阶段对应的脚本，追踪报告和 cProfile 结果以脚本名命名
+STAGE_SCRIPTS = {'tracks': 'track_updates', 'fix': 'fix_module_update', 'index': 'build_index',
+                 'notify': 'telegram_updates'}
+PHASES = ('cold', 'warm')
+BASELINE_VERSION = 1
+
+# zip 中除 module.prop 外可能出现的文件，部分会命中分类和 antifeatures 规则
+ZIP_FILES = ['customize.sh', 'service.sh', 'post-fs-data.sh', 'uninstall.sh', 'action.sh', 'system.prop',
+             'sepolicy.rule', 'META-INF/com/google/android/update-binary',
+             'META-INF/com/google/android/updater-script', 'webroot/index.html', 'webroot/app.js',
+             'zygisk/arm64-v8a.so', 'zygisk/armeabi-v7a.so', 'system/bin/busybox', 'system/etc/hosts',
+             'system/fonts/NotoSansCJK-Regular.ttc', 'system/media/bootanimation.zip']
+# 上游仓库根目录中可能出现的文件
+REPO_FILES = ['README.md', 'LICENSE', 'module.prop', 'customize.sh', 'service.sh', 'update.json',
+              'build.gradle', 'settings.gradle', 'Cargo.toml', 'package.json', 'go.mod', 'Makefile',
+              'CMakeLists.txt', 'changelog.md', '.github']
+LICENSES = ['GPL-3.0', 'MIT', 'Apache-2.0', 'GPL-2.0', 'LGPL-3.0', 'BSD-3-Clause']
+CHANGES = ['修复', '优化', '新增', '移除', 'Fix', 'Improve', 'Add', 'Remove', 'Update']
+WORDS = ['zygisk', 'webui', 'sepolicy', 'boot', 'busybox', 'hosts', 'props', 'KernelSU', 'APatch',
+         'Magisk', 'Android 15', 'SELinux', 'overlay', 'mount']
+ZIP_DATE = (2024, 1, 1, 0, 0, 0)
+
+
+class SyntheticModule:
+    """合成目录中的一个模块及其上游仓库"""
+
+    def __init__(self, index: int, rng: random.Random, zip_kb: int):
+        self.module_id = f'bench_module_{index:05d}'
+        self.owner = f'dev{index % 97}'
+        self.repo = f'Module{index}'
+        self.version_code = rng.randint(1, 400)
+        self.license = rng.choice(LICENSES) if rng.random() > 0.1 else None
+        self.archived = rng.random() < 0.03
+        self.vulnerable = rng.random() < 0.02
+        self.repo_files = rng.sample(REPO_FILES, rng.randint(3, len(REPO_FILES)))
+        self.zip_size = int(min(max(rng.lognormvariate(math.log(zip_kb * 1024), 1.0), 4096),
+                                zip_kb * 1024 * 40))
+        self.entry_count = int(min(max(rng.lognormvariate(math.log(30), 1.0), 4), 1500))
+
+    @property
+    def repo_url(self) -> str:
+        return f'https://github.com/{self.owner}/{self.repo}'
+
+    @property
+    def update_url(self) -> str:
+        return f'https://raw.githubusercontent.com/{self.owner}/{self.repo}/main/update.json'
+
+    def asset_name(self, version_code: int, ext: str) -> str:
+        return f'{self.repo}-v{version_code}.{ext}'
+
+    def release_url(self, version_code: int, ext: str) -> str:
+        return f'{self.repo_url}/releases/download/v{version_code}/{self.asset_name(version_code, ext)}'
+
+    def update_json(self) -> Dict[str, Any]:
+        return {
+            'version': f'v{self.version_code}',
+            'versionCode': self.version_code,
+            'zipUrl': self.release_url(self.version_code, 'zip'),
+            'changelog': self.release_url(self.version_code, 'md'),
+        }
+
+    def config(self) -> Dict[str, Any]:
+        return {
+            'url': self.repo_url,
+            'module_id': self.module_id,
+            'update_to': self.update_url,
+            'source': self.repo_url,
+            'support': f'{self.repo_url}/issues',
+            'donate': '',
+            'enable': True,
+            'verified': False,
+        }
+
+    def changelog(self, version_code: int) -> str:
+        rng = random.Random(f'{self.module_id}:{version_code}:changelog')
+        lines = [f'## v{version_code}', '']
+        for _ in range(rng.randint(2, 12)):
+            lines.append(f'- {rng.choice(CHANGES)} `{rng.choice(WORDS)}` **{rng.choice(WORDS)}** '
+                         f'_{rng.choice(WORDS)}_')
+        lines += ['', f'Full changelog: [{self.repo}]({self.repo_url}/releases)']
+        return '\n'.join(lines) + '\n'
+
+    def module_prop(self, version_code: int) -> str:
+        return (f'id={self.module_id}\nname=Bench Module {self.repo}\nversion=v{version_code}\n'
+                f'versionCode={version_code}\nauthor={self.owner}\n'
+                f'description=Synthetic module for sync benchmarks ({self.entry_count} files)\n')
+
+
+class Catalog:
+    """合成模块目录；release zip 预先生成到 hosting 目录，服务器只负责读取"""
+
+    def __init__(self, count: int, root: Path, seed: int, zip_kb: int):
+        rng = random.Random(seed)
+        self.modules = [SyntheticModule(i, rng, zip_kb) for i in range(count)]
+        self.by_repo = {(m.owner.lower(), m.repo.lower()): m for m in self.modules}
+        self.hosting = root / 'hosting'
+        for module in self.modules:
+            self.write_zip(module, module.version_code)
+
+    def zip_path(self, module: SyntheticModule, version_code: int) -> Path:
+        return self.hosting / module.owner / module.repo / f'v{version_code}.zip'
+
+    def write_zip(self, module: SyntheticModule, version_code: int) -> None:
+        path = self.zip_path(module, version_code)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        rng = random.Random(f'{module.module_id}:{version_code}')
+        names = rng.sample(ZIP_FILES, min(len(ZIP_FILES), module.entry_count // 2))
+        names += [f'system/lib64/lib{module.repo.lower()}_{i}.so' if i % 3 else f'res/raw/data_{i}.bin'
+                  for i in range(module.entry_count - len(names))]
+        weights = [rng.random() ** 3 + 0.01 for _ in names]
+        total = sum(weights)
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED) as zf:
+            zf.writestr(zipfile.ZipInfo('module.prop', ZIP_DATE), module.module_prop(version_code))
+            for name, weight in zip(names, weights):
+                zf.writestr(zipfile.ZipInfo(name, ZIP_DATE), rng.randbytes(int(module.zip_size * weight / total)))
+
+    def bump(self, ratio: float, rng: random.Random) -> List[SyntheticModule]:
+        """随机选择 ratio 比例的模块发布新版本"""
+        bumped = rng.sample(self.modules, max(1, round(len(self.modules) * ratio)))
+        for module in bumped:
+            module.version_code += 1
+            self.write_zip(module, module.version_code)
+        return bumped
+
+    def track_config(self) -> Dict[str, Any]:
+        return {'repositories': [module.config() for module in self.modules]}
+
+    def module(self, owner: str, repo: str) -> Optional[SyntheticModule]:
+        return self.by_repo.get((owner.lower(), repo.lower()))
+
+    def graphql(self, body: bytes) -> Dict[str, Any]:
+        query = json.loads(body)['query']
+        data = {}
+        for alias, owner, name in re.findall(r'(r\d+): repository\(owner: ("[^"]*"), name: ("[^"]*")\)', query):
+            module = self.module(json.loads(owner), json.loads(name))
+            data[alias] = None if module is None else {
+                'isArchived': module.archived,
+                'isDisabled': False,
+                'isPrivate': False,
+                'updatedAt': '2024-06-01T00:00:00Z',
+                'licenseInfo': {'spdxId': module.license} if module.license else None,
+                'object': {'entries': [{'name': name} for name in module.repo_files]},
+            }
+        return {'data': data}
+
+    def rest(self, module: SyntheticModule, resource: Optional[str]) -> Any:
+        if resource == '/contents':
+            return [{'name': name, 'type': 'file'} for name in module.repo_files]
+        if resource == '/security/advisories':
+            return [{'ghsa_id': 'GHSA-bench-0000-0000', 'severity': 'high'}] if module.vulnerable else []
+        return {
+            'full_name': f'{module.owner}/{module.repo}',
+            'archived': module.archived,
+            'disabled': False,
+            'private': False,
+            'license': {'spdx_id': module.license} if module.license else None,
+            'updated_at': '2024-06-01T00:00:00Z',
+        }
+
+
+class TrafficStats:
+    """替身服务器端按主机统计的请求数和字节数（包含请求行、头部和正文）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.hosts = defaultdict(lambda: {'requests': 0, 'not_modified': 0, 'partial': 0, 'errors': 0,
+                                              'bytes_up': 0, 'bytes_down': 0})
+
+    def record(self, host: str, status: int, bytes_up: int, bytes_down: int) -> None:
+        with self._lock:
+            stats = self.hosts[host]
+            stats['requests'] += 1
+            stats['bytes_up'] += bytes_up
+            stats['bytes_down'] += bytes_down
+            if status == 304:
+                stats['not_modified'] += 1
+            elif status == 206:
+                stats['partial'] += 1
+            elif status >= 400:
+                stats['errors'] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {host: dict(stats) for host, stats in sorted(self.hosts.items())}
+
+
+def etag_for(data: bytes) -> str:
+    return '"' + hashlib.sha1(data).hexdigest()[:16] + '"'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """请求路径的第一段是被替代的主机名：/api.github.com/repos/... 、/api.telegram.org/bot.../sendMessage"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch()
+
+    def do_HEAD(self):
+        self.dispatch()
+
+    def do_POST(self):
+        self.dispatch()
+
+    def dispatch(self) -> None:
+        host, _, rest = self.path.lstrip('/').partition('/')
+        path = '/' + rest.partition('?')[0]
+        length = int(self.headers.get('content-length') or 0)
+        body = self.rfile.read(length) if length else b''
+        self.status = 0
+        self.bytes_down = 0
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        route = ROUTES.get(host)
+        try:
+            if route is None:
+                self.send_json({'message': 'Not Found'}, status=404)
+            else:
+                route(self, path, body)
+        finally:
+            bytes_up = len(self.requestline) + len(str(self.headers)) + len(body)
+            self.server.stats.record(host, self.status, bytes_up, self.bytes_down)
+
+    def send_response(self, code, message=None):
+        self.status = code
+        super().send_response(code, message)
+
+    def end_headers(self):
+        self.bytes_down += sum(len(chunk) for chunk in getattr(self, '_headers_buffer', []))
+        super().end_headers()
+
+    def write_body(self, data: bytes) -> None:
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+            self.bytes_down += len(data)
+
+    def send_bytes(self, data: bytes, content_type: str, status: int = 200,
+                   headers: Optional[Dict[str, str]] = None) -> None:
+        etag = etag_for(data)
+        if status == 200 and self.headers.get('if-none-match') == etag:
+            status, data = 304, b''
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if status != 304:
+            self.send_header('Content-Type', content_type)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.write_body(data)
+
+    def send_json(self, data: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_bytes(json.dumps(data).encode('utf-8'), 'application/json; charset=utf-8', status, headers)
+
+    def redirect(self, location: str) -> None:
+        self.send_response(302)
+        self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def send_file(self, path: Path) -> None:
+        """发送 release 文件，支持 Range（含后缀范围）、If-Range 和 If-None-Match"""
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return self.send_json({'message': 'Not Found'}, status=404)
+        size = stat.st_size
+        etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+        if self.headers.get('if-none-match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            return self.end_headers()
+
+        start, end = 0, size - 1
+        byte_range = self.headers.get('range')
+        if_range = self.headers.get('if-range')
+        match = re.fullmatch(r'bytes=(\d*)-(\d*)', byte_range or '')
+        partial = bool(match) and (if_range is None or if_range == etag)
+        if partial:
+            first, last = match.groups()
+            if first:
+                start, end = int(first), min(int(last), size - 1) if last else size - 1
+            elif last:
+                start = max(size - int(last), 0)
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                return self.end_headers()
+
+        self.send_response(206 if partial else 200)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        if partial:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(remaining, 256 * 1024))
+                if not chunk:
+                    break
+                self.write_body(chunk)
+                remaining -= len(chunk)
+
+
+def route_github_api(handler: StandInHandler, path: str, body: bytes) -> None:
+    catalog = handler.server.catalog
+    if path == '/graphql' and handler.command == 'POST':
+        return handler.send_json(catalog.graphql(body))
+    match = re.fullmatch(r'/repos/([^/]+)/([^/]+)(/contents|/security/advisories)?', path)
+    module = catalog.module(match.group(1), match.group(2)) if match else None
+    if module is None:
+        return handler.send_json({'message': 'Not Found'}, status=404)
+    handler.send_json(catalog.rest(module, match.group(3)), headers={
+        'X-RateLimit-Remaining': '4999',
+        'X-RateLimit-Reset': str(int(time.time()) + 3600),
+    })
+
+
+def route_raw(handler: StandInHandler, path: str, body: bytes) -> None:
+    match = re.fullmatch(r'/([^/]+)/([^/]+)/main/update\.json', path)
+    module = handler.server.catalog.module(match.group(1), match.group(2)) if match else None
+    if module is None:
+        return handler.send_json({'message': 'Not Found'}, status=404)
+    handler.send_json(module.update_json())
+
+
+def route_github(handler: StandInHandler, path: str, body: bytes) -> None:
+    """release 下载与 GitHub 一致，先跳转到对象存储"""
+    match = re.fullmatch(r'/([^/]+)/([^/]+)/releases/download/(v\d+)/([^/]+)', path)
+    if not match:
+        return handler.send_json({'message': 'Not Found'}, status=404)
+    owner, repo, tag, name = match.groups()
+    handler.redirect(f'https://objects.githubusercontent.com/{owner}/{repo}/{tag}/{name}')
+
+
+def route_objects(handler: StandInHandler, path: str, body: bytes) -> None:
+    catalog = handler.server.catalog
+    match = re.fullmatch(r'/([^/]+)/([^/]+)/v(\d+)/[^/]+\.(zip|md)', path)
+    module = catalog.module(match.group(1), match.group(2)) if match else None
+    version_code = int(match.group(3)) if match else 0
+    if module is None or version_code > module.version_code:
+        return handler.send_json({'message': 'Not Found'}, status=404)
+    if match.group(4) == 'md':
+        return handler.send_bytes(module.changelog(version_code).encode('utf-8'), 'text/markdown; charset=utf-8')
+    handler.send_file(catalog.zip_path(module, version_code))
+
+
+def route_telegram(handler: StandInHandler, path: str, body: bytes) -> None:
+    method = path.rpartition('/')[2]
+    with handler.server.lock:
+        handler.server.message_id += 1
+        message_id = handler.server.message_id
+    message = {'message_id': message_id, 'chat': {'id': 1000}, 'date': int(time.time())}
+    if method in ('sendPhoto', 'sendMediaGroup'):
+        message['photo'] = [{'file_id': f'bench-photo-{message_id}-{size}', 'width': size, 'height': size}
+                            for size in (90, 320, 1280)]
+    result = [message] if method == 'sendMediaGroup' else message
+    handler.send_json({'ok': True, 'result': result})
+
+
+ROUTES = {
+    'api.github.com': route_github_api,
+    'raw.githubusercontent.com': route_raw,
+    'github.com': route_github,
+    'objects.githubusercontent.com': route_objects,
+    'api.telegram.org': route_telegram,
+}
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, catalog: Catalog, latency: float):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.catalog = catalog
+        self.latency = latency
+        self.stats = TrafficStats()
+        self.lock = threading.Lock()
+        self.message_id = 0
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class StandInAdapter(HTTPAdapter):
+    """把发往外部主机的请求改写到替身服务器：https://host/path -> http://127.0.0.1:port/host/path"""
+
+    def __init__(self, server_url: str, **kwargs):
+        super().__init__(**kwargs)
+        self.server_url = server_url
+
+    def send(self, request, **kwargs):
+        original = request.url
+        if not original.startswith(self.server_url):
+            parts = urlsplit(original)
+            request.url = f'{self.server_url}/{parts.netloc}{parts.path}' + (f'?{parts.query}' if parts.query else '')
+        # 替身服务器在本机，不经过环境变量中的代理
+        kwargs['proxies'] = {}
+        response = super().send(request, **kwargs)
+        response.url = original
+        return response
+
+
+def install_stand_in(server_url: str) -> None:
+    """让共享 HTTP 会话的所有请求都发往替身服务器，保留原有的重试设置"""
+    from http_client import HOST_CONCURRENCY, POOL_SIZE, get_session
+    session = get_session()
+    current = session.get_adapter('https://')
+    # 所有主机共用一个本地地址，连接池容量按各主机并发上限之和设置
+    size = POOL_SIZE + sum(HOST_CONCURRENCY.values())
+    adapter = StandInAdapter(server_url, pool_connections=1, pool_maxsize=size, max_retries=current.max_retries)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+
+def run_stage(stage: str) -> Dict[str, Any]:
+    """在复制出的仓库树中运行一个阶段（子进程入口），返回耗时、峰值 RSS 和阶段结果"""
+    import resource
+    from tracing import get_tracer
+    get_tracer().run = STAGE_SCRIPTS[stage]
+    install_stand_in(os.environ['MMRL_BENCH_SERVER'])
+    if stage == 'tracks':
+        from track_updates import update_tracks
+        call, summarize = update_tracks, lambda failures: {'failed': len(failures)}
+    elif stage == 'fix':
+        from fix_module_update import fix_modules
+        paths = [str(p.parent) for p in sorted((REPO_ROOT / 'modules').glob('*/track.json'))]
+        call, summarize = lambda: fix_modules(paths), lambda results: dict(Counter(s for _, s, _ in results))
+    elif stage == 'index':
+        from build_index import build_index
+        call, summarize = build_index, lambda changed: {'changed': len(changed)}
+    else:
+        from telegram_updates import check_for_module_updates
+        call, summarize = check_for_module_updates, lambda has_updates: {'has_updates': has_updates}
+
+    start = time.perf_counter()
+    result = call()
+    seconds = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为 KB，macOS 上为字节
+    peak_mb = peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    spans = {name: {key: stage[key] for key in ('count', 'seconds', 'p95', 'bytes')}
+             for name, stage in get_tracer().summary()['stages'].items()}
+    return {'seconds': seconds, 'peak_rss_mb': round(peak_mb, 1), 'result': summarize(result), 'spans': spans}
+
+
+def prepare_tree(root: Path, catalog: Catalog) -> Path:
+    """在临时目录中组成只含脚本、配置和合成仓库列表的仓库树"""
+    tree = root / 'repo'
+    shutil.copytree(SCRIPTS_DIR, tree / 'scripts', ignore=shutil.ignore_patterns('__pycache__'))
+    (tree / 'modules').mkdir(parents=True)
+    (tree / 'json').mkdir()
+    shutil.copy(REPO_ROOT / 'json' / 'config.json', tree / 'json' / 'config.json')
+    with open(tree / 'json' / 'track_config.json', 'w', encoding='utf-8') as f:
+        json.dump(catalog.track_config(), f, indent=4)
+    return tree
+
+
+def stage_env(tree: Path, server: StandInServer) -> Dict[str, str]:
+    env = {key: value for key, value in os.environ.items()
+           if key not in ('MMRL_STATE_DB', 'UPDATED_MODULES', 'PREVIOUS_MODULES_DIR',
+                          'TELEGRAM_TOPIC_ID', 'TELEGRAM_DIGEST', 'MMRL_TRACE_REPORT', 'MMRL_PROFILE_DIR')}
+    env.update({
+        'MMRL_CACHE_DIR': str(tree / '.cache'),
+        'MMRL_BENCH_SERVER': server.url,
+        'GITHUB_TOKEN': 'bench-token',
+        'TELEGRAM_API_URL': f'{server.url}/api.telegram.org',
+        'TELEGRAM_BOT_TOKEN': '0:bench',
+        'TELEGRAM_CHAT_ID': '1000',
+        'TELEGRAM_CHAT_INTERVAL': '0',
+        'TELEGRAM_GROUP_PER_MINUTE': '1000000',
+        'TELEGRAM_GLOBAL_PER_SECOND': '1000000',
+    })
+    return env
+
+
+def run_stage_process(tree: Path, stage: str, env: Dict[str, str], log_path: Path) -> Dict[str, Any]:
+    result_path = tree / f'.bench-{stage}.json'
+    start = time.perf_counter()
+    with open(log_path, 'ab') as log:
+        log.write(f'\n===== {stage} =====\n'.encode('utf-8'))
+        log.flush()
+        process = subprocess.run(
+            [sys.executable, str(tree / 'scripts' / 'bench_sync.py'), '--stage', stage, '--result', str(result_path)],
+            cwd=tree, env=env, stdout=log, stderr=subprocess.STDOUT)
+    if process.returncode != 0:
+        tail = log_path.read_text(encoding='utf-8', errors='replace').splitlines()[-30:]
+        raise RuntimeError(f'stage {stage} exited with {process.returncode}:\n' + '\n'.join(tail))
+    result = json.loads(result_path.read_text(encoding='utf-8'))
+    result['process_seconds'] = time.perf_counter() - start
+    return result
+
+
+def bench_catalog(count: int, args, work: Path) -> List[Dict[str, Any]]:
+    root = work / str(count)
+    print(f"generating {count} modules...", flush=True)
+    catalog = Catalog(count, root, args.seed, args.zip_kb)
+    server = StandInServer(catalog, args.latency / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    runs = []
+    try:
+        tree = prepare_tree(root, catalog)
+        env = stage_env(tree, server)
+        log_path = root / 'stages.log'
+        for phase in PHASES:
+            if phase == 'warm':
+                bumped = catalog.bump(args.update_ratio, random.Random(args.seed + 1))
+                print(f"{count} modules: published new versions of {len(bumped)}", flush=True)
+            for stage in STAGES:
+                server.stats.reset()
+                process_env = dict(env)
+                if args.profile:
+                    process_env['MMRL_PROFILE_DIR'] = str(Path(args.profile).resolve() / f'{count}-{phase}')
+                result = run_stage_process(tree, stage, process_env, log_path)
+                hosts = server.stats.snapshot()
+                run = {
+                    'modules': count,
+                    'phase': phase,
+                    'stage': stage,
+                    'wall_seconds': round(result['seconds'], 3),
+                    'process_seconds': round(result['process_seconds'], 3),
+                    'peak_rss_mb': result['peak_rss_mb'],
+                    'requests': sum(h['requests'] for h in hosts.values()),
+                    'bytes_down': sum(h['bytes_down'] for h in hosts.values()),
+                    'bytes_up': sum(h['bytes_up'] for h in hosts.values()),
+                    'hosts': hosts,
+                    'result': result['result'],
+                    'spans': result['spans'],
+                }
+                runs.append(run)
+                print_run(run)
+    finally:
+        server.shutdown()
+        server.server_close()
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+    return runs
+
+
+def print_header() -> None:
+    print(f"{'modules':>7}  {'phase':<5}  {'stage':<6}  {'wall s':>8}  {'requests':>8}  {'MB down':>8}  "
+          f"{'RSS MB':>7}  result")
+
+
+def print_run(run: Dict[str, Any]) -> None:
+    result = ', '.join(f'{key}={value}' for key, value in run['result'].items())
+    print(f"{run['modules']:>7}  {run['phase']:<5}  {run['stage']:<6}  {run['wall_seconds']:>8.2f}  "
+          f"{run['requests']:>8}  {run['bytes_down'] / 1024 / 1024:>8.2f}  {run['peak_rss_mb']:>7.1f}  {result}",
+          flush=True)
+
+
+def git_revision() -> Optional[str]:
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision + ('-dirty' if dirty else '')
+
+
+def compare(runs: List[Dict[str, Any]], baseline_path: Path) -> None:
+    """逐项对比基线，比值大于 1 表示比基线更慢或更多"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    old_runs = {(r['modules'], r['phase'], r['stage']): r for r in baseline.get('runs', [])}
+    print(f"\ncompared with {baseline_path} ({baseline.get('revision')}):")
+    print(f"{'modules':>7}  {'phase':<5}  {'stage':<6}  {'wall':>7}  {'requests':>9}  {'bytes':>7}  {'RSS':>7}")
+
+    def ratio(new: float, old: float) -> str:
+        return f"x{new / old:.2f}" if old else ('=' if new == old else 'new')
+
+    for run in runs:
+        old = old_runs.get((run['modules'], run['phase'], run['stage']))
+        if old is None:
+            continue
+        print(f"{run['modules']:>7}  {run['phase']:<5}  {run['stage']:<6}  "
+              f"{ratio(run['wall_seconds'], old['wall_seconds']):>7}  "
+              f"{run['requests'] - old['requests']:>+9}  {ratio(run['bytes_down'], old['bytes_down']):>7}  "
+              f"{ratio(run['peak_rss_mb'], old['peak_rss_mb']):>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='同步流程的离线基准测试')
+    parser.add_argument('--modules', default='10,100,1000', help='逗号分隔的模块数量，例如 10,100,1000,5000')
+    parser.add_argument('--latency', type=float, default=20, help='替身服务器每个请求注入的延迟（毫秒）')
+    parser.add_argument('--update-ratio', type=float, default=0.05, help='warm 阶段发布新版本的模块比例')
+    parser.add_argument('--zip-kb', type=int, default=64, help='release zip 大小的中位数（KB）')
+    parser.add_argument('--seed', type=int, default=1, help='合成目录的随机种子')
+    parser.add_argument('--output', help='基线 JSON 的输出路径，默认写入缓存目录下的 bench/')
+    parser.add_argument('--compare', help='与之前生成的基线 JSON 对比')
+    parser.add_argument('--profile', help='把每个阶段的 cProfile 结果写入该目录下的 <模块数>-<phase>/<脚本名>.prof')
+    parser.add_argument('--keep', action='store_true', help='保留临时仓库树和日志')
+    parser.add_argument('--stage', choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage:
+        result = run_stage(args.stage)
+        Path(args.result).write_text(json.dumps(result), encoding='utf-8')
+        return 0
+
+    counts = [int(count) for count in args.modules.split(',') if count.strip()]
+    work = Path(tempfile.mkdtemp(prefix='mmrl-bench-'))
+    revision = git_revision()
+    runs = []
+    print_header()
+    try:
+        for count in counts:
+            runs.extend(bench_catalog(count, args, work))
+    finally:
+        if args.keep:
+            print(f"work tree kept at {work}")
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+
+    baseline = {
+        'version': BASELINE_VERSION,
+        'revision': revision,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'latency_ms': args.latency, 'update_ratio': args.update_ratio, 'zip_kb': args.zip_kb,
+                     'seed': args.seed},
+        'runs': runs,
+    }
+    output = Path(args.output) if args.output else CACHE_ROOT / 'bench' / f"sync-{revision or 'unknown'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2)
+    print(f"baseline written to {output}")
+    if args.compare:
+        compare(runs, Path(args.compare))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
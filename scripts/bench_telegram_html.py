@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+telegram_html 的基准测试与模糊测试
+
+- 基准：转换仓库中全部 modules/*/*.md，输出耗时和吞吐量
+- 对抗输入：大量未闭合的强调、链接、反引号等，比较输入放大 16 倍前后的耗时，
+  耗时增长明显超过线性时判定失败（常数很小的平方项在放大 4 倍时不易察觉）
+- 模糊测试：随机拼接 Markdown 标记，检查输出是合法的 Telegram HTML（只含支持的标签、
+  正确嵌套、文本已转义），并检查任意长度截断后仍然合法且不超过上限
+
+用法: python scripts/bench_telegram_html.py [--repeat N] [--fuzz N] [--seed N]
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from telegram_html import HTML_TOKEN_RE, convert_markdown_to_html, render_changelog, truncate_html
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+MODULES_DIR = REPO_ROOT / 'modules'
+ALLOWED_TAGS = {'b', 'i', 'code', 'pre', 'a'}
+ENTITIES = {'&amp;', '&lt;', '&gt;', '&quot;'}
+OPEN_TAG_RE = re.compile(r'<(b|i|code|pre)>$|<a href="[^"<>]*">$')
+# 输入放大 SCALE 倍，耗时增长超过 MAX_GROWTH 倍视为非线性
+SCALE = 16
+MAX_GROWTH = 32.0
+
+ADVERSARIAL: List[tuple] = [
+    ('unclosed italic', lambda n: '*a ' * n),
+    ('alternating markers', lambda n: '*_' * n),
+    ('underscores', lambda n: '_' * n),
+    ('unclosed bold', lambda n: '**a' * n),
+    ('unclosed links', lambda n: '[a' * n),
+    ('link without paren', lambda n: '[a](' * n),
+    ('dangling link close', lambda n: '](' * n),
+    ('links with spaces', lambda n: '[' + '](a b' * n + ')'),
+    ('backtick far away', lambda n: 'a`' + ' ' * n + '`' + '`a' * n),
+    ('backticks', lambda n: 'a`' * n),
+    ('nested links', lambda n: '[' * n + 'a](b)' * n),
+    ('deep emphasis', lambda n: '**_*' * n + 'x' + '*_**' * n),
+    ('escapes', lambda n: '<a href="x">&amp; ' * n),
+    ('many lines', lambda n: '# h\n- *a*\n```\n<pre>\n```\n' * n),
+    ('unclosed fence', lambda n: '```\n' + '**x**\n' * n),
+]
+
+
+def check_html(html_text: str, limit: Optional[int] = None) -> Optional[str]:
+    """检查是否为合法的 Telegram HTML，返回错误描述，合法时返回 None"""
+    if limit is not None and len(html_text) > limit:
+        return f'length {len(html_text)} exceeds limit {limit}'
+    stack = []
+    for match in HTML_TOKEN_RE.finditer(html_text):
+        token = match.group()
+        if token.startswith('</'):
+            name = token[2:-1]
+            if not stack or stack[-1] != name:
+                return f'unbalanced {token} at {match.start()}'
+            stack.pop()
+        elif token.startswith('<'):
+            tag = OPEN_TAG_RE.match(token)
+            if not tag:
+                return f'unsupported tag {token!r}'
+            name = tag.group(1) or 'a'
+            if name == 'a' and 'a' in stack:
+                return 'nested link'
+            if stack and stack[-1] in ('code', 'pre'):
+                return f'<{name}> inside <{stack[-1]}>'
+            stack.append(name)
+        elif token.startswith('&'):
+            if token not in ENTITIES:
+                return f'unescaped {token!r} at {match.start()}'
+        elif '>' in token:
+            return f'unescaped > at {match.start()}'
+    if stack:
+        return f'unclosed tags {stack}'
+    return None
+
+
+def timed(func: Callable[[], object], repeat: int = 1) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_corpus(repeat: int) -> int:
+    paths = sorted(MODULES_DIR.glob('*/*.md'))
+    texts = [path.read_text(encoding='utf-8').strip() for path in paths]
+    failures = 0
+    for path, text in zip(paths, texts):
+        error = check_html(convert_markdown_to_html(text)) or check_html(render_changelog(text), 1500)
+        if error:
+            failures += 1
+            print(f"  {path.relative_to(REPO_ROOT)}: {error}")
+    size = sum(len(text.encode('utf-8')) for text in texts)
+    elapsed = timed(lambda: [convert_markdown_to_html(text) for text in texts], repeat)
+    print(f"corpus: {len(texts)} files, {size / 1024:.1f} KB, {elapsed * 1000:.1f} ms "
+          f"({size / max(elapsed, 1e-9) / 1024 / 1024:.1f} MB/s), {failures} invalid")
+    return failures
+
+
+def bench_adversarial(size: int) -> int:
+    failures = 0
+    print(f"{'adversarial input':<22}{'chars':>9}{'ms':>9}{f'x{SCALE} ms':>10}{'growth':>8}")
+    for name, build in ADVERSARIAL:
+        small, large = build(size), build(size * SCALE)
+        small_time = timed(lambda: convert_markdown_to_html(small), 3)
+        large_time = timed(lambda: convert_markdown_to_html(large), 2)
+        growth = large_time / max(small_time, 1e-9)
+        error = check_html(convert_markdown_to_html(small))
+        status = ''
+        if growth > MAX_GROWTH:
+            status = '  superlinear'
+        if error:
+            status += f'  invalid: {error}'
+        failures += bool(status)
+        print(f"{name:<22}{len(small):>9}{small_time * 1000:>9.2f}{large_time * 1000:>10.2f}{growth:>8.1f}{status}")
+    return failures
+
+
+def random_markdown(rng: random.Random) -> str:
+    pieces = ['*', '**', '***', '_', '__', '`', '[', ']', '](', ')', '(', '<', '>', '&', '"',
+              '# ', '- ', '1. ', '```', '\n', '\n\n', ' ', 'a', 'b c', 'snake_case', '中文',
+              'http://x/?a=1&b=2', '&amp;', '<b>', '</i>']
+    return ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 80)))
+
+
+def fuzz(iterations: int, seed: int) -> int:
+    rng = random.Random(seed)
+    failures = 0
+    for _ in range(iterations):
+        text = random_markdown(rng)
+        html_text = convert_markdown_to_html(text)
+        limit = rng.randint(3, len(html_text) + 3)
+        error = check_html(html_text) or check_html(truncate_html(html_text, limit), limit)
+        if error:
+            failures += 1
+            if failures <= 10:
+                print(f"  {error}: {text!r}")
+    print(f"fuzz: {iterations} inputs (seed {seed}), {failures} failures")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='telegram_html 基准测试与模糊测试')
+    parser.add_argument('--repeat', type=int, default=5, help='语料基准的重复次数（取最快一次）')
+    parser.add_argument('--size', type=int, default=5000, help='对抗输入的基础规模')
+    parser.add_argument('--fuzz', type=int, default=20000, help='模糊测试的输入数量')
+    parser.add_argument('--seed', type=int, default=0, help='模糊测试的随机种子')
+    args = parser.parse_args()
+
+    failures = bench_corpus(args.repeat)
+    failures += bench_adversarial(args.size)
+    failures += fuzz(args.fuzz, args.seed)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
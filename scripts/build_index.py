@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+增量生成 json/modules.json
+
+每个模块的条目由 modules/<id>/update.json、track.json 以及最新版本 zip 中的
+module.prop 生成。清单文件记录每个模块输入文件的哈希，只有输入发生变化的模块
+才会重新生成，其余条目直接沿用上一次输出。
+
+除供 MMRL 客户端使用的完整 modules.json 外，还为网页生成：
+- json/summary.json: 只包含卡片展示所需字段和最新版本的精简索引
+- json/modules/<id>.json: 单个模块的完整条目（含全部历史版本），打开历史版本时按需加载
+- json/search.json: 模块搜索使用的倒排索引（见 search_index.py）
+
+同时维护更新日志索引（见 changelog_store.py），供通知脚本直接取用预渲染的更新日志；
+新增或升级的模块会追加到缓存目录下的同步事件日志（见 sync_journal.py）。
+
+用法: python scripts/build_index.py [--full]
+"""
+
+import argparse
+import hashlib
+import json
+import posixpath
+import sys
+import time
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from changelog_store import ChangelogStore
+from http_cache import CACHE_ROOT
+from json_writer import report as write_report, write_json
+from search_index import build_search_index
+from sync_journal import append_events, version_event
+from tracing import span
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+MODULES_DIR = REPO_ROOT / 'modules'
+JSON_DIR = REPO_ROOT / 'json'
+INDEX_PATH = JSON_DIR / 'modules.json'
+SUMMARY_PATH = JSON_DIR / 'summary.json'
+SHARD_DIR = JSON_DIR / 'modules'
+SEARCH_INDEX_PATH = JSON_DIR / 'search.json'
+CONFIG_PATH = JSON_DIR / 'config.json'
+MANIFEST_PATH = CACHE_ROOT / 'index' / 'manifest.json'
+
+# 清单格式或条目生成逻辑变化时递增，使旧清单全部失效
+MANIFEST_VERSION = 2
+BASE_URL = 'https://misak10.github.io/mmrl-repo'
+
+# 直接来自 module.prop 的字段
+PROP_FIELDS = ('name', 'version', 'versionCode', 'author', 'description')
+# 来自 track.json 的字段，空值不写入
+TRACK_FIELDS = ('categories', 'support', 'donate', 'license', 'readme', 'homepage', 'verified')
+# 精简索引中保留的字段，其余字段只写入单模块文件
+SUMMARY_FIELDS = ('id', 'name', 'version', 'versionCode', 'author', 'description', 'categories',
+                  'features', 'icon', 'cover', 'verified')
+
+
+def file_digest(path: Path, previous: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    返回 {'mtime', 'size', 'sha256'}；mtime 和大小与上次相同时直接沿用上次的哈希
+    """
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    if previous and previous.get('mtime') == stat.st_mtime_ns and previous.get('size') == stat.st_size:
+        return previous
+    return {
+        'mtime': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha256': hashlib.sha256(path.read_bytes()).hexdigest(),
+    }
+
+
+def read_json(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def read_module_prop(zip_path: Path) -> Dict[str, str]:
+    """从 zip 中读取 module.prop（只解压这一个文件）"""
+    try:
+        with zipfile.ZipFile(zip_path) as zf:
+            text = zf.read('module.prop').decode('utf-8', errors='replace')
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return {}
+    prop = {}
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line or line.startswith('#') or '=' not in line:
+            continue
+        # 值原样保留（包括末尾空格），与已发布的条目一致
+        key, value = raw.lstrip().split('=', 1)
+        prop[key.strip()] = value
+    return prop
+
+
+def sorted_versions(update: Dict[str, Any]) -> List[Dict[str, Any]]:
+    versions = update.get('versions') or []
+    return sorted(versions, key=lambda v: v.get('versionCode', 0))
+
+
+def latest_zip_path(module_dir: Path, versions: List[Dict[str, Any]]) -> Optional[Path]:
+    if not versions:
+        return None
+    name = posixpath.basename(urlparse(versions[-1].get('zipUrl', '')).path)
+    path = module_dir / name
+    return path if name and path.exists() else None
+
+
+def module_inputs(module_dir: Path, previous: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[Path]]:
+    """收集模块输入文件的指纹，返回 (指纹, 最新 zip 路径)"""
+    previous = previous or {}
+    inputs = {
+        'update.json': file_digest(module_dir / 'update.json', previous.get('update.json')),
+        'track.json': file_digest(module_dir / 'track.json', previous.get('track.json')),
+    }
+    if inputs['update.json'] is not None and inputs['update.json'] is previous.get('update.json'):
+        # update.json 未变化时最新 zip 的文件名也不会变，只需确认文件仍然存在
+        zip_name = (previous.get('zip') or {}).get('name')
+        zip_path = module_dir / zip_name if zip_name and (module_dir / zip_name).exists() else None
+    else:
+        update = read_json(module_dir / 'update.json') or {}
+        zip_path = latest_zip_path(module_dir, sorted_versions(update))
+    if zip_path:
+        # zip 文件名包含版本号，名称和大小足以判断是否变化，无需哈希整个文件
+        inputs['zip'] = {'name': zip_path.name, 'size': zip_path.stat().st_size}
+    return inputs, zip_path
+
+
+def stable_digest(value: Optional[Dict[str, Any]]) -> Any:
+    return value.get('sha256') if value and 'sha256' in value else value
+
+
+def fingerprint(inputs: Dict[str, Any]) -> str:
+    stable = {key: stable_digest(value) for key, value in inputs.items()}
+    stable['manifest_version'] = MANIFEST_VERSION
+    return hashlib.sha256(json.dumps(stable, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def changed_inputs(old: Optional[Dict[str, Any]], new: Dict[str, Any]) -> set:
+    """
+    返回与上一次记录相比内容发生变化的输入（update.json、track.json、zip）
+
+    没有上一次记录时（首次运行或清单失效）无从判断，视为均未变化，条目沿用已发布的值。
+    """
+    if not old:
+        return set()
+    return {key for key in set(old) | set(new) if stable_digest(old.get(key)) != stable_digest(new.get(key))}
+
+
+def render_entry(module_dir: Path, zip_path: Optional[Path],
+                 previous: Optional[Dict[str, Any]], changed: frozenset = frozenset()) -> Optional[Dict[str, Any]]:
+    """
+    生成单个模块的条目
+
+    名称、版本、作者、描述等元数据依次取最新 zip 的 module.prop、上一次的条目、update.json；
+    module.prop 只在 zip 变化（或发布了新版本）时覆盖上一次条目，track.json 中的字段
+    同样只在 track.json 变化时覆盖，输入未变化时重新生成的条目与已发布的条目相同。
+    permissions、features、icon、cover 等无法从输入推导的字段从上一次条目保留。
+    changed 为内容发生变化的输入，见 changed_inputs()。
+    """
+    update = read_json(module_dir / 'update.json')
+    track = read_json(module_dir / 'track.json') or {}
+    if not update or track.get('enable', True) is False:
+        return None
+    versions = sorted_versions(update)
+    if not versions:
+        return None
+    latest = versions[-1]
+    previous = previous or {}
+    prop = read_module_prop(zip_path) if zip_path else {}
+
+    # 模块 ID 保持稳定：沿用已发布的 ID，新模块使用 track.json 中的 ID
+    entry: Dict[str, Any] = {'id': previous.get('id') or track.get('id') or update.get('id') or module_dir.name}
+    # 上一次条目的版本号属于旧版本时，module.prop 和 update.json 中的新版本优先
+    same_release = str(previous.get('versionCode')) == str(latest.get('versionCode'))
+    refresh_prop = 'zip' in changed or not same_release
+    for field in PROP_FIELDS:
+        if field in prop and (refresh_prop or field not in previous):
+            entry[field] = prop[field]
+        elif field in previous and (same_release or field not in ('version', 'versionCode')):
+            entry[field] = previous[field]
+        elif field in ('version', 'versionCode') and field in latest:
+            entry[field] = latest[field]
+    if isinstance(entry.get('versionCode'), str) and entry['versionCode'].isdigit():
+        entry['versionCode'] = int(entry['versionCode'])
+
+    refresh_track = 'track.json' in changed
+    for field in TRACK_FIELDS:
+        if field in previous and not refresh_track:
+            value = previous[field]
+        else:
+            value = track.get(field, previous.get(field))
+        if value not in (None, '', []):
+            entry[field] = value
+
+    # 保留无法从输入推导的字段
+    for key, value in previous.items():
+        if key not in entry and key not in ('track', 'versions', 'size'):
+            entry[key] = value
+    entry.setdefault('verified', False)
+    entry.setdefault('added', 0)
+    entry['size'] = latest.get('size', 0)
+
+    previous_track = previous.get('track') or {}
+    entry['track'] = {
+        'type': previous_track.get('type', 'ONLINE_JSON'),
+        'added': previous_track.get('added'),
+        'source': track.get('source', previous_track.get('source')),
+        'antifeatures': track.get('antifeatures') or None,
+        'build_metadata': f'{BASE_URL}/modules/{module_dir.name}/track.json',
+    }
+    entry['versions'] = versions
+
+    # 按上一次条目的字段顺序输出，避免无意义的差异
+    ordered = {key: entry[key] for key in previous if key in entry}
+    ordered.update(entry)
+    return ordered
+
+
+def load_manifest() -> Dict[str, Any]:
+    manifest = read_json(MANIFEST_PATH) or {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {'version': MANIFEST_VERSION, 'modules': {}}
+    return manifest
+
+
+def save_manifest(manifest: Dict[str, Any]) -> None:
+    write_json(MANIFEST_PATH, manifest, indent=1, sort_keys=True)
+
+
+def repo_header(previous_index: Dict[str, Any]) -> Dict[str, Any]:
+    """仓库级字段沿用上一次输出，缺失时取自 config.json"""
+    config = read_json(CONFIG_PATH) or {}
+    header = {key: value for key, value in previous_index.items() if key != 'modules'}
+    for key in ('id', 'name', 'website', 'support', 'donate', 'submission', 'description'):
+        if key not in header and key in config:
+            header[key] = config[key]
+    header.setdefault('metadata', {'version': 1, 'timestamp': time.time()})
+    return header
+
+
+def shard_path(module_id: str) -> Path:
+    return SHARD_DIR / f'{module_id}.json'
+
+
+def summarize_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """生成精简索引条目：versions 只保留最新版本，versionCount 记录历史版本总数"""
+    summary = {key: entry[key] for key in SUMMARY_FIELDS if key in entry}
+    track = entry.get('track') or {}
+    summary['track'] = {key: track[key] for key in ('source', 'antifeatures') if track.get(key)}
+    versions = entry.get('versions') or []
+    summary['versions'] = versions[-1:]
+    summary['versionCount'] = len(versions)
+    return summary
+
+
+def build_index(full: bool = False) -> List[str]:
+    """
+    增量更新 modules.json，返回重新生成（或删除）的模块目录名列表
+    """
+    previous_index = read_json(INDEX_PATH) or {}
+    previous_entries = {entry.get('id'): entry for entry in previous_index.get('modules', [])}
+    manifest = load_manifest()
+    changelogs = ChangelogStore()
+    old_modules = manifest['modules']
+    new_modules = {}
+    entries = []
+    changed = []
+    events = []
+
+    module_dirs = sorted(p for p in MODULES_DIR.iterdir() if p.is_dir()) if MODULES_DIR.exists() else []
+    for module_dir in module_dirs:
+        name = module_dir.name
+        record = old_modules.get(name, {})
+        inputs, zip_path = module_inputs(module_dir, record.get('inputs'))
+        digest = fingerprint(inputs)
+        previous_entry = previous_entries.get(record.get('id')) if record.get('id') else None
+
+        if not full and record.get('fingerprint') == digest and (previous_entry or record.get('skipped')):
+            entry = previous_entry
+        else:
+            fallback = previous_entry or previous_entries.get(name)
+            if fallback is None:
+                fallback = next((e for e in previous_entries.values()
+                                 if e.get('track', {}).get('build_metadata', '').endswith(f'/modules/{name}/track.json')),
+                                None)
+            # 没有清单记录时与按目录名或 track.json 找到的已发布条目比较，结果相同则不算变化
+            previous_entry = fallback
+            with span('render_entry', module=name):
+                entry = render_entry(module_dir, zip_path, fallback,
+                                     frozenset(changed_inputs(record.get('inputs'), inputs)))
+            if entry != previous_entry:
+                changed.append(name)
+                event = version_event(entry, fallback)
+                if event:
+                    events.append(event)
+        if entry and (entry != previous_entry or not shard_path(entry['id']).exists()):
+            write_json(shard_path(entry['id']), entry, separators=(',', ':'))
+
+        new_modules[name] = {
+            'fingerprint': digest,
+            'inputs': inputs,
+            'id': entry['id'] if entry else None,
+            'skipped': entry is None,
+        }
+        if entry:
+            entries.append(entry)
+            # 逐个版本比对更新日志的 mtime 和大小，未变化的文件不会重新读取
+            changelogs.update_module(entry['id'], module_dir, entry['versions'])
+
+    removed = [name for name, record in old_modules.items() if name not in new_modules and not record.get('skipped')]
+    changed.extend(removed)
+    live_ids = {record['id'] for record in new_modules.values() if record['id']}
+    for record in old_modules.values():
+        if record.get('id') and record['id'] not in live_ids:
+            shard_path(record['id']).unlink(missing_ok=True)
+            changelogs.remove_module(record['id'])
+
+    entries.sort(key=lambda entry: entry['id'])
+    header = repo_header(previous_index)
+    if changed or not INDEX_PATH.exists():
+        # 只有条目变化时才更新时间戳，--full 重建但结果相同时不会改动 modules.json
+        header['metadata'] = dict(header['metadata'], timestamp=time.time())
+    if changed or full or not INDEX_PATH.exists():
+        write_json(INDEX_PATH, dict(header, modules=entries), indent=2)
+    if changed or full or not SUMMARY_PATH.exists():
+        summary = dict(header, modules=[summarize_entry(entry) for entry in entries])
+        write_json(SUMMARY_PATH, summary, ensure_ascii=False, separators=(',', ':'))
+    if changed or full or not SEARCH_INDEX_PATH.exists():
+        write_json(SEARCH_INDEX_PATH, build_search_index(entries), ensure_ascii=False, separators=(',', ':'))
+    # modules.json 写入后再记录事件，读取事件的一方总能在 modules.json 中找到对应版本
+    append_events(events)
+
+    manifest['modules'] = new_modules
+    save_manifest(manifest)
+    changelogs.save()
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='增量生成 json/modules.json')
+    parser.add_argument('--full', action='store_true', help='忽略清单，重新生成所有模块条目')
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    changed = build_index(full=args.full)
+    elapsed = time.monotonic() - start
+    if changed:
+        print(f"Rebuilt {len(changed)} module entries in {elapsed:.2f}s: {', '.join(changed)}")
+    else:
+        print(f"modules.json is up to date ({elapsed:.2f}s)")
+    print(write_report())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+更新日志索引与预渲染的 Telegram HTML
+
+索引按模块 ID 记录 versionCode 对应的更新日志文件（以及文件的 mtime、大小和 sha256），
+并按内容哈希保存已转换、已截断的 Telegram HTML。build_index.py 在同步时维护索引，
+通知脚本通过 lookup(模块 ID, versionCode) 直接取得渲染结果，不再扫描目录或重新转换。
+"""
+
+import hashlib
+import json
+import os
+import posixpath
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+from http_cache import CACHE_ROOT
+from telegram_html import RENDER_VERSION, render_changelog
+
+STORE_PATH = CACHE_ROOT / 'changelogs' / 'index.json'
+STORE_VERSION = 1
+
+
+def changelog_name(version: Dict[str, Any]) -> str:
+    """版本对应的更新日志文件名：优先取 changelog URL，否则按 <version>_<versionCode>.md"""
+    url = version.get('changelog')
+    if url:
+        name = posixpath.basename(urlparse(url).path)
+        if name:
+            return name
+    return f"{version.get('version')}_{version.get('versionCode')}.md"
+
+
+class ChangelogStore:
+    def __init__(self, path: Path = STORE_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._dirty = False
+        data = self._load()
+        if data.get('version') != STORE_VERSION or data.get('renderer') != RENDER_VERSION:
+            data = {}
+        self.modules: Dict[str, Dict[str, Dict[str, Any]]] = data.get('modules', {})
+        self.rendered: Dict[str, str] = data.get('rendered', {})
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def update_module(self, module_id: str, module_dir: Path, versions: List[Dict[str, Any]]) -> int:
+        """
+        同步一个模块的索引，返回重新读取的更新日志文件数
+
+        mtime 和大小未变的文件直接沿用记录，内容哈希已渲染过的文件不再转换。
+        """
+        previous = self.modules.get(module_id, {})
+        records = {}
+        read = 0
+        for version in versions:
+            code = str(version.get('versionCode'))
+            path = Path(module_dir) / changelog_name(version)
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            record = previous.get(code)
+            if record and record['file'] == path.name and record['mtime'] == stat.st_mtime_ns \
+                    and record['size'] == stat.st_size and record['sha256'] in self.rendered:
+                records[code] = record
+                continue
+            content = path.read_bytes()
+            sha256 = hashlib.sha256(content).hexdigest()
+            read += 1
+            with self._lock:
+                if sha256 not in self.rendered:
+                    markdown_text = content.decode('utf-8', errors='replace').strip()
+                    self.rendered[sha256] = render_changelog(markdown_text)
+            records[code] = {'file': path.name, 'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': sha256}
+        with self._lock:
+            if records != previous:
+                self.modules[module_id] = records
+                self._dirty = True
+        return read
+
+    def remove_module(self, module_id: str) -> None:
+        with self._lock:
+            if self.modules.pop(module_id, None) is not None:
+                self._dirty = True
+
+    def lookup(self, module_id: str, version_code: Any) -> Optional[str]:
+        """返回指定版本预渲染的更新日志 HTML，索引中没有时返回 None"""
+        record = self.modules.get(module_id, {}).get(str(version_code))
+        return self.rendered.get(record['sha256']) if record else None
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            # 丢弃不再被任何版本引用的渲染结果
+            used = {record['sha256'] for records in self.modules.values() for record in records.values()}
+            self.rendered = {sha256: html for sha256, html in self.rendered.items() if sha256 in used}
+            data = json.dumps({
+                'version': STORE_VERSION,
+                'renderer': RENDER_VERSION,
+                'modules': self.modules,
+                'rendered': self.rendered,
+            }, ensure_ascii=False, sort_keys=True)
+            self._dirty = False
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f'.{self.path.name}.tmp')
+        tmp_path.write_text(data, encoding='utf-8')
+        os.replace(tmp_path, self.path)
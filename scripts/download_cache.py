@@ -0,0 +1,336 @@
+import atexit
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+import requests
+
+from http_cache import CACHE_ROOT
+from http_client import get_session
+from tracing import annotate
+
+# 下载缓存的容量上限（字节），超出后按最近使用时间淘汰
+MAX_BYTES = int(os.environ.get('MMRL_DOWNLOAD_CACHE_BYTES', 2 * 1024 ** 3))
+# 在该时间（秒）内验证过的条目直接复用，不再发条件请求
+FRESH_SECONDS = int(os.environ.get('MMRL_DOWNLOAD_FRESH_SECONDS', 600))
+# 下载中断后的续传次数与分块大小
+DOWNLOAD_RETRIES = int(os.environ.get('MMRL_DOWNLOAD_RETRIES', 5))
+CHUNK_SIZE = 256 * 1024
+
+# 可以通过 Range 续传的网络错误
+RESUMABLE_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+class DownloadResult(NamedTuple):
+    path: Path
+    sha256: str
+    size: int
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+class IncompleteDownload(Exception):
+    pass
+
+
+def _hash_file(path: Path, digest) -> int:
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return size
+
+
+def stream_download(url: str, directory: Path, session=None, timeout: int = 30,
+                    validators: Optional[Dict[str, Optional[str]]] = None,
+                    retries: int = DOWNLOAD_RETRIES) -> Optional[DownloadResult]:
+    """
+    以流式分块下载 URL 到 directory 下的临时分片，边下载边计算 sha256 与大小
+
+    连接中断时使用 Range + If-Range 从已写入的位置续传；上次运行留下的分片
+    在服务器返回相同 ETag/Last-Modified 时同样会续传。下载完成后校验长度，
+    返回分片路径及其哈希，由调用方原子地重命名到最终位置。
+    validators 非空且服务器返回 304 时返回 None，表示本地副本仍然有效。
+    内存占用只与 CHUNK_SIZE 有关，与文件大小无关。
+    """
+    session = session or get_session()
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    part_path = directory / f'{key}.part'
+    meta_path = directory / f'{key}.part.json'
+
+    digest = hashlib.sha256()
+    offset = 0
+    resume_validator = None
+    if part_path.exists() and meta_path.exists():
+        try:
+            resume_validator = json.loads(meta_path.read_text(encoding='utf-8')).get('validator')
+        except (OSError, ValueError):
+            resume_validator = None
+        if resume_validator:
+            offset = _hash_file(part_path, digest)
+    if not resume_validator:
+        part_path.unlink(missing_ok=True)
+
+    etag = last_modified = None
+    expected_size = None
+    attempt = 0
+    while True:
+        headers = {}
+        if offset and resume_validator:
+            headers['Range'] = f'bytes={offset}-'
+            headers['If-Range'] = resume_validator
+        elif validators and not offset:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+        try:
+            response = session.get(url, headers=headers, stream=True, timeout=timeout)
+            if response.status_code == 304 and not offset:
+                response.close()
+                return None
+            response.raise_for_status()
+
+            if response.status_code != 206 and offset:
+                # 服务器不支持续传或文件已变化，从头开始
+                digest = hashlib.sha256()
+                offset = 0
+            etag = response.headers.get('etag', etag)
+            last_modified = response.headers.get('last-modified', last_modified)
+            resume_validator = etag if etag and not etag.startswith('W/') else last_modified
+            if resume_validator:
+                meta_path.write_text(json.dumps({'url': url, 'validator': resume_validator}), encoding='utf-8')
+
+            if response.status_code == 206:
+                total = response.headers.get('content-range', '').rpartition('/')[2]
+                expected_size = int(total) if total.isdigit() else None
+            elif response.headers.get('content-length', '').isdigit() and \
+                    not response.headers.get('content-encoding'):
+                expected_size = int(response.headers['content-length'])
+
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    offset += len(chunk)
+            if expected_size is not None and offset != expected_size:
+                raise IncompleteDownload(f'{url}: got {offset} of {expected_size} bytes')
+            break
+        except (IncompleteDownload,) + RESUMABLE_ERRORS as e:
+            attempt += 1
+            if attempt > retries:
+                raise
+            print(f"Download interrupted ({e}), resuming {url} at byte {offset} (attempt {attempt}/{retries})")
+            time.sleep(min(2 ** attempt, 30))
+
+    meta_path.unlink(missing_ok=True)
+    return DownloadResult(part_path, digest.hexdigest(), offset, etag, last_modified)
+
+
+class DownloadCache:
+    """
+    按内容寻址的模块 zip 下载缓存
+
+    文件以 sha256 命名保存在 blobs/ 下，index.json 记录 URL 到 sha256、大小、
+    ETag 的映射。最近 FRESH_SECONDS 内验证过的条目直接复用，否则只发条件请求，
+    304 时复用本地文件；取出文件时优先使用硬链接，跨文件系统时退回复制。
+    """
+
+    def __init__(self, cache_dir: Path = CACHE_ROOT / 'downloads', max_bytes: int = MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.blob_dir = self.cache_dir / 'blobs'
+        self.index_path = self.cache_dir / 'index.json'
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'evicted': 0, 'bytes_downloaded': 0}
+        self._lock = threading.Lock()
+        self._entries = self._load_index()
+        self._url_locks: Dict[str, threading.Lock] = {}
+        self._dirty = False
+
+    def _load_index(self) -> Dict[str, Dict]:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def blob_path(self, sha256: str) -> Path:
+        return self.blob_dir / f'{sha256}.zip'
+
+    def lookup(self, url: str) -> Optional[Path]:
+        """返回已缓存的文件路径，不发任何请求"""
+        with self._lock:
+            entry = self._entries.get(url)
+            if not entry:
+                return None
+            path = self.blob_path(entry['sha256'])
+            if not path.exists():
+                del self._entries[url]
+                self._dirty = True
+                return None
+            entry['last_used'] = time.time()
+            self._dirty = True
+            return path
+
+    def entry(self, url: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(url)
+            return dict(entry) if entry else None
+
+    def fetch(self, url: str, session=None, max_age: int = FRESH_SECONDS, timeout: int = 30) -> Path:
+        """
+        返回 URL 对应的本地文件，必要时下载
+
+        max_age 秒内验证过的条目不发请求；更旧的条目发送 If-None-Match/If-Modified-Since 条件请求。
+        """
+        cached = self.lookup(url)
+        entry = self.entry(url)
+        if cached and time.time() - entry.get('validated_at', 0) < max_age:
+            with self._lock:
+                self.stats['hits'] += 1
+            annotate(cache='hit')
+            return cached
+
+        validators = {}
+        if cached:
+            validators = {'etag': entry.get('etag'), 'last_modified': entry.get('last_modified')}
+        with self._url_lock(url):
+            result = stream_download(url, self.blob_dir, session=session, timeout=timeout,
+                                     validators=validators)
+            if result is None:
+                with self._lock:
+                    # 请求期间条目可能已被 evict() 淘汰：文件还在时按请求前的副本重新登记
+                    if cached.exists():
+                        self._entries[url] = dict(self._entries.get(url) or entry, validated_at=time.time())
+                        self.stats['hits'] += 1
+                        self._dirty = True
+                        annotate(cache='revalidated')
+                        return cached
+                # 文件已被删除，不带条件重新下载
+                result = stream_download(url, self.blob_dir, session=session, timeout=timeout)
+
+            with self._lock:
+                self.stats['misses'] += 1
+            annotate(cache='miss')
+            return self.add(url, result.path, result.sha256, result.size,
+                            etag=result.etag, last_modified=result.last_modified)
+
+    def _url_lock(self, url: str) -> threading.Lock:
+        with self._lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def add(self, url: str, path: Path, sha256: str, size: int, etag: Optional[str] = None,
+            last_modified: Optional[str] = None) -> Path:
+        """把已下载完成的文件移入缓存并登记 URL"""
+        blob = self.blob_path(sha256)
+        if blob.exists():
+            os.unlink(path)
+        else:
+            os.replace(path, blob)
+        now = time.time()
+        with self._lock:
+            self._entries[url] = {
+                'sha256': sha256,
+                'size': size,
+                'etag': etag,
+                'last_modified': last_modified,
+                'validated_at': now,
+                'last_used': now,
+            }
+            self.stats['bytes_downloaded'] += size
+            self._dirty = True
+        return blob
+
+    def materialize(self, url: str, dest: Path, **kwargs) -> Path:
+        """把 URL 对应的文件放到 dest（硬链接优先），返回 dest"""
+        source = self.fetch(url, **kwargs)
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp_dest = dest.with_name(f'.{dest.name}.tmp')
+        if tmp_dest.exists():
+            tmp_dest.unlink()
+        try:
+            os.link(source, tmp_dest)
+        except OSError:
+            shutil.copyfile(source, tmp_dest)
+        os.replace(tmp_dest, dest)
+        return dest
+
+    def evict(self) -> int:
+        """按最近使用时间淘汰条目直到总大小不超过上限，返回删除的文件数"""
+        with self._lock:
+            ordered = sorted(self._entries.items(), key=lambda item: item[1].get('last_used', 0), reverse=True)
+            keep = {}
+            kept_blobs = set()
+            total = 0
+            for url, entry in ordered:
+                sha256 = entry['sha256']
+                extra = 0 if sha256 in kept_blobs else entry.get('size', 0)
+                if total + extra <= self.max_bytes:
+                    keep[url] = entry
+                    kept_blobs.add(sha256)
+                    total += extra
+            removed_urls = len(self._entries) - len(keep)
+            self._entries = keep
+            if removed_urls:
+                self._dirty = True
+        removed = 0
+        if self.blob_dir.exists():
+            # 超过一天未续传的残留分片也一并清理
+            for part in self.blob_dir.glob('*.part*'):
+                if time.time() - part.stat().st_mtime > 24 * 3600:
+                    part.unlink()
+            for blob in self.blob_dir.glob('*.zip'):
+                if blob.stem not in kept_blobs:
+                    blob.unlink()
+                    removed += 1
+        self.stats['evicted'] += removed
+        return removed
+
+    def save(self) -> None:
+        self.evict()
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self._entries, indent=1, sort_keys=True)
+            self._dirty = False
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix('.tmp')
+        tmp_path.write_text(data, encoding='utf-8')
+        os.replace(tmp_path, self.index_path)
+
+    def report(self) -> str:
+        return ('Download cache: {hits} hits, {misses} misses, {evicted} evicted, '
+                '{bytes_downloaded} bytes downloaded').format(**self.stats)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def _save_default_cache() -> None:
+    if _default_cache is not None:
+        _default_cache.save()
+        print(_default_cache.report())
+
+
+def get_download_cache() -> DownloadCache:
+    """返回进程内共享的下载缓存，进程退出时自动保存索引并淘汰"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = DownloadCache()
+            atexit.register(_save_default_cache)
+        return _default_cache
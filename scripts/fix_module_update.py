@@ -3,12 +3,21 @@
 import os
 import json
 import sys
+import argparse
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 import time
 
+from download_cache import get_download_cache
+from http_cache import cached_get
+from http_client import get_session
+from json_writer import report as write_report
+from state_store import get_state_store
+from tracing import span
+
 # 设置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -16,12 +25,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 批量模式下同时处理的模块数量
+DEFAULT_WORKERS = int(os.environ.get('FIX_WORKERS', 8))
+# 未下载版本并发探测大小时的线程数
+HEAD_PROBE_WORKERS = 4
+
 class ModuleUpdater:
     def __init__(self, module_path: str):
         self.module_path = Path(module_path)
         self.track_file = self.module_path / 'track.json'
         self.update_file = self.module_path / 'update.json'
         self.base_url = "https://misak10.github.io/mmrl-repo"
+        # 最近一次 fix_module 的结果：updated / up to date / failed
+        self.status = None
         
     def generate_urls(self, module_id: str, version: str, version_code: int) -> tuple[str, str]:
         """生成 zip 和 changelog 的 URL"""
@@ -35,12 +51,11 @@ class ModuleUpdater:
             if not self.track_file.exists():
                 logger.error(f"track.json not found in {self.module_path}")
                 return None
-                
-            with open(self.track_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            logger.error(f"Failed to parse track.json in {self.module_path}")
-            return None
+            with span('config_load', file='track.json'):
+                track = get_state_store().track(self.module_path)
+            if track is None:
+                logger.error(f"Failed to parse track.json in {self.module_path}")
+            return track
         except Exception as e:
             logger.error(f"Error reading track.json: {e}")
             return None
@@ -48,9 +63,10 @@ class ModuleUpdater:
     def fetch_update_json(self, update_url: str) -> Optional[Dict[str, Any]]:
         """从 update_to URL 获取更新信息"""
         try:
-            response = requests.get(update_url, timeout=30)
-            response.raise_for_status()
-            return response.json()
+            with span('update_to'):
+                response = cached_get(update_url, timeout=30)
+                response.raise_for_status()
+                return response.json()
         except requests.RequestException as e:
             logger.error(f"Failed to fetch update.json from {update_url}: {e}")
             return None
@@ -61,10 +77,12 @@ class ModuleUpdater:
     def update_local_update_json(self, remote_update: Dict[str, Any]) -> bool:
         """更新本地的 update.json 文件"""
         try:
-            if self.update_file.exists():
-                with open(self.update_file, 'r', encoding='utf-8') as f:
-                    local_update = json.load(f)
-            else:
+            store = get_state_store()
+            local_update = store.update_json(self.module_path)
+            if local_update is None and self.update_file.exists():
+                logger.error(f"Failed to parse {self.update_file}")
+                return False
+            if local_update is None:
                 local_update = {
                     "versions": [],
                     "timestamp": time.time()
@@ -82,71 +100,89 @@ class ModuleUpdater:
             
             # 添加新版本
             if isinstance(remote_update.get("versions"), list):
-                for version in remote_update["versions"]:
-                    if version["version"] not in existing_versions:
-                        # 生成正确的 URL
-                        zip_url, changelog_url = self.generate_urls(
-                            module_id,
-                            version["version"],
-                            version["versionCode"]
-                        )
-                        
-                        # 获取 zip 文件大小
-                        try:
-                            response = requests.head(version["zipUrl"], timeout=30)
-                            size = int(response.headers.get('content-length', 0))
-                        except:
-                            size = 0
-                            
-                        version_info = {
-                            "timestamp": time.time(),
-                            "version": version["version"],
-                            "versionCode": version["versionCode"],
-                            "zipUrl": zip_url,
-                            "changelog": changelog_url,
-                            "size": size
-                        }
-                        local_update["versions"].append(version_info)
+                remote_versions = remote_update["versions"]
             else:
                 # 处理单个版本的情况
-                if remote_update["version"] not in existing_versions:
-                    # 生成正确的 URL
-                    zip_url, changelog_url = self.generate_urls(
-                        module_id,
-                        remote_update["version"],
-                        remote_update.get("versionCode", 0)
-                    )
-                    
-                    # 获取 zip 文件大小
-                    try:
-                        response = requests.head(remote_update["zipUrl"], timeout=30)
-                        size = int(response.headers.get('content-length', 0))
-                    except:
-                        size = 0
-                        
-                    version_info = {
-                        "timestamp": time.time(),
-                        "version": remote_update["version"],
-                        "versionCode": remote_update.get("versionCode", 0),
-                        "zipUrl": zip_url,
-                        "changelog": changelog_url,
-                        "size": size
-                    }
-                    local_update["versions"].append(version_info)
-
-            # 更新主时间戳
-            local_update["timestamp"] = time.time()
-
-            # 保存更新后的 update.json
-            with open(self.update_file, 'w', encoding='utf-8') as f:
-                json.dump(local_update, f, indent=4)
-
-            logger.info(f"Successfully updated {self.update_file}")
+                remote_versions = [dict(remote_update, versionCode=remote_update.get("versionCode", 0))]
+            new_versions = [v for v in remote_versions if v["version"] not in existing_versions]
+
+            # 获取 zip 文件大小和 sha256
+            # 没有 zipUrl 的版本大小记为 0
+            artifacts = self.get_artifact_info([v["zipUrl"] for v in new_versions if v.get("zipUrl")])
+
+            for version in new_versions:
+                # 生成正确的 URL
+                zip_url, changelog_url = self.generate_urls(
+                    module_id,
+                    version["version"],
+                    version["versionCode"]
+                )
+                size, sha256 = artifacts.get(version.get("zipUrl"), (0, None))
+                version_info = {
+                    "timestamp": time.time(),
+                    "version": version["version"],
+                    "versionCode": version["versionCode"],
+                    "zipUrl": zip_url,
+                    "changelog": changelog_url,
+                    "size": size
+                }
+                if sha256:
+                    version_info["sha256"] = sha256
+                local_update["versions"].append(version_info)
+
+            # 只有加入新版本时才更新主时间戳，没有变化的 update.json 不会被重写
+            if new_versions:
+                local_update["timestamp"] = time.time()
+
+            # 新文件使用 4 空格缩进，已有文件沿用原缩进
+            if store.put_update(self.module_path, local_update):
+                logger.info(f"Successfully updated {self.update_file}")
+            else:
+                logger.info(f"{self.update_file} is up to date")
             return True
         except Exception as e:
             logger.error(f"Failed to update local update.json: {e}")
             return False
 
+    def get_artifact_info(self, zip_urls: List[str]) -> Dict[str, Tuple[int, Optional[str]]]:
+        """
+        返回 {zipUrl: (size, sha256)}
+
+        已在下载缓存中的 zip 直接使用本地计算的大小和 sha256；其余版本并发发送
+        HEAD 请求只获取大小（服务器未返回 content-length 时记为 0）。
+        """
+        cache = get_download_cache()
+        store = get_state_store()
+        artifacts = {}
+        missing = []
+        for url in dict.fromkeys(zip_urls):
+            entry = cache.entry(url) if cache.lookup(url) else None
+            known = store.artifact(url)
+            if entry:
+                artifacts[url] = (entry["size"], entry["sha256"])
+            elif known and known[0]:
+                # 之前记录过的大小（和 sha256），不必再发 HEAD 请求
+                artifacts[url] = known
+            else:
+                missing.append(url)
+
+        def probe(url: str) -> Tuple[int, Optional[str]]:
+            try:
+                with span('artifact_probe', module=self.module_path.name):
+                    response = get_session().head(url, timeout=30, allow_redirects=True)
+                if 'content-length' not in response.headers:
+                    logger.warning(f"No content-length for {url}, recording size 0")
+                return int(response.headers.get('content-length', 0)), None
+            except Exception:
+                return 0, None
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(len(missing), HEAD_PROBE_WORKERS)) as executor:
+                artifacts.update(zip(missing, executor.map(probe, missing)))
+        # 探测失败（大小为 0）的结果不记录，下次重新探测
+        store.put_artifacts({url: info for url, info in artifacts.items() if info[0]})
+        return artifacts
+
     def download_module_zip(self, zip_url: str, version: str, version_code: int) -> bool:
         """下载模块的 zip 文件和 changelog"""
         try:
@@ -156,19 +192,21 @@ class ModuleUpdater:
             # 确保模块目录存在
             self.module_path.mkdir(exist_ok=True)
             
-            # 下载并保存 zip 文件
-            response = requests.get(zip_url, timeout=30)
-            response.raise_for_status()
+            # 从共享下载缓存取出 zip 文件（硬链接或复制），缓存未命中时才下载
             zip_path = self.module_path / f"{file_base_name}.zip"
-            with open(zip_path, 'wb') as f:
-                f.write(response.content)
+            cache = get_download_cache()
+            with span('zip_download'):
+                cache.materialize(zip_url, zip_path)
+            entry = cache.entry(zip_url) or {}
+            logger.info(f"Saved {zip_path.name} ({entry.get('size')} bytes, sha256 {entry.get('sha256')})")
             
             # 尝试下载 changelog
             try:
                 # 使用生成的 changelog URL
                 changelog_url = zip_url.replace('.zip', '.md')
-                changelog_response = requests.get(changelog_url, timeout=30)
-                changelog_response.raise_for_status()
+                with span('changelog_download'):
+                    changelog_response = get_session().get(changelog_url, timeout=30)
+                    changelog_response.raise_for_status()
                 changelog_path = self.module_path / f"{file_base_name}.md"
                 with open(changelog_path, 'wb') as f:
                     f.write(changelog_response.content)
@@ -193,22 +231,15 @@ class ModuleUpdater:
             return None
 
     def get_local_latest_version_code(self) -> Optional[int]:
-        """获取本地最新版本号"""
+        """获取本地最新版本号（update.json 中最大的 versionCode，新版本追加在列表末尾）"""
         try:
-            if not self.update_file.exists():
-                return None
-                
-            with open(self.update_file, 'r', encoding='utf-8') as f:
-                local_data = json.load(f)
-                
-            if isinstance(local_data.get("versions"), list) and local_data["versions"]:
-                return local_data["versions"][0]["versionCode"]
-            return None
+            return get_state_store().latest_version_code(self.module_path)
         except Exception:
             return None
 
     def fix_module(self) -> bool:
         """修复模块更新"""
+        self.status = "failed"
         # 读取 track.json
         track_data = self.read_track_json()
         if not track_data or "update_to" not in track_data:
@@ -229,8 +260,19 @@ class ModuleUpdater:
             
         if local_version is not None and remote_version <= local_version:
             logger.info(f"Local version ({local_version}) is already up to date")
+            self.status = "up to date"
             return True
 
+        # 先把最新版本的 zip 下载到共享缓存，update.json 中的大小和 sha256 直接取自本地文件
+        latest_zip_url = (remote_update["versions"][0] if isinstance(remote_update.get("versions"), list)
+                          and remote_update["versions"] else remote_update).get("zipUrl")
+        if latest_zip_url:
+            try:
+                with span('zip_download'):
+                    get_download_cache().fetch(latest_zip_url)
+            except Exception as e:
+                logger.warning(f"Failed to prefetch {latest_zip_url}: {e}")
+
         # 更新本地 update.json
         if not self.update_local_update_json(remote_update):
             return False
@@ -238,13 +280,13 @@ class ModuleUpdater:
         # 下载最新版本的文件
         if isinstance(remote_update.get("versions"), list) and remote_update["versions"]:
             latest_version = remote_update["versions"][0]
-            return self.download_module_zip(
+            downloaded = self.download_module_zip(
                 latest_version["zipUrl"],
                 latest_version["version"],
                 latest_version["versionCode"]
             )
         elif "version" in remote_update and "versionCode" in remote_update:
-            return self.download_module_zip(
+            downloaded = self.download_module_zip(
                 remote_update["zipUrl"],
                 remote_update["version"],
                 remote_update["versionCode"]
@@ -253,20 +295,67 @@ class ModuleUpdater:
             logger.error("No valid version information found in update.json")
             return False
 
+        if downloaded:
+            self.status = "updated"
+        return downloaded
+
+def fix_one(module_path: str) -> Tuple[str, str, float]:
+    """修复单个模块，返回 (模块路径, 状态, 耗时)，异常不会向外抛出"""
+    start = time.monotonic()
+    updater = ModuleUpdater(module_path)
+    try:
+        with span('module', module=Path(module_path).name) as module_span:
+            updater.fix_module()
+            module_span.set(result=updater.status)
+        status = updater.status
+    except Exception as e:
+        logger.exception(f"Unexpected error while fixing {module_path}")
+        status = f"error: {e}"
+    return module_path, status, time.monotonic() - start
+
+def fix_modules(module_paths: List[str], workers: int = DEFAULT_WORKERS) -> List[Tuple[str, str, float]]:
+    """用有限大小的线程池并发修复多个模块，结果按输入顺序返回"""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(fix_one, module_paths))
+
+def print_results(results: List[Tuple[str, str, float]]) -> None:
+    width = max([len(Path(path).name) for path, _, _ in results] + [len("module")])
+    print(f"{'module':<{width}}  {'status':<12}  time")
+    print(f"{'-' * width}  {'-' * 12}  {'-' * 6}")
+    for path, status, seconds in results:
+        print(f"{Path(path).name:<{width}}  {status:<12}  {seconds:5.1f}s")
+    failed = sum(1 for _, status, _ in results if status not in ("updated", "up to date"))
+    updated = sum(1 for _, status, _ in results if status == "updated")
+    print(f"{len(results)} modules: {updated} updated, {failed} failed")
+
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python fix_module_update.py <module_path>")
+    parser = argparse.ArgumentParser(description="修复一个或多个模块的 update.json 与文件")
+    parser.add_argument("module_paths", nargs="*", help="模块目录，例如 modules/PlayIntegrityFix")
+    parser.add_argument("--all", action="store_true", help="处理 modules/ 下所有包含 track.json 的模块")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="并发处理的模块数量")
+    args = parser.parse_args()
+
+    module_paths = list(args.module_paths)
+    if args.all:
+        modules_dir = Path(__file__).resolve().parent.parent / "modules"
+        module_paths.extend(str(p.parent) for p in sorted(modules_dir.glob("*/track.json")))
+    module_paths = list(dict.fromkeys(module_paths))
+    if not module_paths:
+        parser.print_usage()
         sys.exit(1)
 
-    module_path = sys.argv[1]
-    updater = ModuleUpdater(module_path)
-    
-    if updater.fix_module():
-        logger.info(f"Successfully fixed module in {module_path}")
-        sys.exit(0)
-    else:
+    if len(module_paths) == 1:
+        module_path, status, _ = fix_one(module_paths[0])
+        if status in ("updated", "up to date"):
+            logger.info(f"Successfully fixed module in {module_path}")
+            sys.exit(0)
         logger.error(f"Failed to fix module in {module_path}")
         sys.exit(1)
 
+    results = fix_modules(module_paths, args.workers)
+    print_results(results)
+    print(write_report())
+    sys.exit(0 if all(status in ("updated", "up to date") for _, status, _ in results) else 1)
+
 if __name__ == "__main__":
     main() 
@@ -0,0 +1,81 @@
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from http_client import get_session
+
+GITHUB_GRAPHQL_URL = os.environ.get('GITHUB_GRAPHQL_URL', 'https://api.github.com/graphql')
+# 每个 GraphQL 查询包含的仓库数量
+BATCH_SIZE = int(os.environ.get('MMRL_GRAPHQL_BATCH_SIZE', 40))
+
+REPOSITORY_FIELDS = '''
+    isArchived
+    isDisabled
+    isPrivate
+    updatedAt
+    licenseInfo { spdxId }
+    object(expression: "HEAD:") { ... on Tree { entries { name } } }
+'''
+
+
+def build_query(repos: List[Tuple[str, str]]) -> str:
+    """为一批仓库生成带别名的查询，别名 r0, r1 ... 与输入顺序对应"""
+    parts = [
+        f'r{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{{REPOSITORY_FIELDS}}}'
+        for i, (owner, name) in enumerate(repos)
+    ]
+    return 'query {\n' + '\n'.join(parts) + '\n}'
+
+
+def normalize_repository(node: Dict) -> Dict:
+    """把 GraphQL 仓库节点转换为与 REST /repos 接口相同含义的字段"""
+    tree = node.get('object') or {}
+    entries = tree.get('entries')
+    return {
+        'archived': node.get('isArchived', False),
+        'disabled': node.get('isDisabled', False),
+        'private': node.get('isPrivate', False),
+        'license': (node.get('licenseInfo') or {}).get('spdxId') or '',
+        'updated_at': node.get('updatedAt', ''),
+        'files': [entry['name'].lower() for entry in entries] if entries is not None else None,
+    }
+
+
+def fetch_repositories(repos: Iterable[Tuple[str, str]], token: Optional[str] = None,
+                       batch_size: int = BATCH_SIZE, session=None) -> Dict[Tuple[str, str], Dict]:
+    """
+    批量获取仓库元数据，返回 {(owner, name): 元数据}，键均为小写
+
+    每批仓库只需一次 GraphQL 请求。查询失败或不存在的仓库不会出现在结果中，
+    调用方应对这些仓库退回到逐个 REST 请求。
+    """
+    token = token or os.environ.get('GITHUB_TOKEN')
+    if not token:
+        return {}
+    session = session or get_session()
+    unique = list(dict.fromkeys((owner.lower(), name.lower()) for owner, name in repos))
+    results = {}
+    for start in range(0, len(unique), batch_size):
+        batch = unique[start:start + batch_size]
+        try:
+            response = session.post(
+                GITHUB_GRAPHQL_URL,
+                json={'query': build_query(batch)},
+                headers={'Authorization': f'bearer {token}'},
+            )
+            if response.status_code != 200:
+                print(f"GraphQL batch failed with HTTP {response.status_code}")
+                continue
+            payload = response.json()
+        except Exception as e:
+            print(f"GraphQL batch failed: {e}")
+            continue
+
+        for error in payload.get('errors') or []:
+            print(f"GraphQL error: {error.get('message')}")
+        data = payload.get('data') or {}
+        for i, key in enumerate(batch):
+            node = data.get(f'r{i}')
+            if node:
+                results[key] = normalize_repository(node)
+    return results
@@ -0,0 +1,200 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from http_client import get_session
+from tracing import annotate
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+CACHE_ROOT = Path(os.environ.get('MMRL_CACHE_DIR', REPO_ROOT / '.cache'))
+
+# 缓存条目上限以及未使用条目的最长保留时间（秒）
+MAX_ENTRIES = int(os.environ.get('MMRL_HTTP_CACHE_ENTRIES', 5000))
+MAX_IDLE = int(os.environ.get('MMRL_HTTP_CACHE_MAX_IDLE', 30 * 24 * 3600))
+
+# 变化缓慢的元数据（许可证、归档状态等）在 TTL 内直接使用缓存，不发请求
+METADATA_TTL = int(os.environ.get('MMRL_METADATA_TTL', 6 * 3600))
+
+# 需要随缓存一起保存的响应头
+KEPT_HEADERS = ('content-type', 'etag', 'last-modified', 'content-length')
+
+
+class HttpCache:
+    """
+    基于 ETag / Last-Modified 的持久化 HTTP 缓存
+
+    每个 URL 保存一条记录，重复请求时附带 If-None-Match / If-Modified-Since，
+    服务器返回 304 时直接使用本地内容；在 ttl 内的记录完全不发请求。
+    """
+
+    def __init__(self, cache_dir: Path = CACHE_ROOT / 'http', max_entries: int = MAX_ENTRIES,
+                 max_idle: int = MAX_IDLE):
+        self.cache_dir = Path(cache_dir)
+        self.index_path = self.cache_dir / 'index.json'
+        self.max_entries = max_entries
+        self.max_idle = max_idle
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'evicted': 0}
+        self._lock = threading.Lock()
+        self._entries = self._load_index()
+        self._dirty = False
+
+    def _load_index(self) -> Dict[str, Dict]:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _body_path(self, url: str) -> Path:
+        return self.cache_dir / (hashlib.sha1(url.encode('utf-8')).hexdigest() + '.body')
+
+    def _read_body(self, url: str) -> Optional[bytes]:
+        try:
+            return self._body_path(url).read_bytes()
+        except OSError:
+            return None
+
+    def _build_response(self, url: str, entry: Dict, body: bytes) -> requests.Response:
+        response = requests.Response()
+        response.status_code = entry.get('status', 200)
+        response._content = body
+        response.headers = CaseInsensitiveDict(entry.get('headers', {}))
+        response.url = url
+        response.encoding = 'utf-8'
+        response.from_cache = True
+        return response
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None, ttl: int = 0,
+            session=None, **kwargs) -> requests.Response:
+        """
+        发送带缓存的 GET 请求，返回 requests.Response（命中缓存时 from_cache 为 True）
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(url)
+        body = self._read_body(url) if entry else None
+        if entry and body is None:
+            entry = None
+
+        if entry and ttl and now - entry.get('fetched_at', 0) < ttl:
+            with self._lock:
+                entry['last_used'] = now
+                self.stats['hits'] += 1
+                self._dirty = True
+            annotate(cache='hit')
+            return self._build_response(url, entry, body)
+
+        request_headers = dict(headers or {})
+        if entry:
+            cached_headers = entry.get('headers', {})
+            if cached_headers.get('etag'):
+                request_headers['If-None-Match'] = cached_headers['etag']
+            if cached_headers.get('last-modified'):
+                request_headers['If-Modified-Since'] = cached_headers['last-modified']
+
+        response = (session or get_session()).get(url, headers=request_headers, **kwargs)
+
+        if response.status_code == 304 and entry:
+            with self._lock:
+                entry['fetched_at'] = now
+                entry['last_used'] = now
+                self.stats['revalidated'] += 1
+                self._dirty = True
+            annotate(cache='revalidated')
+            return self._build_response(url, entry, body)
+
+        with self._lock:
+            self.stats['misses'] += 1
+        annotate(cache='miss')
+        if response.status_code == 200:
+            self._store(url, response, now)
+        response.from_cache = False
+        return response
+
+    def _store(self, url: str, response: requests.Response, now: float) -> None:
+        kept = {k: response.headers[k] for k in KEPT_HEADERS if k in response.headers}
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        body_path = self._body_path(url)
+        tmp_path = body_path.with_suffix(f'.{threading.get_ident()}.tmp')
+        tmp_path.write_bytes(response.content)
+        os.replace(tmp_path, body_path)
+        with self._lock:
+            self._entries[url] = {
+                'status': 200,
+                'headers': kept,
+                'fetched_at': now,
+                'last_used': now,
+            }
+            self._dirty = True
+
+    def evict(self) -> int:
+        """按最近使用时间淘汰过期或超出数量上限的条目，返回淘汰数量"""
+        now = time.time()
+        with self._lock:
+            by_age = sorted(self._entries.items(), key=lambda item: item[1].get('last_used', 0), reverse=True)
+            keep = {}
+            removed = []
+            for url, entry in by_age:
+                if len(keep) < self.max_entries and now - entry.get('last_used', 0) < self.max_idle:
+                    keep[url] = entry
+                else:
+                    removed.append(url)
+            self._entries = keep
+            self.stats['evicted'] += len(removed)
+            if removed:
+                self._dirty = True
+        for url in removed:
+            try:
+                self._body_path(url).unlink()
+            except OSError:
+                pass
+        return len(removed)
+
+    def save(self) -> None:
+        """淘汰旧条目并写回索引文件"""
+        self.evict()
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self._entries, indent=1, sort_keys=True)
+            self._dirty = False
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix('.tmp')
+        tmp_path.write_text(data, encoding='utf-8')
+        os.replace(tmp_path, self.index_path)
+
+    def report(self) -> str:
+        return ('HTTP cache: {hits} hits, {revalidated} revalidated (304), '
+                '{misses} misses, {evicted} evicted').format(**self.stats)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def _save_default_cache() -> None:
+    if _default_cache is not None:
+        _default_cache.save()
+        print(_default_cache.report())
+
+
+def get_cache() -> HttpCache:
+    """返回进程内共享的缓存实例，进程退出时自动保存"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = HttpCache()
+            atexit.register(_save_default_cache)
+        return _default_cache
+
+
+def cached_get(url: str, headers: Optional[Dict[str, str]] = None, ttl: int = 0, **kwargs) -> requests.Response:
+    return get_cache().get(url, headers=headers, ttl=ttl, **kwargs)
@@ -0,0 +1,226 @@
+import atexit
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from tracing import span
+
+# 默认超时（连接, 读取）秒
+DEFAULT_TIMEOUT = (10, 30)
+# 每个主机保持的长连接数量
+POOL_SIZE = int(os.environ.get('MMRL_HTTP_POOL_SIZE', 16))
+# 网络错误与 5xx/429 的重试次数
+MAX_RETRIES = int(os.environ.get('MMRL_HTTP_RETRIES', 3))
+# GitHub 剩余配额低于该值时开始按重置时间均匀放慢请求
+GITHUB_RATE_RESERVE = int(os.environ.get('MMRL_GITHUB_RATE_RESERVE', 100))
+# 单次等待配额重置的最长时间（秒），超过则直接返回响应交给调用方处理
+MAX_RATE_WAIT = int(os.environ.get('MMRL_MAX_RATE_WAIT', 900))
+
+# 各主机的最大并发请求数
+HOST_CONCURRENCY = {
+    'api.github.com': 4,
+    'raw.githubusercontent.com': 8,
+    'github.com': 4,
+    'objects.githubusercontent.com': 4,
+    'api.telegram.org': 4,
+}
+DEFAULT_HOST_CONCURRENCY = 4
+
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+
+def host_slot(url: str) -> threading.BoundedSemaphore:
+    """
+    返回限制该URL所在主机并发数的信号量，使用 with host_slot(url): 包裹请求
+    """
+    host = urlparse(url).hostname or ''
+    with _host_slots_lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = threading.BoundedSemaphore(HOST_CONCURRENCY.get(host, DEFAULT_HOST_CONCURRENCY))
+            _host_slots[host] = slot
+        return slot
+
+
+class RateLimiter:
+    """
+    根据 X-RateLimit-Remaining / X-RateLimit-Reset 提前放慢 GitHub 请求
+
+    剩余配额充足时不等待；低于 GITHUB_RATE_RESERVE 时把剩余配额平均分配到
+    重置前的时间里；配额耗尽时等待到重置时间。
+    """
+
+    def __init__(self, reserve: int = GITHUB_RATE_RESERVE):
+        self.reserve = reserve
+        self.remaining = None
+        self.reset_at = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, response: requests.Response) -> None:
+        remaining = response.headers.get('x-ratelimit-remaining')
+        reset_at = response.headers.get('x-ratelimit-reset')
+        if remaining is None or reset_at is None:
+            return
+        with self._lock:
+            self.remaining = int(remaining)
+            self.reset_at = float(reset_at)
+
+    def delay(self) -> float:
+        with self._lock:
+            if self.remaining is None or self.remaining > self.reserve:
+                return 0.0
+            window = self.reset_at - time.time()
+            if window <= 0:
+                self.remaining = None
+                return 0.0
+            if self.remaining <= 0:
+                return window + 1
+            self.remaining -= 1
+            return window / (self.remaining + 1)
+
+
+class HostStats:
+    """按主机统计请求数、错误数、重试次数、耗时和节流等待时间"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hosts = defaultdict(lambda: {'requests': 0, 'errors': 0, 'retries': 0, 'seconds': 0.0,
+                                          'throttled_seconds': 0.0})
+
+    def record(self, url: str, seconds: float, error: bool = False) -> None:
+        host = urlparse(url).hostname or ''
+        with self._lock:
+            stats = self.hosts[host]
+            stats['requests'] += 1
+            stats['seconds'] += seconds
+            if error:
+                stats['errors'] += 1
+
+    def add(self, url: str, key: str, value: float) -> None:
+        host = urlparse(url).hostname or ''
+        with self._lock:
+            self.hosts[host][key] += value
+
+    def report(self) -> str:
+        with self._lock:
+            lines = ['HTTP requests by host:']
+            for host, stats in sorted(self.hosts.items()):
+                average = stats['seconds'] / stats['requests'] * 1000 if stats['requests'] else 0
+                lines.append(
+                    f"  {host}: {stats['requests']} requests, {stats['errors']} errors, "
+                    f"{stats['retries']} retries, avg {average:.0f} ms, "
+                    f"throttled {stats['throttled_seconds']:.1f} s"
+                )
+            return '\n'.join(lines)
+
+
+class JitterRetry(Retry):
+    """在 urllib3 指数退避的基础上加入随机抖动，避免并发线程同时重试"""
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        return backoff + random.uniform(0, backoff) if backoff else 0
+
+
+class HttpClient(requests.Session):
+    """
+    所有脚本共享的 HTTP 会话
+
+    - 每个主机保持长连接池，避免每次请求重新握手
+    - 未指定 timeout 时使用 DEFAULT_TIMEOUT
+    - 网络错误、429 和 5xx 按 Retry-After 或带抖动的指数退避重试（不重试 POST）
+    - 对 api.github.com 根据配额头提前节流，403/429 限流时等待重置后重发
+    """
+
+    def __init__(self):
+        super().__init__()
+        retry = JitterRetry(
+            total=MAX_RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({'GET', 'HEAD'}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.headers['User-Agent'] = 'mmrl-repo-sync'
+        self.github_limiter = RateLimiter()
+        self.stats = HostStats()
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+        is_github_api = urlparse(url).hostname == 'api.github.com'
+        for attempt in range(MAX_RETRIES + 1):
+            if is_github_api:
+                wait = self.github_limiter.delay()
+                if wait > 0:
+                    wait = min(wait, MAX_RATE_WAIT)
+                    self.stats.add(url, 'throttled_seconds', wait)
+                    time.sleep(wait)
+
+            start = time.monotonic()
+            with span('http', host=urlparse(url).hostname or '', method=method) as request_span:
+                try:
+                    response = super().request(method, url, **kwargs)
+                except requests.RequestException:
+                    self.stats.record(url, time.monotonic() - start, error=True)
+                    raise
+                length = response.headers.get('content-length', '')
+                request_span.set(status=response.status_code, bytes=int(length) if length.isdigit() else 0)
+            self.stats.record(url, time.monotonic() - start, error=response.status_code >= 400)
+            retries = response.raw.retries if response.raw is not None else None
+            if retries is not None and retries.history:
+                self.stats.add(url, 'retries', len(retries.history))
+
+            if not is_github_api:
+                return response
+            self.github_limiter.update(response)
+            wait = self._rate_limited_wait(response)
+            if wait is None or wait > MAX_RATE_WAIT or attempt == MAX_RETRIES:
+                return response
+            response.close()
+            print(f"GitHub rate limit hit, waiting {wait:.0f}s before retrying {url}")
+            self.stats.add(url, 'throttled_seconds', wait)
+            time.sleep(wait)
+
+    @staticmethod
+    def _rate_limited_wait(response: requests.Response):
+        """GitHub 主/次级限流响应返回需要等待的秒数，其余返回 None"""
+        if response.status_code not in (403, 429):
+            return None
+        retry_after = response.headers.get('retry-after')
+        if retry_after and retry_after.isdigit():
+            return int(retry_after)
+        if response.headers.get('x-ratelimit-remaining') == '0':
+            reset_at = float(response.headers.get('x-ratelimit-reset', 0))
+            return max(reset_at - time.time(), 0) + 1
+        return None
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _print_report() -> None:
+    if _session is not None and _session.stats.hosts:
+        print(_session.stats.report())
+
+
+def get_session() -> HttpClient:
+    """返回进程内共享的 HTTP 会话，进程退出时打印各主机统计"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = HttpClient()
+            atexit.register(_print_report)
+        return _session
@@ -0,0 +1,82 @@
+"""
+共享的 JSON 文件写入
+
+按调用方给定的固定格式序列化后先与磁盘上的现有内容比较：内容相同时不写入，
+文件的 mtime 不变，git 和 Pages 部署都不会看到变化；内容不同时写入同目录的临时文件，
+fsync 后重命名替换，进程被中断时不会留下截断的文件。
+
+所有写入计入进程内统计，脚本结束时用 report() 输出实际改动的文件数。
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Union
+
+from tracing import span
+
+_stats = {'changed': 0, 'unchanged': 0}
+_stats_lock = threading.Lock()
+
+
+def serialize(data: Any, **kwargs) -> bytes:
+    return json.dumps(data, **kwargs).encode('utf-8')
+
+
+def detect_indent(text: str, default: int = 2) -> int:
+    """沿用原文件的缩进，避免只因格式变化产生差异"""
+    for line in text.splitlines()[1:]:
+        stripped = line.lstrip(' ')
+        if stripped:
+            return len(line) - len(stripped) or default
+    return default
+
+
+def same_content(path: Path, data: bytes) -> bool:
+    try:
+        if path.stat().st_size != len(data):
+            return False
+        return path.read_bytes() == data
+    except OSError:
+        return False
+
+
+def write_bytes_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def write_json(path: Union[str, Path], data: Any, **kwargs) -> bool:
+    """
+    写入 JSON 文件，返回文件内容是否发生变化
+
+    kwargs 传给 json.dumps（indent、sort_keys、separators 等）。
+    """
+    path = Path(path)
+    with span('json_write', file=path.name) as write_span:
+        content = serialize(data, **kwargs)
+        if same_content(path, content):
+            changed = False
+        else:
+            write_bytes_atomic(path, content)
+            changed = True
+        write_span.set(bytes=len(content), changed=changed)
+    with _stats_lock:
+        _stats['changed' if changed else 'unchanged'] += 1
+    return changed
+
+
+def report() -> str:
+    with _stats_lock:
+        total = _stats['changed'] + _stats['unchanged']
+        return f"JSON files: {_stats['changed']} changed, {_stats['unchanged']} unchanged of {total} written"
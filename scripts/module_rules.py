@@ -0,0 +1,140 @@
+import re
+from typing import Dict, Iterable, List, Tuple
+
+# 规则类型：
+#   substring  文件名（小写）包含任意一个字面量
+#   regex      文件名匹配任意一个正则（忽略大小写）
+#   exact      文件名（小写）等于任意一个字面量
+SUBSTRING = 'substring'
+REGEX = 'regex'
+EXACT = 'exact'
+
+CATEGORY_RULES = [
+    # Zygisk模块
+    ('Zygisk', SUBSTRING, [r'zygisk', r'zygote', r'riru']),
+    # 脚本模块
+    ('Script', EXACT, ['service.sh', 'post-fs-data.sh', 'customize.sh', 'install.sh']),
+    # 系统模块
+    ('System', SUBSTRING, [r'system', r'system\.prop', r'vendor', r'product', r'boot', r'recovery']),
+    # 主题模块
+    ('Theme', SUBSTRING, [r'theme', r'style', r'overlay', r'skin', r'color', r'appearance', r'icon', r'ui', r'interface']),
+    # 字体模块
+    ('Font', REGEX, [r'font', r'typeface', r'\.ttf$', r'\.otf$', r'\.woff2?$', r'emoji']),
+    # 音频模块
+    ('Audio', REGEX, [r'audio', r'sound', r'music', r'ringtone', r'\.wav$', r'\.mp3$', r'\.m4a$', r'\.ogg$', r'dolby', r'equalizer', r'speaker']),
+    # 框架模块
+    ('Framework', SUBSTRING, [r'framework', r'xposed', r'lsposed', r'edxposed', r'taichi', r'hook', r'inject']),
+    # 安全模块
+    ('Security', SUBSTRING, [r'security', r'privacy', r'protect', r'safe', r'crypto', r'permission', r'lock', r'hide', r'mask']),
+    # 网络模块
+    ('Network', SUBSTRING, [r'network', r'wifi', r'proxy', r'vpn', r'dns', r'hosts', r'firewall', r'internet', r'data', r'5g', r'4g']),
+    # 性能模块
+    ('Performance', SUBSTRING, [r'performance', r'boost', r'tweak', r'optimize', r'governor', r'kernel', r'cpu', r'gpu', r'ram', r'memory', r'battery']),
+    # 实用工具
+    ('Utility', SUBSTRING, [r'util', r'tool', r'helper', r'manager', r'settings?', r'config', r'backup', r'restore', r'clean']),
+    # 游戏相关
+    ('Gaming', SUBSTRING, [r'game', r'gaming', r'fps', r'pubg', r'codm', r'unity', r'unreal']),
+    # 相机相关
+    ('Camera', SUBSTRING, [r'camera', r'photo', r'video', r'gcam', r'lens']),
+    # 调试工具
+    ('Debug', SUBSTRING, [r'debug', r'log', r'trace', r'test', r'monitor', r'analyze']),
+    # 多媒体
+    ('Multimedia', SUBSTRING, [r'media', r'player', r'codec', r'stream', r'record']),
+    # 广告拦截类
+    ('AdBlock', REGEX, [r'去广告', r'ad[-_]?block', r'block[-_]?ads?', r'no[-_]?ads?', r'remove[-_]?ads?']),
+    # 国际化/本地化
+    ('Localization', REGEX, [r'i18n', r'l10n', r'locali[sz]e', r'translate', r'language', r'国际化', r'本地化']),
+    # 输入法相关
+    ('Input', REGEX, [r'input[-_]?method', r'keyboard', r'ime', r'输入法']),
+]
+
+# 以下划线开头的标签只用于内部判断，不会出现在结果中
+ANTIFEATURE_RULES = [
+    # 去广告类模块（用于排除误将"去广告"识别为广告的问题）
+    ('_adblocker', REGEX, [r'去广告', r'block[-_]?ads?', r'ad[-_]?block', r'no[-_]?ads?', r'remove[-_]?ads?']),
+    # 广告相关文件
+    ('ads', REGEX, [r'\bad[s]?\b', r'\badvertis(ing|ement)\b', r'广告']),
+    # 追踪相关文件
+    ('tracking', REGEX, [r'\btrack(er|ing)?\b', r'\banalytics?\b', r'\bstatistics?\b', r'\btelemetry\b']),
+    # 非自由网络服务
+    ('nonfreenet', REGEX, [r'\b(google|facebook|amazon|azure|aws)[-_]?(api|sdk|service)\b', r'\bcloud[-_]?(api|service)\b']),
+    # 非自由资产
+    ('nonfreeassets', SUBSTRING, ['.mp3', '.aac', '.wma', '.m4p', '.m4v', 'proprietary', 'nonfree']),
+    # 非自由依赖
+    ('nonfreedep', REGEX, [r'nonfree[-_]?dep', r'proprietary[-_]?dep']),
+    # 非自由附加组件
+    ('nonfreeadd', REGEX, [r'nonfree[-_]?addon', r'premium[-_]?feature']),
+    # NSFW内容
+    ('nsfw', REGEX, [r'\bnsfw\b', r'\badult\b', r'\bmature\b']),
+    # 用户数据收集
+    ('tracking', REGEX, [r'collect[-_]?data', r'user[-_]?data', r'data[-_]?collection', r'收集数据']),
+    # 已知漏洞
+    ('knownvuln', REGEX, [r'cve-\d+', r'vulnerability', r'exploit', r'security[-_]?issue', r'漏洞']),
+]
+
+
+class RuleSet:
+    """
+    一次性编译规则表，对全部文件名整体匹配
+
+    文件名转为小写后以换行拼接成一个字符串（规则都不会跨越换行），每个模式
+    各自在整段文本上扫描一次，标签一旦命中即跳过该标签的其余模式。字面量模式
+    直接用子串查找，正则模式预编译；文本为纯 ASCII 时无需 IGNORECASE。
+    扫描次数最多等于模式总数，不随文件数量增长，结果与逐个文件逐条规则匹配一致。
+    模式没有合并成一个带命名分组的大正则：交替在同一位置只报告一个分支，
+    会漏掉相互重叠的标签。
+    """
+
+    def __init__(self, rules: List[Tuple[str, str, List[str]]]):
+        self.labels = list(dict.fromkeys(label for label, _, _ in rules))
+        self._exact: Dict[str, List[str]] = {}
+        self._checks: Dict[str, List[Tuple[str, object, object]]] = {label: [] for label in self.labels}
+        for label, kind, patterns in rules:
+            for pattern in patterns:
+                if kind == EXACT:
+                    self._exact.setdefault(pattern.lower(), []).append(label)
+                elif kind == SUBSTRING or re.escape(pattern) == pattern:
+                    self._checks[label].append((pattern.lower(), None, None))
+                else:
+                    self._checks[label].append((
+                        None,
+                        re.compile(pattern, re.M),
+                        re.compile(pattern, re.M | re.I),
+                    ))
+
+    def match(self, files: Iterable[str]) -> List[str]:
+        """返回命中的标签（按规则表顺序，已去重）"""
+        names = [f.lower() for f in files]
+        found = set()
+        for name in names:
+            found.update(self._exact.get(name, ()))
+
+        text = '\n'.join(names)
+        ascii_only = text.isascii()
+        for label in self.labels:
+            if label in found:
+                continue
+            for literal, ascii_regex, unicode_regex in self._checks[label]:
+                if literal is not None:
+                    hit = literal in text
+                else:
+                    hit = (ascii_regex if ascii_only else unicode_regex).search(text) is not None
+                if hit:
+                    found.add(label)
+                    break
+        return [label for label in self.labels if label in found]
+
+
+CATEGORY_RULESET = RuleSet(CATEGORY_RULES)
+ANTIFEATURE_RULESET = RuleSet(ANTIFEATURE_RULES)
+
+
+def match_categories(files: Iterable[str]) -> List[str]:
+    return CATEGORY_RULESET.match(files)
+
+
+def match_antifeatures(files: Iterable[str]) -> List[str]:
+    labels = ANTIFEATURE_RULESET.match(files)
+    if '_adblocker' in labels:
+        labels = [label for label in labels if label != 'ads']
+    return [label for label in labels if not label.startswith('_')]
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+按 json/config.json 的 max_num 清理各模块的旧版本
+
+并行遍历 modules/*，每个模块按 versionCode 保留最新的 N 个版本：
+先原子地改写 update.json，再删除多余版本的 zip 和更新日志，
+同时清理 update.json 中已不再引用的 zip 及其同名 .md。
+
+用法: python scripts/prune_versions.py [--dry-run] [--keep N] [--workers N] [模块目录 ...]
+"""
+
+import argparse
+import json
+import os
+import posixpath
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+from urllib.parse import urlparse
+
+from json_writer import detect_indent, write_json
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+MODULES_DIR = REPO_ROOT / 'modules'
+CONFIG_PATH = REPO_ROOT / 'json' / 'config.json'
+DEFAULT_MAX_NUM = 6
+DEFAULT_WORKERS = int(os.environ.get('PRUNE_WORKERS', 8))
+
+
+class PruneResult(NamedTuple):
+    module: str
+    kept: int
+    removed_versions: List[str]
+    removed_files: List[str]
+    reclaimed: int
+    error: Optional[str] = None
+
+
+def load_max_num() -> int:
+    try:
+        with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
+            value = json.load(f).get('max_num', DEFAULT_MAX_NUM)
+    except (OSError, ValueError):
+        return DEFAULT_MAX_NUM
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        return DEFAULT_MAX_NUM
+
+
+def local_name(url: Optional[str]) -> Optional[str]:
+    """zipUrl / changelog 对应的模块目录内文件名"""
+    if not url:
+        return None
+    return posixpath.basename(urlparse(url).path) or None
+
+
+def version_code(version: Dict[str, Any]) -> int:
+    try:
+        return int(version.get('versionCode', 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def prune_module(module_dir: Path, keep: int, dry_run: bool = False) -> PruneResult:
+    name = module_dir.name
+    update_path = module_dir / 'update.json'
+    try:
+        text = update_path.read_text(encoding='utf-8')
+        update = json.loads(text)
+    except FileNotFoundError:
+        return PruneResult(name, 0, [], [], 0)
+    except (OSError, ValueError) as e:
+        return PruneResult(name, 0, [], [], 0, error=f'invalid update.json: {e}')
+
+    versions = update.get('versions')
+    if not isinstance(versions, list):
+        return PruneResult(name, 0, [], [], 0)
+    ordered = sorted(versions, key=version_code, reverse=True)
+    kept, surplus = ordered[:keep], ordered[keep:]
+
+    referenced = set()
+    for version in kept:
+        referenced.update(filter(None, (local_name(version.get('zipUrl')), local_name(version.get('changelog')))))
+
+    # 多余版本引用的文件，加上目录中已无版本引用的 zip 及其同名更新日志
+    candidates = set()
+    for version in surplus:
+        candidates.update(filter(None, (local_name(version.get('zipUrl')), local_name(version.get('changelog')))))
+    kept_zips = [local_name(version.get('zipUrl')) for version in kept]
+    if kept_zips and all(zip_name and (module_dir / zip_name).is_file() for zip_name in kept_zips):
+        # 只有保留的版本都指向本目录中的 zip 时才清理未引用的 zip，避免误删外部托管模块的文件
+        for path in module_dir.glob('*.zip'):
+            if path.name not in referenced:
+                candidates.update((path.name, f'{path.stem}.md'))
+    doomed = sorted(candidates - referenced)
+    existing = [module_dir / file_name for file_name in doomed if (module_dir / file_name).is_file()]
+    reclaimed = sum(path.stat().st_size for path in existing)
+    removed_versions = [str(version.get('version', version_code(version))) for version in surplus]
+
+    if not dry_run:
+        if surplus:
+            # 保持原有版本顺序，只去掉被淘汰的版本
+            surplus_ids = {id(version) for version in surplus}
+            update['versions'] = [version for version in versions if id(version) not in surplus_ids]
+            write_json(update_path, update, indent=detect_indent(text))
+        # 先更新 update.json 再删除文件，任何时刻 update.json 都不会引用已删除的文件
+        for path in existing:
+            path.unlink(missing_ok=True)
+
+    return PruneResult(name, len(kept), removed_versions, [path.name for path in existing], reclaimed)
+
+
+def prune_modules(module_dirs: List[Path], keep: int, dry_run: bool = False,
+                  workers: int = DEFAULT_WORKERS) -> List[PruneResult]:
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda module_dir: prune_module(module_dir, keep, dry_run), module_dirs))
+
+
+def format_size(size: int) -> str:
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GB'
+
+
+def print_report(results: List[PruneResult], keep: int, dry_run: bool) -> None:
+    action = 'Would remove' if dry_run else 'Removed'
+    for result in results:
+        if result.error:
+            print(f"  {result.module}: {result.error}")
+        elif result.removed_files or result.removed_versions:
+            versions = ', '.join(result.removed_versions) or 'none'
+            print(f"  {result.module}: {action.lower()} versions [{versions}], "
+                  f"{len(result.removed_files)} files, {format_size(result.reclaimed)}")
+    total = sum(result.reclaimed for result in results)
+    files = sum(len(result.removed_files) for result in results)
+    versions = sum(len(result.removed_versions) for result in results)
+    print(f"{action} {versions} versions and {files} files across {len(results)} modules "
+          f"(keeping {keep} per module), reclaimed {format_size(total)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按 max_num 清理旧版本')
+    parser.add_argument('paths', nargs='*', help='模块目录，默认处理 modules/ 下的全部模块')
+    parser.add_argument('--keep', type=int, help='每个模块保留的版本数，默认取 config.json 的 max_num')
+    parser.add_argument('--dry-run', action='store_true', help='只输出将要删除的内容，不修改文件')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='并行处理的模块数')
+    args = parser.parse_args()
+
+    keep = args.keep if args.keep and args.keep > 0 else load_max_num()
+    if args.paths:
+        module_dirs = [Path(path) for path in args.paths]
+    else:
+        module_dirs = sorted(p for p in MODULES_DIR.iterdir() if p.is_dir()) if MODULES_DIR.exists() else []
+
+    results = prune_modules(module_dirs, keep, dry_run=args.dry_run, workers=args.workers)
+    print_report(results, keep, args.dry_run)
+    return 1 if any(result.error for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+生成用于发布的静态站点目录（默认 dist/）
+
+- 复制 index.html、json/、modules/、assets/、src/ 到输出目录（zip 等二进制文件使用硬链接）
+- 为文本文件生成 .gz 和 .br 预压缩版本（未安装 brotli 时跳过 .br）
+- 为 index.html 以外的文本文件生成带内容哈希的副本，可长期缓存；
+  asset-manifest.json 记录原文件名到哈希文件名的映射
+- index.html 注入 window.ASSET_MANIFEST，页面通过哈希文件名加载 json/*.json
+- 只重新压缩内容发生变化的文件，最后输出压缩前后的大小统计
+- 输出目录中不再发布的文件会被删除，因此只接受空目录或本脚本生成过的目录（含 .publish-state.json）
+
+用法: python scripts/publish_site.py [--out dist] [--workers N]
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DIST_DIR = REPO_ROOT / 'dist'
+SITE_PATHS = ('index.html', 'json', 'modules', 'assets', 'src')
+TEXT_SUFFIXES = {'.html', '.json', '.md', '.xml', '.svg', '.txt', '.css', '.js'}
+MANIFEST_NAME = 'asset-manifest.json'
+STATE_NAME = '.publish-state.json'
+HASH_LENGTH = 10
+DEFAULT_WORKERS = int(os.environ.get('PUBLISH_WORKERS', os.cpu_count() or 4))
+
+
+class Artifact(NamedTuple):
+    path: str
+    group: str
+    raw: int
+    gzip: int
+    brotli: Optional[int]
+
+
+def hashed_name(rel: str, sha256: str) -> str:
+    """json/summary.json -> json/summary.<hash>.json"""
+    head, _, name = rel.rpartition('/')
+    stem, dot, suffix = name.rpartition('.')
+    name = f'{stem}.{sha256[:HASH_LENGTH]}.{suffix}' if dot else f'{name}.{sha256[:HASH_LENGTH]}'
+    return f'{head}/{name}' if head else name
+
+
+def artifact_group(rel: str) -> str:
+    if rel == 'index.html':
+        return 'index.html'
+    if rel.endswith('/update.json'):
+        return 'update.json'
+    if rel.endswith('/track.json'):
+        return 'track.json'
+    if rel.endswith('.md'):
+        return 'changelogs'
+    if rel.startswith('json/'):
+        return 'json'
+    return 'other'
+
+
+def site_files() -> List[str]:
+    files = []
+    for name in SITE_PATHS:
+        path = REPO_ROOT / name
+        if path.is_file():
+            files.append(name)
+        elif path.is_dir():
+            files.extend(p.relative_to(REPO_ROOT).as_posix() for p in path.rglob('*')
+                         if p.is_file() and not p.name.endswith('.tmp'))
+    return sorted(files)
+
+
+def write_bytes(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'.{path.name}.tmp')
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def link_file(source: Path, dest: Path) -> None:
+    """硬链接 source 到 dest，跨文件系统时复制"""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = dest.with_name(f'.{dest.name}.tmp')
+    tmp_path.unlink(missing_ok=True)
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copy2(source, tmp_path)
+    os.replace(tmp_path, dest)
+
+
+def inject_manifest(html: bytes, manifest: Dict[str, str]) -> bytes:
+    """在 </head> 前注入页面直接请求的 json/*.json 的哈希文件名"""
+    entries = {name: hashed for name, hashed in manifest.items() if name.count('/') == 1 and name.startswith('json/')}
+    script = f'<script>window.ASSET_MANIFEST = {json.dumps(entries, sort_keys=True)};</script>\n'
+    return html.replace(b'</head>', script.encode('utf-8') + b'</head>', 1)
+
+
+def compress_variants(dest: Path, data: bytes) -> Dict[str, Optional[int]]:
+    """写入 .gz/.br，压缩后不比原文件小的变体不生成；返回各变体大小"""
+    sizes = {}
+    variants = [('.gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', lambda d: brotli.compress(d, quality=11)))
+    for suffix, compress in variants:
+        variant = dest.with_name(dest.name + suffix)
+        compressed = compress(data)
+        if len(compressed) < len(data):
+            write_bytes(variant, compressed)
+            sizes[suffix] = len(compressed)
+        else:
+            variant.unlink(missing_ok=True)
+            sizes[suffix] = None
+    return sizes
+
+
+def check_out_dir(out_dir: Path) -> None:
+    """
+    确认输出目录可以由本脚本管理，否则抛出 ValueError
+
+    remove_stale() 会删除输出目录中所有不再发布的文件：输出目录不能是仓库根目录或
+    其上级目录，不能位于发布的源目录中，非空时必须是之前发布生成的目录。
+    """
+    out_dir = out_dir.resolve()
+    if out_dir == REPO_ROOT or out_dir in REPO_ROOT.parents:
+        raise ValueError(f'{out_dir} is the repository or one of its parents, refusing to publish into it')
+    for name in SITE_PATHS:
+        source = REPO_ROOT / name
+        if out_dir == source or source in out_dir.parents:
+            raise ValueError(f'{out_dir} is inside the published source {name}, refusing to publish into it')
+    if out_dir.is_dir() and any(out_dir.iterdir()) and not (out_dir / STATE_NAME).exists():
+        raise ValueError(f'{out_dir} is not empty and has no {STATE_NAME}, refusing to delete files in it')
+
+
+class Publisher:
+    def __init__(self, out_dir: Path = DIST_DIR, workers: int = DEFAULT_WORKERS):
+        self.out_dir = Path(out_dir)
+        check_out_dir(self.out_dir)
+        self.workers = workers
+        self.state = self._load_json(self.out_dir / STATE_NAME)
+        self.previous_manifest = self._load_json(self.out_dir / MANIFEST_NAME)
+        self.manifest: Dict[str, str] = {}
+        self.new_state: Dict[str, Dict] = {}
+        self.artifacts: List[Artifact] = []
+
+    @staticmethod
+    def _load_json(path: Path) -> Dict:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _variants_exist(self, rel: str) -> bool:
+        previous = self.state.get(rel) or {}
+        return all(
+            (self.out_dir / (rel + suffix)).exists()
+            for suffix, size in previous.get('variants', {}).items() if size is not None
+        )
+
+    def publish_text(self, rel: str, data: bytes) -> Dict:
+        """发布单个文本文件，内容未变化且输出完整时不重新压缩"""
+        sha256 = hashlib.sha256(data).hexdigest()
+        dest = self.out_dir / rel
+        previous = self.state.get(rel) or {}
+        wants_br = brotli is not None
+        if (previous.get('sha256') == sha256 and dest.exists() and self._variants_exist(rel)
+                and ('.br' in previous.get('variants', {})) == wants_br):
+            variants = previous['variants']
+        else:
+            write_bytes(dest, data)
+            variants = compress_variants(dest, data)
+
+        record = {'sha256': sha256, 'size': len(data), 'variants': variants}
+        if rel != 'index.html':
+            hashed = hashed_name(rel, sha256)
+            record['hashed'] = hashed
+            hashed_dest = self.out_dir / hashed
+            if not hashed_dest.exists():
+                link_file(dest, hashed_dest)
+            for suffix, size in variants.items():
+                if size is not None and not (self.out_dir / (hashed + suffix)).exists():
+                    link_file(dest.with_name(dest.name + suffix), self.out_dir / (hashed + suffix))
+        return record
+
+    def _publish_one(self, rel: str) -> Optional[Dict]:
+        source = REPO_ROOT / rel
+        if source.suffix.lower() not in TEXT_SUFFIXES:
+            dest = self.out_dir / rel
+            if not dest.exists():
+                link_file(source, dest)
+            else:
+                stat, dest_stat = source.stat(), dest.stat()
+                if not os.path.samestat(stat, dest_stat) and \
+                        (stat.st_size, stat.st_mtime_ns) != (dest_stat.st_size, dest_stat.st_mtime_ns):
+                    link_file(source, dest)
+            return None
+        # 文本文件总是复制而不是硬链接：仓库脚本会原地改写这些文件，硬链接会让已发布的哈希副本随之变化
+        return self.publish_text(rel, source.read_bytes())
+
+    def publish(self) -> None:
+        files = site_files()
+        text_files = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = [rel for rel in files if rel != 'index.html']
+            for rel, record in zip(pending, executor.map(self._publish_one, pending)):
+                if record is not None:
+                    self.new_state[rel] = record
+                    text_files.append(rel)
+
+        for rel in text_files:
+            hashed = self.new_state[rel].get('hashed')
+            if hashed:
+                self.manifest[rel] = hashed
+
+        # index.html 需要在其余文件的哈希确定后才能生成
+        if (REPO_ROOT / 'index.html').exists():
+            html = inject_manifest((REPO_ROOT / 'index.html').read_bytes(), self.manifest)
+            self.new_state['index.html'] = self.publish_text('index.html', html)
+
+        for rel, record in self.new_state.items():
+            variants = record['variants']
+            self.artifacts.append(Artifact(
+                rel, artifact_group(rel), record['size'],
+                variants.get('.gz') or record['size'],
+                (variants.get('.br') or record['size']) if brotli is not None else None,
+            ))
+
+        write_bytes(self.out_dir / MANIFEST_NAME,
+                    json.dumps(self.manifest, indent=1, sort_keys=True).encode('utf-8'))
+        write_bytes(self.out_dir / STATE_NAME, json.dumps(self.new_state, sort_keys=True).encode('utf-8'))
+        self.remove_stale(files)
+
+    def remove_stale(self, files: List[str]) -> int:
+        """
+        删除不再发布的文件；上一版本的哈希副本保留一轮，供仍缓存旧页面的客户端使用
+
+        输出目录在构造时已由 check_out_dir() 确认归本脚本管理。
+        """
+        keep = set(files) | {MANIFEST_NAME, STATE_NAME}
+        keep.update(self.manifest.values())
+        keep.update(self.previous_manifest.values())
+        keep.update(f'{name}{suffix}' for name in list(keep) for suffix in ('.gz', '.br'))
+        removed = 0
+        for path in self.out_dir.rglob('*'):
+            if path.is_file() and path.relative_to(self.out_dir).as_posix() not in keep:
+                path.unlink()
+                removed += 1
+        return removed
+
+    def changed(self) -> int:
+        """本次内容发生变化（重新压缩）的文本文件数"""
+        return sum(1 for rel, record in self.new_state.items()
+                   if (self.state.get(rel) or {}).get('sha256') != record['sha256'])
+
+    def report(self) -> str:
+        """按文件类别统计原始大小与 gzip/brotli 压缩后的大小"""
+        groups: Dict[str, List[int]] = {}
+        for artifact in self.artifacts:
+            totals = groups.setdefault(artifact.group, [0, 0, 0, 0])
+            totals[0] += 1
+            totals[1] += artifact.raw
+            totals[2] += artifact.gzip
+            totals[3] += artifact.brotli if artifact.brotli is not None else artifact.gzip
+        all_totals = [sum(values) for values in zip(*groups.values())] if groups else [0, 0, 0, 0]
+        lines = [f"{'group':<14}{'files':>7}{'raw':>12}{'gzip':>12}{'brotli':>12}{'saved':>8}"]
+        for name, (count, raw, gz, br) in sorted(groups.items()) + [('total', all_totals)]:
+            saved = (1 - min(gz, br) / raw) * 100 if raw else 0
+            br_text = str(br) if brotli is not None else 'n/a'
+            lines.append(f"{name:<14}{count:>7}{raw:>12}{gz:>12}{br_text:>12}{saved:>7.0f}%")
+        return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成预压缩、带内容哈希的发布目录')
+    parser.add_argument('--out', default=str(DIST_DIR), help='输出目录，默认 dist/')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='并行压缩线程数')
+    args = parser.parse_args()
+
+    if brotli is None:
+        print("brotli is not installed, only gzip variants will be written")
+    start = time.monotonic()
+    try:
+        publisher = Publisher(Path(args.out), workers=args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+    publisher.publish()
+    print(publisher.report())
+    print(f"Published to {publisher.out_dir} in {time.monotonic() - start:.2f}s "
+          f"({publisher.changed()} text files changed)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
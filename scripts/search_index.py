@@ -0,0 +1,86 @@
+"""
+网页模块搜索使用的倒排索引
+
+- 拉丁字母/数字按单词切分，网页端按前缀匹配单词；模块 ID 和名称另外在网页端按子串匹配
+- 中日韩文字没有分隔符，按单字和相邻两字（bigram）建立索引
+- 分类、作者、功能特性作为分面，直接映射到模块
+
+索引中的倒排表保存模块在 ids 列表中的序号（升序），网页端按序号求交集。
+网页端的分词逻辑（index.html 中的 tokenizeSearchText）必须与 tokenize 保持一致。
+"""
+
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, List, Set
+
+# 索引格式变化时递增，网页端遇到不认识的版本时退回线性扫描
+SEARCH_INDEX_VERSION = 1
+# 参与全文索引的字段
+TEXT_FIELDS = ('id', 'name', 'author', 'description')
+
+# 平假名/片假名、CJK 扩展 A、CJK 统一汉字、韩文音节、CJK 兼容汉字
+CJK_RANGES = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+TOKEN_RE = re.compile(rf'[{CJK_RANGES}]+|[^\W_{CJK_RANGES}]+')
+CJK_RE = re.compile(rf'[{CJK_RANGES}]')
+
+
+def normalize(text: str) -> str:
+    """全角转半角并转小写"""
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def tokenize(text: str) -> Set[str]:
+    """返回文本的索引词：拉丁单词整体，中日韩文字的单字和 bigram"""
+    tokens = set()
+    for run in TOKEN_RE.findall(normalize(text)):
+        if CJK_RE.match(run):
+            tokens.update(run)
+            tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.add(run)
+    return tokens
+
+
+def _add(postings: Dict[str, List[int]], key: str, ordinal: int) -> None:
+    bucket = postings.setdefault(key, [])
+    if not bucket or bucket[-1] != ordinal:
+        bucket.append(ordinal)
+
+
+def enabled_features(features: Any) -> Iterable[str]:
+    if isinstance(features, dict):
+        return [name for name, value in features.items() if value is True]
+    return []
+
+
+def build_search_index(entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    由 modules.json 的条目生成搜索索引
+
+    entries 的顺序决定模块序号；按序号递增处理，倒排表天然有序且无需去重排序。
+    """
+    tokens: Dict[str, List[int]] = {}
+    facets: Dict[str, Dict[str, List[int]]] = {'category': {}, 'author': {}, 'feature': {}}
+    ids = []
+    for ordinal, entry in enumerate(entries):
+        ids.append(entry['id'])
+        words = set()
+        for field in TEXT_FIELDS:
+            value = entry.get(field)
+            if isinstance(value, str):
+                words |= tokenize(value)
+        for word in sorted(words):
+            _add(tokens, word, ordinal)
+        for category in entry.get('categories') or []:
+            _add(facets['category'], normalize(category), ordinal)
+        if entry.get('author'):
+            _add(facets['author'], normalize(entry['author']), ordinal)
+        for feature in enabled_features(entry.get('features')):
+            _add(facets['feature'], feature, ordinal)
+
+    return {
+        'version': SEARCH_INDEX_VERSION,
+        'ids': ids,
+        'tokens': dict(sorted(tokens.items())),
+        'facets': {name: dict(sorted(values.items())) for name, values in facets.items()},
+    }
@@ -0,0 +1,424 @@
+"""
+模块状态的 SQLite 存储
+
+表结构：
+- repositories: json/track_config.json 中的仓库配置，以及生成的 modules/<id>/track.json
+- update_files / versions: modules/<id>/update.json，versions 在 (module_id, version_code) 上有索引
+- artifacts: zip 的大小和 sha256，按 URL 索引
+- notifications: 每个模块最后一次通知的版本（json/last_versions.json）
+- sources: 每个 JSON 文件最近一次导入或导出时的 mtime 和大小
+
+数据库放在缓存目录，丢失或结构版本变化时从仓库中的 JSON 文件重建。脚本通过本模块
+在事务中修改状态，再把变化的部分导出为 JSON 文件（git 中提交、网页和 MMRL 客户端读取的格式）。
+JSON 文件在库外被修改时（git pull、外部同步工具、手工编辑），下次访问会按 mtime 和大小
+发现并重新导入。
+"""
+
+import atexit
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from http_cache import CACHE_ROOT
+from json_writer import detect_indent, write_json
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+MODULES_DIR = REPO_ROOT / 'modules'
+TRACK_CONFIG_PATH = REPO_ROOT / 'json' / 'track_config.json'
+LAST_VERSIONS_PATH = REPO_ROOT / 'json' / 'last_versions.json'
+STATE_DB_PATH = Path(os.environ.get('MMRL_STATE_DB', CACHE_ROOT / 'state.sqlite3'))
+
+# 表结构变化时递增，旧数据库会被丢弃并从 JSON 文件重建
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE sources (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE repositories (
+    module_id TEXT PRIMARY KEY,
+    position INTEGER,
+    config TEXT,
+    track TEXT
+);
+CREATE TABLE update_files (
+    module_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    indent INTEGER NOT NULL
+);
+CREATE TABLE versions (
+    module_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    version TEXT,
+    version_code INTEGER,
+    zip_url TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (module_id, position)
+);
+CREATE INDEX versions_by_code ON versions (module_id, version_code);
+CREATE TABLE artifacts (
+    url TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    sha256 TEXT
+);
+CREATE TABLE notifications (
+    module_id TEXT PRIMARY KEY,
+    version TEXT,
+    version_code INTEGER,
+    data TEXT NOT NULL
+);
+"""
+
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _int_or_none(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class StateStore:
+    def __init__(self, path: Path = STATE_DB_PATH, repo_root: Path = REPO_ROOT):
+        self.path = Path(path)
+        self.repo_root = Path(repo_root)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 线程池中的各线程共用一个连接，由 _lock 串行化访问
+        self.conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._depth = 0
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        if self.conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            self._reset()
+
+    def _reset(self) -> None:
+        with self._lock:
+            tables = [row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+            self.conn.execute('BEGIN IMMEDIATE')
+            for table in tables:
+                self.conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+            for statement in SCHEMA.split(';'):
+                if statement.strip():
+                    self.conn.execute(statement)
+            self.conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            self.conn.execute('COMMIT')
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """嵌套调用时只有最外层提交，异常时整体回滚"""
+        with self._lock:
+            if self._depth == 0:
+                self.conn.execute('BEGIN IMMEDIATE')
+            self._depth += 1
+            try:
+                yield self.conn
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.conn.execute('ROLLBACK')
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self.conn.execute('COMMIT')
+
+    # 导入：JSON 文件在库外发生变化时重新读取
+
+    def _source_key(self, path: Path) -> str:
+        try:
+            return path.resolve().relative_to(self.repo_root).as_posix()
+        except ValueError:
+            return str(path.resolve())
+
+    def _changed_signature(self, path: Path) -> Optional[Tuple[int, int]]:
+        """文件与上次导入/导出时不同则返回新的 (mtime_ns, size)，不存在的文件记为 (0, -1)"""
+        try:
+            stat = path.stat()
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            signature = (0, -1)
+        row = self.conn.execute('SELECT mtime_ns, size FROM sources WHERE path = ?',
+                                (self._source_key(path),)).fetchone()
+        return None if row and tuple(row) == signature else signature
+
+    def _mark(self, path: Path, signature: Optional[Tuple[int, int]] = None) -> None:
+        if signature is None:
+            try:
+                stat = path.stat()
+                signature = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                signature = (0, -1)
+        self.conn.execute('INSERT INTO sources (path, mtime_ns, size) VALUES (?, ?, ?) '
+                          'ON CONFLICT (path) DO UPDATE SET mtime_ns = excluded.mtime_ns, size = excluded.size',
+                          (self._source_key(path), *signature))
+
+    @staticmethod
+    def _read(path: Path) -> Tuple[Optional[Any], Optional[str]]:
+        try:
+            text = path.read_text(encoding='utf-8')
+            return json.loads(text), text
+        except FileNotFoundError:
+            return None, None
+        except ValueError as e:
+            print(f"Ignoring invalid JSON in {path}: {e}")
+            return None, None
+
+    def _refresh_update(self, module_dir: Path) -> None:
+        path = module_dir / 'update.json'
+        signature = self._changed_signature(path)
+        if signature is None:
+            return
+        with self.transaction():
+            data, text = self._read(path)
+            self._store_update(module_dir.name, data if isinstance(data, dict) else None,
+                               detect_indent(text) if text else 2)
+            self._mark(path, signature)
+
+    def _refresh_track(self, module_dir: Path) -> None:
+        path = module_dir / 'track.json'
+        signature = self._changed_signature(path)
+        if signature is None:
+            return
+        with self.transaction():
+            data, _ = self._read(path)
+            self._store_track(module_dir.name, data if isinstance(data, dict) else None)
+            self._mark(path, signature)
+
+    def _refresh_config(self) -> None:
+        signature = self._changed_signature(TRACK_CONFIG_PATH)
+        if signature is None:
+            return
+        with self.transaction():
+            data, _ = self._read(TRACK_CONFIG_PATH)
+            repositories = (data or {}).get('repositories') or []
+            self.conn.execute('UPDATE repositories SET config = NULL, position = NULL')
+            for position, repo in enumerate(repositories):
+                self.conn.execute(
+                    'INSERT INTO repositories (module_id, position, config) VALUES (?, ?, ?) '
+                    'ON CONFLICT (module_id) DO UPDATE SET position = excluded.position, config = excluded.config',
+                    (repo['module_id'], position, _dumps(repo)))
+            self._mark(TRACK_CONFIG_PATH, signature)
+
+    def _refresh_notifications(self) -> None:
+        signature = self._changed_signature(LAST_VERSIONS_PATH)
+        if signature is None:
+            return
+        with self.transaction():
+            data, _ = self._read(LAST_VERSIONS_PATH)
+            self.conn.execute('DELETE FROM notifications')
+            for module_id, record in (data if isinstance(data, dict) else {}).items():
+                # 旧格式直接存储 versionCode，导入时统一为字典
+                if not isinstance(record, dict):
+                    record = {'versionCode': record}
+                self._store_notification(module_id, record)
+            self._mark(LAST_VERSIONS_PATH, signature)
+
+    def refresh_modules(self) -> None:
+        """检查所有模块的 update.json，导入库外发生变化的文件"""
+        module_dirs = {p.name: p for p in MODULES_DIR.iterdir() if p.is_dir()} if MODULES_DIR.exists() else {}
+        with self.transaction():
+            for module_dir in module_dirs.values():
+                self._refresh_update(module_dir)
+            for (module_id,) in self.conn.execute('SELECT module_id FROM update_files').fetchall():
+                if module_id not in module_dirs:
+                    self._store_update(module_id, None, 2)
+
+    # 写入
+
+    def _store_update(self, module_id: str, update: Optional[Dict[str, Any]], indent: int) -> None:
+        self.conn.execute('DELETE FROM versions WHERE module_id = ?', (module_id,))
+        if update is None:
+            self.conn.execute('DELETE FROM update_files WHERE module_id = ?', (module_id,))
+            return
+        versions = update.get('versions') if isinstance(update.get('versions'), list) else []
+        # versions 的内容单独存表，这里只保留其余字段和 versions 键的位置
+        top = {key: (None if key == 'versions' else value) for key, value in update.items()}
+        self.conn.execute(
+            'INSERT INTO update_files (module_id, data, indent) VALUES (?, ?, ?) '
+            'ON CONFLICT (module_id) DO UPDATE SET data = excluded.data, indent = excluded.indent',
+            (module_id, _dumps(top), indent))
+        self.conn.executemany(
+            'INSERT INTO versions (module_id, position, version, version_code, zip_url, data) VALUES (?, ?, ?, ?, ?, ?)',
+            [(module_id, position, version.get('version'), _int_or_none(version.get('versionCode')),
+              version.get('zipUrl'), _dumps(version))
+             for position, version in enumerate(versions) if isinstance(version, dict)])
+        self._store_artifacts({
+            version['zipUrl']: (version.get('size') or 0, version.get('sha256'))
+            for version in versions
+            if isinstance(version, dict) and version.get('zipUrl') and version.get('sha256')
+        })
+
+    def _store_track(self, module_id: str, track: Optional[Dict[str, Any]]) -> None:
+        self.conn.execute(
+            'INSERT INTO repositories (module_id, track) VALUES (?, ?) '
+            'ON CONFLICT (module_id) DO UPDATE SET track = excluded.track',
+            (module_id, _dumps(track) if track is not None else None))
+
+    def _store_artifacts(self, artifacts: Dict[str, Tuple[int, Optional[str]]]) -> None:
+        self.conn.executemany(
+            'INSERT INTO artifacts (url, size, sha256) VALUES (?, ?, ?) '
+            'ON CONFLICT (url) DO UPDATE SET size = excluded.size, sha256 = COALESCE(excluded.sha256, sha256)',
+            [(url, int(size or 0), sha256) for url, (size, sha256) in artifacts.items()])
+
+    def _store_notification(self, module_id: str, record: Dict[str, Any]) -> None:
+        self.conn.execute(
+            'INSERT INTO notifications (module_id, version, version_code, data) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (module_id) DO UPDATE SET version = excluded.version, '
+            'version_code = excluded.version_code, data = excluded.data',
+            (module_id, record.get('version'), _int_or_none(record.get('versionCode')), _dumps(record)))
+
+    # 模块：update.json / track.json
+
+    def update_json(self, module_dir: Path) -> Optional[Dict[str, Any]]:
+        """返回模块的 update.json 内容，文件不存在时返回 None"""
+        module_dir = Path(module_dir)
+        with self._lock:
+            self._refresh_update(module_dir)
+            row = self.conn.execute('SELECT data FROM update_files WHERE module_id = ?', (module_dir.name,)).fetchone()
+            if row is None:
+                return None
+            update = json.loads(row[0])
+            versions = [json.loads(data) for (data,) in self.conn.execute(
+                'SELECT data FROM versions WHERE module_id = ? ORDER BY position', (module_dir.name,))]
+        if 'versions' in update:
+            update['versions'] = versions
+        return update
+
+    def latest_version_code(self, module_dir: Path) -> Optional[int]:
+        """模块 update.json 中最大的 versionCode"""
+        module_dir = Path(module_dir)
+        with self._lock:
+            self._refresh_update(module_dir)
+            row = self.conn.execute('SELECT MAX(version_code) FROM versions WHERE module_id = ?',
+                                    (module_dir.name,)).fetchone()
+        return row[0]
+
+    def put_update(self, module_dir: Path, update: Dict[str, Any], indent: Optional[int] = None) -> bool:
+        """保存并导出 update.json，返回文件是否发生变化；indent 默认沿用原文件"""
+        module_dir = Path(module_dir)
+        path = module_dir / 'update.json'
+        with self.transaction():
+            self._refresh_update(module_dir)
+            if indent is None:
+                row = self.conn.execute('SELECT indent FROM update_files WHERE module_id = ?',
+                                        (module_dir.name,)).fetchone()
+                indent = row[0] if row else 4
+            self._store_update(module_dir.name, update, indent)
+            changed = write_json(path, update, indent=indent)
+            self._mark(path)
+        return changed
+
+    def track(self, module_dir: Path) -> Optional[Dict[str, Any]]:
+        module_dir = Path(module_dir)
+        with self._lock:
+            self._refresh_track(module_dir)
+            row = self.conn.execute('SELECT track FROM repositories WHERE module_id = ?', (module_dir.name,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def put_track(self, module_dir: Path, track: Dict[str, Any], indent: int = 4) -> bool:
+        """保存并导出 track.json，返回文件是否发生变化"""
+        module_dir = Path(module_dir)
+        path = module_dir / 'track.json'
+        with self.transaction():
+            self._store_track(module_dir.name, track)
+            changed = write_json(path, track, indent=indent)
+            self._mark(path)
+        return changed
+
+    def repositories(self) -> List[Dict[str, Any]]:
+        """track_config.json 中的仓库配置，保持原有顺序"""
+        with self._lock:
+            self._refresh_config()
+            rows = self.conn.execute('SELECT config FROM repositories WHERE config IS NOT NULL ORDER BY position')
+            return [json.loads(config) for (config,) in rows]
+
+    # zip 文件
+
+    def artifact(self, url: str) -> Optional[Tuple[int, Optional[str]]]:
+        with self._lock:
+            row = self.conn.execute('SELECT size, sha256 FROM artifacts WHERE url = ?', (url,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def put_artifacts(self, artifacts: Dict[str, Tuple[int, Optional[str]]]) -> None:
+        """记录 {url: (size, sha256)}；已有 sha256 的记录不会被空值覆盖"""
+        with self.transaction():
+            self._store_artifacts(artifacts)
+
+    # 通知记录：json/last_versions.json
+
+    def notified(self) -> Dict[str, Dict[str, Any]]:
+        """每个模块最后一次通知的记录（last_versions.json 的内容）"""
+        with self._lock:
+            self._refresh_notifications()
+            rows = self.conn.execute('SELECT module_id, data FROM notifications ORDER BY rowid').fetchall()
+        return {module_id: json.loads(data) for module_id, data in rows}
+
+    def notified_version_code(self, module_id: str) -> Optional[int]:
+        with self._lock:
+            self._refresh_notifications()
+            row = self.conn.execute('SELECT version_code FROM notifications WHERE module_id = ?', (module_id,)).fetchone()
+        return row[0] if row else None
+
+    def record_notification(self, module_id: str, version: str, version_code: int, **fields: Any) -> None:
+        """记录已通知的版本；已有记录只更新版本字段，新记录带上 fields（名称、作者等）"""
+        with self.transaction():
+            self._refresh_notifications()
+            row = self.conn.execute('SELECT data FROM notifications WHERE module_id = ?', (module_id,)).fetchone()
+            record = json.loads(row[0]) if row else {'version': None, 'versionCode': None, **fields}
+            record['version'] = version
+            record['versionCode'] = version_code
+            self._store_notification(module_id, record)
+
+    def export_notifications(self) -> bool:
+        """导出 last_versions.json，返回文件是否发生变化"""
+        with self.transaction():
+            changed = write_json(LAST_VERSIONS_PATH, self.notified(), indent=2, ensure_ascii=False)
+            self._mark(LAST_VERSIONS_PATH)
+        return changed
+
+    def updated_since_notified(self) -> List[Tuple[str, int, int]]:
+        """
+        update.json 中最新 versionCode 大于最后通知版本的模块，返回 [(模块 ID, 最新, 已通知)]
+
+        只包含有通知记录的模块；按 (module_id, version_code) 索引查询，不需要加载全部文件。
+        """
+        with self._lock:
+            self.refresh_modules()
+            self._refresh_notifications()
+            return [tuple(row) for row in self.conn.execute(
+                'SELECT n.module_id, MAX(v.version_code), n.version_code '
+                'FROM notifications n JOIN versions v ON v.module_id = n.module_id '
+                'WHERE n.version_code IS NOT NULL '
+                'GROUP BY n.module_id HAVING MAX(v.version_code) > n.version_code '
+                'ORDER BY n.module_id')]
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def _close_default_store() -> None:
+    if _default_store is not None:
+        _default_store.close()
+
+
+def get_state_store() -> StateStore:
+    """返回进程内共享的状态存储，进程退出时关闭连接"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = StateStore()
+            atexit.register(_close_default_store)
+        return _default_store
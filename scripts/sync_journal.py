@@ -0,0 +1,164 @@
+"""
+同步事件日志（JSONL）
+
+build_index.py 写入 modules.json 后，为每个新增或升级的模块向缓存目录（不提交、不发布）下的
+journal/sync_events.jsonl 追加一行事件，每条事件带单调递增的序号 seq：
+
+    {"seq": 12, "ts": 1735689600.0, "type": "update", "id": "...", "version": "...",
+     "versionCode": 123, "previousVersionCode": 122}
+
+读取方保存检查点 {offset, seq}，下次只从 offset 开始读取新追加的行，
+开销与新事件数成正比，与日志总长度无关。已读取的部分超过 COMPACT_BYTES 后，
+由读取方调用 compact_journal() 截掉，日志不会无限增长。
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+from http_cache import CACHE_ROOT
+from json_writer import write_bytes_atomic, write_json
+
+JOURNAL_DIR = CACHE_ROOT / 'journal'
+JOURNAL_PATH = JOURNAL_DIR / 'sync_events.jsonl'
+# 读取最后一条事件时每次向前读取的字节数
+TAIL_CHUNK = 4096
+# 检查点之前已读取的部分超过该大小时截掉
+COMPACT_BYTES = int(os.environ.get('MMRL_JOURNAL_COMPACT_BYTES', 1024 * 1024))
+
+
+def _last_event(f: BinaryIO, end: int) -> Tuple[int, bytes]:
+    """返回偏移 end 之前最后一条完整事件的 (序号, 原始行)，没有时返回 (0, b'')"""
+    position = end
+    while position > 0:
+        position = max(position - TAIL_CHUNK, 0)
+        f.seek(position)
+        data = f.read(end - position)
+        lines = data.split(b'\n')
+        # 最后一段没有换行符，是未写完的行；第一段可能被截断，读到文件开头前不使用
+        complete = lines[:-1] if position == 0 else lines[1:-1]
+        for line in reversed(complete):
+            try:
+                return int(json.loads(line)['seq']), line + b'\n'
+            except (ValueError, KeyError, TypeError):
+                continue
+    return 0, b''
+
+
+def last_seq(path: Path = JOURNAL_PATH) -> int:
+    """返回日志中最后一条完整事件的序号，日志不存在或为空时返回 0"""
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return 0
+    with f:
+        return _last_event(f, f.seek(0, os.SEEK_END))[0]
+
+
+def append_events(events: List[Dict[str, Any]], path: Path = JOURNAL_PATH) -> List[Dict[str, Any]]:
+    """追加事件并分配序号，返回写入的事件"""
+    if not events:
+        return []
+    seq = last_seq(path)
+    now = round(time.time(), 3)
+    records = [dict({'seq': seq + i, 'ts': now}, **event) for i, event in enumerate(events, 1)]
+    data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode('utf-8')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'ab') as f:
+        if f.tell() > 0:
+            # 上次写入中断留下的半行单独成行，读取时会被跳过
+            with open(path, 'rb') as tail:
+                tail.seek(-1, os.SEEK_END)
+                if tail.read(1) != b'\n':
+                    data = b'\n' + data
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return records
+
+
+def version_event(entry: Optional[Dict[str, Any]], previous: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """模块条目对应的事件：新模块为 added，versionCode 增大为 update，其余变化不记录"""
+    if not entry:
+        return None
+    event = {'id': entry['id'], 'version': entry.get('version'), 'versionCode': entry.get('versionCode')}
+    if previous is None:
+        return dict({'type': 'added'}, **event)
+    old_code, new_code = previous.get('versionCode'), event['versionCode']
+    if isinstance(old_code, int) and isinstance(new_code, int) and new_code > old_code:
+        return dict({'type': 'update'}, **event, previousVersionCode=old_code)
+    return None
+
+
+def load_checkpoint(path: Path) -> Dict[str, int]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return {'offset': int(data.get('offset', 0)), 'seq': int(data.get('seq', 0))}
+    except (OSError, ValueError, TypeError, AttributeError):
+        return {'offset': 0, 'seq': 0}
+
+
+def save_checkpoint(path: Path, checkpoint: Dict[str, int]) -> None:
+    write_json(path, checkpoint)
+
+
+def read_events(checkpoint: Dict[str, int], path: Path = JOURNAL_PATH) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    读取检查点之后追加的事件，返回 (事件列表, 新检查点)
+
+    未写完（没有换行符）的最后一行留到下次读取；日志比检查点记录的偏移还短时从头读取，
+    最后的序号也小于检查点时说明日志被重建过，序号同样从头计算。
+    """
+    offset, seq = checkpoint.get('offset', 0), checkpoint.get('seq', 0)
+    try:
+        size = path.stat().st_size
+    except FileNotFoundError:
+        return [], {'offset': offset, 'seq': seq}
+    if offset > size:
+        offset = 0
+        if last_seq(path) < seq:
+            seq = 0
+    events = []
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            offset += len(line)
+            try:
+                event = json.loads(line)
+                event_seq = int(event['seq'])
+            except (ValueError, KeyError, TypeError):
+                continue
+            if event_seq > seq:
+                events.append(event)
+                seq = event_seq
+    return events, {'offset': offset, 'seq': seq}
+
+
+def compact_journal(checkpoint_path: Path, checkpoint: Dict[str, int], path: Path = JOURNAL_PATH,
+                    threshold: int = COMPACT_BYTES) -> Dict[str, int]:
+    """
+    截掉检查点之前已读取的事件，返回新的检查点
+
+    保留最后一条已读取的事件，last_seq() 在截断后仍能接着分配序号。先把检查点的偏移
+    改为 0（按 seq 去重，从头读取总是正确的），再替换日志、写入新的偏移，任一步中断都不会漏读事件。
+    """
+    offset, seq = checkpoint.get('offset', 0), checkpoint.get('seq', 0)
+    if offset < threshold:
+        return checkpoint
+    try:
+        with open(path, 'rb') as f:
+            _, last_line = _last_event(f, offset)
+            f.seek(offset)
+            remainder = f.read()
+    except FileNotFoundError:
+        return checkpoint
+    save_checkpoint(checkpoint_path, {'offset': 0, 'seq': seq})
+    write_bytes_atomic(path, last_line + remainder)
+    compacted = {'offset': len(last_line), 'seq': seq}
+    save_checkpoint(checkpoint_path, compacted)
+    return compacted
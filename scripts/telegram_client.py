@@ -0,0 +1,408 @@
+"""
+异步 Telegram Bot API 客户端与持久化发送队列
+
+- 所有请求在同一个事件循环中发送并复用连接：安装了 aiohttp 时使用一个
+  aiohttp.ClientSession，否则在线程池中使用共享的 requests 会话
+- 按 Telegram 的限制控制发送节奏：同一聊天约每秒 1 条、群组每分钟 20 条、全局每秒 30 条
+- 429 响应按 parameters.retry_after 等待后重发，同一聊天的后续消息一起推迟；网络错误只在
+  请求确定没有发出（连接失败）时重发，请求发出后的超时或断开可能已经送达，不再重发以免重复
+- Outbox 把待发送的通知保存在缓存目录（不发布）的 telegram/outbox.json，本次未发出的通知下次运行时
+  继续发送；队列中不保存 chat_id 和话题 ID，由发送方在发送时根据环境变量补上
+"""
+
+import asyncio
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import requests
+import urllib3
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from http_cache import CACHE_ROOT
+from http_client import DEFAULT_TIMEOUT, get_session
+from json_writer import write_json
+from tracing import annotate
+
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')
+REPO_ROOT = Path(__file__).resolve().parent.parent
+OUTBOX_PATH = CACHE_ROOT / 'telegram' / 'outbox.json'
+FILE_ID_CACHE_PATH = CACHE_ROOT / 'telegram' / 'file_ids.json'
+
+# 同一聊天两条消息之间的最小间隔（秒）
+CHAT_INTERVAL = float(os.environ.get('TELEGRAM_CHAT_INTERVAL', 1.0))
+# 群组每分钟、所有聊天每秒的消息上限
+GROUP_PER_MINUTE = int(os.environ.get('TELEGRAM_GROUP_PER_MINUTE', 20))
+GLOBAL_PER_SECOND = int(os.environ.get('TELEGRAM_GLOBAL_PER_SECOND', 30))
+# 单次运行中每条消息的重试次数，以及跨运行保留在队列中的最多运行次数
+SEND_RETRIES = int(os.environ.get('TELEGRAM_SEND_RETRIES', 4))
+MAX_OUTBOX_ATTEMPTS = int(os.environ.get('TELEGRAM_OUTBOX_ATTEMPTS', 5))
+# 由发送方在发送时补上、不保存到发送队列中的字段
+DESTINATION_FIELDS = ('chat_id', 'message_thread_id')
+# 单次等待 retry_after 的上限（秒），超过则留到下次运行
+MAX_RETRY_AFTER = int(os.environ.get('TELEGRAM_MAX_RETRY_AFTER', 120))
+
+
+class TelegramError(Exception):
+    def __init__(self, method: str, status: int, description: str, retry_after: Optional[int] = None,
+                 maybe_sent: bool = False):
+        super().__init__(f'{method} failed with HTTP {status}: {description}')
+        self.method = method
+        self.status = status
+        self.description = description
+        self.retry_after = retry_after
+        # 网络错误发生在请求发出之后（读取响应超时、连接中断），消息可能已经送达
+        self.maybe_sent = maybe_sent
+
+    @property
+    def retryable(self) -> bool:
+        """限流、服务器错误和请求发出前的网络错误可以重试，400/403 等请求错误重试也不会成功"""
+        return self.status == 429 or self.status >= 500 or (self.status == 0 and not self.maybe_sent)
+
+
+def request_not_sent(error: Exception) -> bool:
+    """网络错误发生在建立连接阶段，请求确定没有发出，重试不会产生重复消息"""
+    if aiohttp is not None and isinstance(error, aiohttp.ClientConnectorError):
+        return True
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        # requests 把 urllib3 的 MaxRetryError 包装为 ConnectionError，reason 为最后一次失败的原因
+        return isinstance(getattr(error.args[0], 'reason', None), urllib3.exceptions.NewConnectionError)
+    return False
+
+
+class SendPacer:
+    """按聊天和全局限制安排发送时间，所有发送都先 await wait(chat_id)"""
+
+    def __init__(self, chat_interval: float = CHAT_INTERVAL, group_per_minute: int = GROUP_PER_MINUTE,
+                 global_per_second: int = GLOBAL_PER_SECOND):
+        self.chat_interval = chat_interval
+        self.group_per_minute = group_per_minute
+        self.global_per_second = global_per_second
+        self._next_allowed: Dict[str, float] = defaultdict(float)
+        self._chat_window: Dict[str, deque] = defaultdict(deque)
+        self._global_window: deque = deque()
+        self._lock = asyncio.Lock()
+        self.waited = 0.0
+
+    @staticmethod
+    def _window_delay(window: deque, limit: int, period: float, now: float) -> float:
+        while window and now - window[0] >= period:
+            window.popleft()
+        return window[0] + period - now if len(window) >= limit else 0.0
+
+    async def wait(self, chat_id: str) -> None:
+        # 只在锁内计算等待时间和占用发送名额，等待时不持有锁，其他聊天的发送不会被阻塞
+        while True:
+            async with self._lock:
+                now = time.monotonic()
+                delay = max(
+                    self._next_allowed[chat_id] - now,
+                    self._window_delay(self._global_window, self.global_per_second, 1.0, now),
+                    # 群组和频道的 chat_id 为负数
+                    self._window_delay(self._chat_window[chat_id], self.group_per_minute, 60.0, now)
+                    if str(chat_id).startswith('-') else 0.0,
+                )
+                if delay <= 0:
+                    self._next_allowed[chat_id] = now + self.chat_interval
+                    self._chat_window[chat_id].append(now)
+                    self._global_window.append(now)
+                    return
+                self.waited += delay
+            await asyncio.sleep(delay)
+
+    def penalize(self, chat_id: str, seconds: float) -> None:
+        """收到 retry_after 后推迟该聊天的所有发送"""
+        self._next_allowed[chat_id] = max(self._next_allowed[chat_id], time.monotonic() + seconds)
+
+
+class TelegramClient:
+    """
+    async with TelegramClient(token) as client:
+        await client.call('sendMessage', {...})
+    """
+
+    def __init__(self, token: str, pacer: Optional[SendPacer] = None, retries: int = SEND_RETRIES):
+        self.token = token
+        self.pacer = pacer or SendPacer()
+        self.retries = retries
+        self.stats = {'sent': 0, 'retries': 0, 'rate_limited': 0, 'failed': 0}
+        self._session = None
+
+    async def __aenter__(self) -> 'TelegramClient':
+        if aiohttp is not None:
+            timeout = aiohttp.ClientTimeout(connect=DEFAULT_TIMEOUT[0], sock_read=DEFAULT_TIMEOUT[1])
+            self._session = aiohttp.ClientSession(timeout=timeout)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _url(self, method: str) -> str:
+        return f'{TELEGRAM_API_URL}/bot{self.token}/{method}'
+
+    async def _post(self, method: str, data: Dict[str, Any],
+                    files: Optional[Dict[str, Tuple[str, bytes, str]]]) -> Tuple[int, Dict]:
+        if self._session is not None:
+            if files:
+                form = aiohttp.FormData()
+                for key, value in data.items():
+                    form.add_field(key, str(value))
+                for key, (filename, content, content_type) in files.items():
+                    form.add_field(key, content, filename=filename, content_type=content_type)
+                body = {'data': form}
+            else:
+                body = {'data': data}
+            async with self._session.post(self._url(method), **body) as response:
+                try:
+                    payload = await response.json(content_type=None)
+                except ValueError:
+                    payload = {}
+                return response.status, payload or {}
+
+        # 没有 aiohttp 时在线程中使用共享的 requests 会话，事件循环本身不被阻塞
+        def post():
+            response = get_session().post(self._url(method), data=data, files=files)
+            try:
+                return response.status_code, response.json()
+            except ValueError:
+                return response.status_code, {}
+
+        return await asyncio.get_running_loop().run_in_executor(None, post)
+
+    async def call(self, method: str, data: Dict[str, Any],
+                   files: Optional[Dict[str, Tuple[str, bytes, str]]] = None) -> Dict:
+        """调用 Bot API 方法，返回 result；失败时抛出 TelegramError"""
+        chat_id = str(data.get('chat_id', ''))
+        error = None
+        for attempt in range(self.retries + 1):
+            await self.pacer.wait(chat_id)
+            maybe_sent = False
+            try:
+                status, payload = await self._post(method, data, files)
+            except Exception as e:
+                status, payload = 0, {'description': str(e)}
+                maybe_sent = not request_not_sent(e)
+            annotate(status=status, attempts=attempt + 1)
+            if status == 200 and payload.get('ok'):
+                self.stats['sent'] += 1
+                return payload.get('result') or {}
+
+            retry_after = (payload.get('parameters') or {}).get('retry_after')
+            error = TelegramError(method, status, payload.get('description', ''), retry_after, maybe_sent)
+            if not error.retryable or attempt == self.retries:
+                break
+            if retry_after is not None:
+                self.stats['rate_limited'] += 1
+                if retry_after > MAX_RETRY_AFTER:
+                    break
+                print(f"Telegram rate limit hit, retrying {method} after {retry_after}s")
+                self.pacer.penalize(chat_id, retry_after)
+            else:
+                await asyncio.sleep(min(2 ** attempt, 30))
+            self.stats['retries'] += 1
+        self.stats['failed'] += 1
+        raise error
+
+    def report(self) -> str:
+        return ('Telegram: {sent} sent, {retries} retries, {rate_limited} rate limited, '
+                '{failed} failed').format(**self.stats) + f', paced {self.pacer.waited:.1f}s'
+
+
+def is_file_id_error(error: TelegramError) -> bool:
+    """Telegram 不再接受缓存的 file_id（文件标识无效或过期）"""
+    description = error.description.lower()
+    return error.status == 400 and ('file' in description or 'wrong type of the web page content' in description)
+
+
+def largest_photo_id(message: Dict[str, Any]) -> Optional[str]:
+    """sendPhoto / sendMediaGroup 返回的消息中分辨率最高的图片 file_id"""
+    sizes = message.get('photo') or []
+    return sizes[-1].get('file_id') if sizes else None
+
+
+class FileIdCache:
+    """
+    已上传图片的 Telegram file_id 缓存
+
+    以图片 URL 和内容 sha256 为键：内容不变时直接用 file_id 发送，不再上传；
+    封面内容变化后哈希不同，旧的 file_id 自然失效。
+    """
+
+    def __init__(self, path: Path = FILE_ID_CACHE_PATH):
+        self.path = Path(path)
+        self.stats = {'hits': 0, 'uploads': 0, 'rejected': 0}
+        self._lock = threading.Lock()
+        self._dirty = False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._entries: Dict[str, Dict[str, Any]] = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def get(self, url: str, sha256: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry and entry.get('sha256') == sha256:
+                self.stats['hits'] += 1
+                return entry.get('file_id')
+            return None
+
+    def put(self, url: str, sha256: str, file_id: Optional[str]) -> None:
+        if not file_id:
+            return
+        with self._lock:
+            self._entries[url] = {'sha256': sha256, 'file_id': file_id, 'updated_at': time.time()}
+            self.stats['uploads'] += 1
+            self._dirty = True
+
+    def invalidate(self, url: str) -> None:
+        with self._lock:
+            if self._entries.pop(url, None) is not None:
+                self.stats['rejected'] += 1
+                self._dirty = True
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = dict(self._entries)
+            self._dirty = False
+        write_json(self.path, entries, indent=2, sort_keys=True)
+
+    def report(self) -> str:
+        return ('Telegram file_id cache: {hits} hits, {uploads} uploads, '
+                '{rejected} rejected').format(**self.stats)
+
+
+_file_id_cache = None
+_file_id_cache_lock = threading.Lock()
+
+
+def _save_file_id_cache() -> None:
+    if _file_id_cache is not None:
+        _file_id_cache.save()
+        print(_file_id_cache.report())
+
+
+def get_file_id_cache() -> FileIdCache:
+    """返回进程内共享的 file_id 缓存，进程退出时自动保存"""
+    global _file_id_cache
+    with _file_id_cache_lock:
+        if _file_id_cache is None:
+            _file_id_cache = FileIdCache()
+            atexit.register(_save_file_id_cache)
+        return _file_id_cache
+
+
+def strip_destination(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """去掉发送目标字段，chat_id 属于机密配置，不写入磁盘"""
+    return {key: value for key, value in payload.items() if key not in DESTINATION_FIELDS}
+
+
+class Outbox:
+    """
+    持久化的待发送通知队列
+
+    每条通知在写入 last_versions.json 之前先进入队列，发送成功后才从队列移除；
+    进程中断或发送失败的通知会在下次运行时重发，超过 MAX_OUTBOX_ATTEMPTS 次后丢弃。
+    """
+
+    def __init__(self, path: Path = OUTBOX_PATH):
+        self.path = Path(path)
+        self.entries: List[Dict[str, Any]] = self._load()
+
+    def _load(self) -> List[Dict[str, Any]]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return []
+        if not isinstance(data, list):
+            return []
+        for entry in data:
+            entry['payload'] = strip_destination(entry.get('payload') or {})
+        return data
+
+    def save(self) -> None:
+        if not self.entries and not self.path.exists():
+            return
+        write_json(self.path, self.entries, indent=2, ensure_ascii=False)
+
+    def add(self, key: str, method: str, payload: Dict[str, Any], photo_url: Optional[str] = None,
+            summary: Optional[Dict[str, Any]] = None) -> None:
+        """
+        加入一条通知；同一 key（模块和版本）的旧通知被替换，已失败的次数保留
+
+        summary 保存生成汇总消息和记录已通知版本所需的模块摘要（名称、版本、作者、链接等）。
+        """
+        attempts = max((entry.get('attempts', 0) for entry in self.entries if entry.get('key') == key), default=0)
+        self.entries = [entry for entry in self.entries if entry.get('key') != key]
+        self.entries.append({
+            'id': uuid.uuid4().hex,
+            'key': key,
+            'method': method,
+            'payload': strip_destination(payload),
+            'photo_url': photo_url,
+            'summary': summary,
+            'attempts': attempts,
+            'created_at': time.time(),
+        })
+
+    def mark_failed(self, entry: Dict[str, Any], error: Exception) -> None:
+        """
+        记录一次失败，超过 MAX_OUTBOX_ATTEMPTS 次后从队列丢弃
+
+        请求发出后才出错的通知可能已经送达，直接丢弃：宁可漏发一条，也不重复发送。
+        """
+        entry['attempts'] = entry.get('attempts', 0) + 1
+        entry['last_error'] = str(error)
+        if getattr(error, 'maybe_sent', False):
+            print(f"Dropping notification {entry['key']}, it may already have been delivered: {error}")
+            self.remove(entry['id'])
+        elif entry['attempts'] >= MAX_OUTBOX_ATTEMPTS:
+            print(f"Dropping notification {entry['key']} after {entry['attempts']} attempts: {error}")
+            self.remove(entry['id'])
+        else:
+            print(f"Notification {entry['key']} failed, will retry next run: {error}")
+
+    def remove(self, entry_id: str) -> None:
+        self.entries = [entry for entry in self.entries if entry['id'] != entry_id]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+async def deliver_outbox(outbox: Outbox, client: TelegramClient,
+                         send_entry: Callable[[TelegramClient, Dict[str, Any]], Awaitable[None]]) -> Tuple[int, int]:
+    """
+    发送队列中的所有通知，返回 (成功数, 失败数)
+
+    队列不记录发送目标，所有通知由 send_entry 发往同一聊天，按入队顺序逐条发送；
+    每条成功后立即保存队列，进程中断时不会重复发送已送达的通知。
+    """
+    delivered = failed = 0
+    for entry in list(outbox.entries):
+        try:
+            await send_entry(client, entry)
+        except Exception as e:
+            failed += 1
+            outbox.mark_failed(entry, e)
+        else:
+            delivered += 1
+            outbox.remove(entry['id'])
+        outbox.save()
+    return delivered, failed
@@ -0,0 +1,283 @@
+"""
+更新日志 Markdown 到 Telegram HTML 的转换
+
+只支持 Telegram 能解析的子集：粗体、斜体、行内代码、代码块、链接，标题转为粗体，
+列表项转为 •。转换逐行、逐个标记处理，耗时与输入长度成线性关系。
+"""
+
+import re
+from html import escape as _escape
+from typing import Dict, List, Optional, Tuple
+
+NO_CHANGELOG = "暂无更新日志"
+# 通知中更新日志的最大长度
+CHANGELOG_LIMIT = 1500
+# 转换或截断逻辑变化时递增，使预渲染的缓存失效
+RENDER_VERSION = 2
+
+FENCE_RE = re.compile(r'```[\w+-]*$')
+HEADING_RE = re.compile(r'#{1,6}\s+(.*)$')
+LIST_RE = re.compile(r'(\s*)(?:\d+\.|[-*+])\s+')
+INLINE_RE = re.compile(r'\*\*\*|\*\*|__|\]\(|[*_`\[\]]')
+HTML_TOKEN_RE = re.compile(r'<[^>]*>|&[#\w]+;|[^<&]+|&')
+TAG_NAME_RE = re.compile(r'<(\w+)')
+SPACE_RE = re.compile(r'\s')
+NON_SPACE_RE = re.compile(r'\S')
+# 强调标记长度对应的标签：*斜体*、**粗体**、***粗斜体***
+EMPHASIS_TAGS = {1: ('<i>', '</i>'), 2: ('<b>', '</b>'), 3: ('<b><i>', '</i></b>')}
+
+
+def escape(text: str, quote: bool = False) -> str:
+    return _escape(text, quote=quote)
+
+
+class _InlineRenderer:
+    """
+    单行内联格式的转换
+
+    标记按出现顺序入栈，遇到同类标记时闭合；闭合时其上方未闭合的标记原样保留为文本。
+    每个标记最多入栈、出栈一次；查找 `)`、反引号以及链接地址中的空白时记住上次找到的位置
+    （或已确认不存在），各类查找的起点只会前进，每个字符最多被每类查找扫描一次，不存在回溯。
+    """
+
+    def __init__(self, line: str):
+        self.line = line
+        self.out: List[str] = []
+        # 栈元素为 [标记, 在 out 中的位置]
+        self.stack: List[List] = []
+        self.open_counts: Dict[str, int] = {}
+        # 仍可闭合为链接的 [ ，链接闭合后更早的 [ 不再生效（Telegram 不允许嵌套链接）
+        self.links: List[List] = []
+        # 各类查找上次的 (起点, 结果)，结果为 -1 表示起点之后不再出现
+        self.next_index: Dict[str, Tuple[int, int]] = {}
+
+    def _text(self, text: str) -> None:
+        if text:
+            self.out.append(escape(text))
+
+    def _push(self, kind: str, text: str) -> List:
+        element = [kind, len(self.out)]
+        self.stack.append(element)
+        self.open_counts[kind] = self.open_counts.get(kind, 0) + 1
+        self.out.append(escape(text))
+        return element
+
+    def _close(self, kind: str) -> int:
+        """弹出直到 kind 的开标记，返回其在 out 中的位置；上方的标记保留为原文"""
+        while True:
+            top, index = self.stack.pop()
+            self.open_counts[top] -= 1
+            if top == '[':
+                self.links.pop()
+            if top == kind:
+                return index
+
+    def _find(self, key: str, start: int, pattern: Optional[re.Pattern] = None) -> int:
+        """
+        返回 start 之后第一个 key 字符（或 pattern 匹配）的位置，不存在时返回 -1
+
+        同一 key 的起点单调递增：上次的起点不晚于 start、结果不早于 start 时直接复用。
+        """
+        cached = self.next_index.get(key)
+        if cached is not None and cached[0] <= start and (cached[1] == -1 or cached[1] >= start):
+            return cached[1]
+        if pattern is None:
+            index = self.line.find(key, start)
+        else:
+            match = pattern.search(self.line, start)
+            index = match.start() if match else -1
+        self.next_index[key] = (start, index)
+        return index
+
+    def _link_url(self, start: int, close: int) -> str:
+        """line[start:close] 去掉首尾空白后不含空白时返回该地址，否则返回空字符串"""
+        begin = self._find('url', start, NON_SPACE_RE)
+        if begin == -1 or begin >= close:
+            return ''
+        space = self._find('space', begin, SPACE_RE)
+        if space != -1 and space < close:
+            # 地址后只允许空白
+            if self._find('tail', space, NON_SPACE_RE) < close:
+                return ''
+            return self.line[begin:space]
+        return self.line[begin:close]
+
+    def render(self) -> str:
+        line = self.line
+        pos = 0
+        while True:
+            match = INLINE_RE.search(line, pos)
+            if match is None:
+                self._text(line[pos:])
+                break
+            self._text(line[pos:match.start()])
+            token, pos = match.group(), match.end()
+            if token == '`':
+                close = self._find('`', pos)
+                if close == -1:
+                    self.out.append(token)
+                else:
+                    self.out.append(f"<code>{escape(line[pos:close])}</code>")
+                    pos = close + 1
+            elif token == '[':
+                self.links.append(self._push('[', token))
+            elif token == '](':
+                close = self._find(')', pos) if self.open_counts.get('[') else -1
+                url = self._link_url(pos, close) if close != -1 else ''
+                if url:
+                    index = self._close('[')
+                    self.out[index] = f'<a href="{escape(url, quote=True)}">'
+                    self.out.append('</a>')
+                    pos = close + 1
+                    for element in self.links:
+                        element[0] = 'dead'
+                    self.open_counts['dead'] = self.open_counts.get('dead', 0) + len(self.links)
+                    self.open_counts['['] = 0
+                    self.links.clear()
+                else:
+                    self.out.append(escape(token))
+            elif token == ']':
+                self.out.append(token)
+            else:
+                self._emphasis(token, match.start(), pos)
+        return ''.join(self.out)
+
+    def _emphasis(self, token: str, start: int, end: int) -> None:
+        line = self.line
+        before = line[start - 1] if start > 0 else ' '
+        after = line[end] if end < len(line) else ' '
+        if token[0] == '_' and (before.isalnum() and after.isalnum()):
+            # 单词内部的下划线（如 snake_case）不是强调标记
+            self.out.append(token)
+            return
+        if self.open_counts.get(token) and not before.isspace():
+            index = self._close(token)
+            opening, closing = EMPHASIS_TAGS[len(token)]
+            if index == len(self.out) - 1:
+                # 空的强调（如 ****）保留原文
+                self.out.append(token)
+                return
+            self.out[index] = opening
+            self.out.append(closing)
+        elif not after.isspace() and not (token[0] == '_' and before.isalnum()):
+            self._push(token, token)
+        else:
+            self.out.append(token)
+
+
+def render_inline(line: str) -> str:
+    """转换一行中的粗体、斜体、行内代码和链接，其余文本转义"""
+    return _InlineRenderer(line).render()
+
+
+def pre_block(code_lines: List[str]) -> str:
+    code = '\n'.join(code_lines).strip()
+    return f"<pre>{escape(code)}</pre>"
+
+
+def convert_markdown_to_html(markdown_text: str) -> str:
+    """
+    将Markdown格式转换为Telegram支持的HTML格式
+    支持：粗体，斜体，代码块，链接，列表等
+
+    逐行处理一遍：代码块原样转义放入 <pre>，标题转为单独成段的粗体，
+    列表项统一为 •，连续空行合并为一个，普通文本中的 < > & 全部转义。
+    """
+    if not markdown_text or markdown_text == NO_CHANGELOG:
+        return f"<i>{NO_CHANGELOG}</i>"
+
+    lines: List[str] = []
+    code: Optional[List[str]] = None
+
+    def blank() -> None:
+        if lines and lines[-1]:
+            lines.append('')
+
+    for line in markdown_text.split('\n'):
+        line = line.rstrip('\r')
+        if code is not None:
+            if line.strip() == '```':
+                lines.append(pre_block(code))
+                code = None
+            else:
+                code.append(line)
+            continue
+        stripped = line.strip()
+        if FENCE_RE.match(stripped):
+            code = []
+            continue
+        if not stripped:
+            blank()
+            continue
+        heading = HEADING_RE.match(line)
+        if heading:
+            blank()
+            lines.append(f"<b>{render_inline(heading.group(1).strip())}</b>")
+            lines.append('')
+            continue
+        item = LIST_RE.match(line)
+        if item:
+            lines.append(f"{item.group(1)}• {render_inline(line[item.end():])}")
+            continue
+        lines.append(render_inline(line))
+
+    if code is not None:
+        # 未闭合的代码块一直延续到结尾
+        lines.append(pre_block(code))
+    while lines and not lines[-1]:
+        lines.pop()
+    return '\n'.join(lines)
+
+
+def truncate_html(html_text: str, limit: int, ellipsis: str = '...') -> str:
+    """
+    把 convert_markdown_to_html 的输出截断到 limit 个字符以内
+
+    不会截断在标签或字符实体中间，截断处仍未闭合的标签会补上闭合标签。
+    """
+    if len(html_text) <= limit:
+        return html_text
+    out: List[str] = []
+    size = 0
+    # 已打开标签的名称，以及补齐这些闭合标签需要的长度
+    open_tags: List[str] = []
+    closing = 0
+    budget = limit - len(ellipsis)
+    for match in HTML_TOKEN_RE.finditer(html_text):
+        token = match.group()
+        if token.startswith('</'):
+            out.append(token)
+            size += len(token)
+            if open_tags:
+                closing -= len(token)
+                open_tags.pop()
+        elif token.startswith('<'):
+            name = TAG_NAME_RE.match(token).group(1)
+            if size + len(token) + closing + len(name) + 3 > budget:
+                break
+            out.append(token)
+            size += len(token)
+            open_tags.append(name)
+            closing += len(name) + 3
+        elif token.startswith('&'):
+            if size + len(token) + closing > budget:
+                break
+            out.append(token)
+            size += len(token)
+        else:
+            room = budget - closing - size
+            if len(token) > room:
+                out.append(token[:max(room, 0)])
+                break
+            out.append(token)
+            size += len(token)
+    out.append(ellipsis)
+    out.extend(f"</{name}>" for name in reversed(open_tags))
+    return ''.join(out)
+
+
+def render_changelog(markdown_text: str, limit: int = CHANGELOG_LIMIT) -> str:
+    """转换为 Telegram HTML 并截断到 limit 个字符"""
+    if not markdown_text or markdown_text == NO_CHANGELOG:
+        return NO_CHANGELOG
+    return truncate_html(convert_markdown_to_html(markdown_text), limit)
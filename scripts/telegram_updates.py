@@ -1,21 +1,45 @@
-import requests
 import json
-import io
 import asyncio
+import hashlib
+import html
 import os
 import sys
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 import re
 
+from changelog_store import ChangelogStore
+from http_cache import METADATA_TTL, cached_get
+from json_writer import report as write_report, write_json
+from state_store import get_state_store
+from sync_journal import JOURNAL_DIR, compact_journal, load_checkpoint, read_events, save_checkpoint
+from telegram_client import (Outbox, TelegramClient, TelegramError, deliver_outbox, get_file_id_cache,
+                             is_file_id_error, largest_photo_id)
+from telegram_html import NO_CHANGELOG, render_changelog
+from tracing import span
+
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
 TELEGRAM_TOPIC_ID = os.getenv('TELEGRAM_TOPIC_ID')
 UPDATED_MODULES_ENV = os.getenv('UPDATED_MODULES')
 PREVIOUS_MODULES_DIR = os.getenv('PREVIOUS_MODULES_DIR')
+# 汇总模式：待发送通知数达到 TELEGRAM_DIGEST_MIN 时合并为相册和汇总消息
+TELEGRAM_DIGEST = os.getenv('TELEGRAM_DIGEST', '').lower() in ('1', 'true', 'yes')
+TELEGRAM_DIGEST_MIN = int(os.getenv('TELEGRAM_DIGEST_MIN', 3))
+
+REPO_URL = 'https://misak10.github.io/mmrl-repo/'
+# Telegram 消息正文和图片说明的长度上限
+MESSAGE_LIMIT = 4096
+CAPTION_LIMIT = 1024
+# 相册最多 10 张图片，每条汇总消息对应一个相册
+DIGEST_MAX_MODULES = 10
+DIGEST_CHANGELOG_CHARS = 200
+DIGEST_BUTTONS_PER_ROW = 2
 
 SCRIPT_DIR = Path(os.path.dirname(os.path.abspath(__file__)))
 REPO_ROOT = SCRIPT_DIR.parent
+# 已处理到的同步事件日志位置
+JOURNAL_CHECKPOINT_PATH = JOURNAL_DIR / 'telegram_checkpoint.json'
 
 def get_json_path(filename: str) -> Path:
     """获取JSON文件的完整路径"""
@@ -69,20 +93,20 @@ def save_json_file(file_path: str, data: Dict) -> None:
     """安全地保存 JSON 文件"""
     try:
         full_path = get_json_path(os.path.basename(file_path))
-        print(f"正在保存文件: {full_path}")
-        
-        full_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        with open(full_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        if write_json(full_path, data, indent=2, ensure_ascii=False):
             print(f"文件保存成功: {full_path}")
+        else:
+            print(f"文件内容未变化: {full_path}")
     except Exception as e:
         print(f"保存文件 {file_path} 时出错: {e}")
 
-async def send_telegram_message(message, buttons):
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    payload = {
-        'chat_id': TELEGRAM_CHAT_ID,
+def build_payload(message: str, buttons: List[List[Dict]]) -> Dict:
+    """
+    生成 sendMessage 的请求参数，发送图片时以 text 作为 caption
+
+    不包含 chat_id 和话题 ID：参数会保存到发送队列，发送目标在发送时由 destination() 补上。
+    """
+    return {
         'text': message,
         'parse_mode': 'HTML',
         'reply_markup': json.dumps({
@@ -90,151 +114,260 @@ async def send_telegram_message(message, buttons):
         })
     }
 
+def destination() -> Dict:
+    """发送目标：TELEGRAM_CHAT_ID 以及有效的 TELEGRAM_TOPIC_ID"""
+    target = {'chat_id': TELEGRAM_CHAT_ID}
     if TELEGRAM_TOPIC_ID:
         try:
             topic_id = int(TELEGRAM_TOPIC_ID)
             if topic_id > 0:
-                payload['message_thread_id'] = topic_id
-                print(f"将消息发送到话题 ID: {topic_id}")
+                target['message_thread_id'] = topic_id
         except ValueError:
             print("警告: TELEGRAM_TOPIC_ID 格式无效，将发送到主群组")
-    
-    try:
-        print(f"正在发送消息到 Telegram: chat_id={TELEGRAM_CHAT_ID}")
-        response = requests.post(url, data=payload)
-        response.raise_for_status()
-        print(f"消息发送成功: {message[:100]}...")
-        print(f"Telegram API 响应: {response.status_code}")
-    except requests.exceptions.HTTPError as http_err:
-        print(f"HTTP 错误: {http_err}")
-        print(f"响应: {response.json()}")
-    except Exception as err:
-        print(f"发生错误: {err}")
-        
-    return "Done"
+    return target
 
-async def send_telegram_photo(photo_url, caption, buttons):
-    """Send a photo from a URL with a caption to a Telegram chat."""
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendPhoto"
+async def send_telegram_message(client: TelegramClient, payload: Dict) -> None:
+    payload = dict(payload, **destination())
+    print(f"正在发送消息到 Telegram: chat_id={payload.get('chat_id')}")
+    await client.call('sendMessage', payload)
+    print(f"消息发送成功: {payload['text'][:100]}...")
+
+async def fetch_cover(photo_url: str) -> bytes:
+    """
+    封面图片走 HTTP 缓存，在线程中下载以免阻塞事件循环
 
+    METADATA_TTL 内直接读取本地缓存；过期后只发条件请求，图片未变化时服务器返回 304。
+    """
+    def fetch():
+        with span('cover_fetch', url=photo_url):
+            response = cached_get(photo_url, ttl=METADATA_TTL)
+            response.raise_for_status()
+            return response.content
+    return await asyncio.get_running_loop().run_in_executor(None, fetch)
+
+async def send_telegram_photo(client: TelegramClient, payload: Dict, photo_url: str) -> None:
+    """Send a photo from a URL with a caption to a Telegram chat."""
     try:
-        response = requests.get(photo_url)
-        response.raise_for_status()
+        image = await fetch_cover(photo_url)
     except Exception as e:
         print(f"获取图片失败: {e}")
-        return await send_telegram_message(caption, buttons)
-
-    image_file = io.BytesIO(response.content)
-    
-    payload = {
-        'chat_id': TELEGRAM_CHAT_ID,
-        'caption': caption,
-        'parse_mode': 'HTML',
-        'reply_markup': json.dumps({
-            'inline_keyboard': buttons
-        })
-    }
-
-    if TELEGRAM_TOPIC_ID:
-        try:
-            topic_id = int(TELEGRAM_TOPIC_ID)
-            if topic_id > 0:
-                payload['message_thread_id'] = topic_id
-        except ValueError:
-            print("警告: TELEGRAM_TOPIC_ID 格式无效，将发送到主群组")
-
-    files = {
-        'photo': ('image.jpg', image_file, 'image/jpeg')
-    }
+        return await send_telegram_message(client, payload)
 
+    data = {key: value for key, value in payload.items() if key != 'text'}
+    data.update(destination(), caption=payload['text'])
+    file_ids = get_file_id_cache()
+    sha256 = hashlib.sha256(image).hexdigest()
     try:
-        response = requests.post(url, data=payload, files=files)
-        response.raise_for_status()
-        print(f"Photo sent successfully with caption: {caption}")
-    except requests.exceptions.HTTPError as http_err:
-        print(f"HTTP error occurred: {http_err}")
-        print(f"Response: {response.text}")
-        return await send_telegram_message(caption, buttons)
-    except Exception as err:
-        print(f"An error occurred: {err}")
-        return await send_telegram_message(caption, buttons)
-        
-    return "Done"
+        file_id = file_ids.get(photo_url, sha256)
+        if file_id:
+            try:
+                await client.call('sendPhoto', dict(data, photo=file_id))
+                print(f"Photo sent by file_id with caption: {payload['text'][:100]}...")
+                return
+            except TelegramError as err:
+                if err.retryable or not is_file_id_error(err):
+                    raise
+                print(f"缓存的 file_id 已失效 ({err})，重新上传图片")
+                file_ids.invalidate(photo_url)
+        result = await client.call('sendPhoto', data, files={'photo': ('image.jpg', image, 'image/jpeg')})
+        file_ids.put(photo_url, sha256, largest_photo_id(result))
+        print(f"Photo sent successfully with caption: {payload['text'][:100]}...")
+    except TelegramError as err:
+        if err.retryable:
+            raise
+        # 说明过长等请求错误改为发送纯文本消息
+        print(f"Photo rejected ({err}), sending as text message")
+        await send_telegram_message(client, payload)
+
+async def send_outbox_entry(client: TelegramClient, entry: Dict) -> None:
+    with span('telegram_send', module=(entry.get('summary') or {}).get('id') or entry.get('key')):
+        if entry.get('photo_url'):
+            await send_telegram_photo(client, entry['payload'], entry['photo_url'])
+        else:
+            await send_telegram_message(client, entry['payload'])
+
+def plain_snippet(changelog_html: str, limit: int = DIGEST_CHANGELOG_CHARS) -> str:
+    """把更新日志 HTML 转为纯文本摘要（已转义，可直接放入 HTML 消息）"""
+    text = html.unescape(re.sub(r'<[^>]+>', '', changelog_html or ''))
+    text = re.sub(r'\s*\n\s*', ' / ', text.strip())
+    if len(text) > limit:
+        text = text[:limit - 1].rstrip() + '…'
+    return html.escape(text, quote=False)
+
+def digest_block(summary: Dict) -> str:
+    name = html.escape(summary.get('name') or summary['id'], quote=False)
+    lines = [f"<b>📦 {name}</b> <code>{html.escape(str(summary.get('version')), quote=False)}</code>"
+             f" ({summary.get('versionCode')})"]
+    if summary.get('changelog'):
+        lines.append(summary['changelog'])
+    if summary.get('source'):
+        lines.append(f'<a href="{html.escape(summary["source"])}">源码仓库</a>')
+    return '\n'.join(lines)
+
+def digest_chunks(entries: List[Dict], header_size: int) -> List[List[Dict]]:
+    """按消息长度和相册容量把通知分组，每组对应一条汇总消息"""
+    chunks = []
+    current, size = [], header_size
+    for entry in entries:
+        if not entry.get('summary'):
+            # 旧版本写入、没有摘要的通知单独发送
+            chunks.append([entry])
+            continue
+        block = len(digest_block(entry['summary'])) + 2
+        if current and (size + block > MESSAGE_LIMIT or len(current) >= DIGEST_MAX_MODULES):
+            chunks.append(current)
+            current, size = [], header_size
+        current.append(entry)
+        size += block
+    if current:
+        chunks.append(current)
+    return chunks
+
+def digest_message(entries: List[Dict], part: int, parts: int) -> Dict:
+    """生成多个模块的汇总消息，各模块的按钮合并为下载按钮"""
+    title = f"<b>🎉 模块更新汇总</b>（{len(entries)} 个模块" + (f"，{part}/{parts}" if parts > 1 else "") + "）"
+    blocks = [digest_block(entry['summary']) for entry in entries]
+    text = title + '\n\n' + '\n\n'.join(blocks) + '\n\n#模块更新'
+
+    downloads = [{'text': f"📥 {entry['summary'].get('name') or entry['summary']['id']}",
+                  'url': entry['summary']['zipUrl']}
+                 for entry in entries if entry['summary'].get('zipUrl')]
+    buttons = [downloads[i:i + DIGEST_BUTTONS_PER_ROW] for i in range(0, len(downloads), DIGEST_BUTTONS_PER_ROW)]
+    buttons.append([{'text': '🌐 访问仓库', 'url': REPO_URL}])
+    payload = dict(entries[0]['payload'], text=text)
+    payload['reply_markup'] = json.dumps({'inline_keyboard': buttons})
+    return payload
+
+async def send_digest_album(client: TelegramClient, entries: List[Dict]) -> None:
+    """把一组模块的封面合并为一个相册发送（至少两张封面时），已上传过的封面直接使用 file_id"""
+    covered = [entry for entry in entries if entry.get('photo_url')]
+    if len(covered) < 2:
+        return
+    images = await asyncio.gather(*(fetch_cover(entry['photo_url']) for entry in covered), return_exceptions=True)
+    file_ids = get_file_id_cache()
+    photos = []
+    for entry, image in zip(covered, images):
+        if isinstance(image, Exception):
+            print(f"获取图片失败: {image}")
+            continue
+        summary = entry['summary']
+        caption = f"<b>{html.escape(summary.get('name') or summary['id'], quote=False)}</b> " \
+                  f"{html.escape(str(summary.get('version')), quote=False)}"
+        photos.append((entry['photo_url'], image, hashlib.sha256(image).hexdigest(), caption[:CAPTION_LIMIT]))
+    if len(photos) < 2:
+        return
+
+    def build_request(use_file_ids: bool) -> Tuple[Dict, Dict]:
+        media, files = [], {}
+        for index, (url, image, sha256, caption) in enumerate(photos):
+            file_id = file_ids.get(url, sha256) if use_file_ids else None
+            if not file_id:
+                file_id = f'attach://photo{index}'
+                files[f'photo{index}'] = (f'photo{index}.jpg', image, 'image/jpeg')
+            media.append({'type': 'photo', 'media': file_id, 'caption': caption, 'parse_mode': 'HTML'})
+        return dict(destination(), media=json.dumps(media)), files
 
-def convert_markdown_to_html(markdown_text: str) -> str:
+    try:
+        data, files = build_request(use_file_ids=True)
+        try:
+            result = await client.call('sendMediaGroup', data, files=files or None)
+        except TelegramError as err:
+            if err.retryable or not is_file_id_error(err) or len(files) == len(photos):
+                raise
+            print(f"缓存的 file_id 已失效 ({err})，重新上传相册图片")
+            for url, *_ in photos:
+                file_ids.invalidate(url)
+            data, files = build_request(use_file_ids=False)
+            result = await client.call('sendMediaGroup', data, files=files)
+    except TelegramError as err:
+        if err.retryable:
+            raise
+        # 相册只是附带的封面展示，失败时仍然发送汇总消息
+        print(f"相册发送失败: {err}")
+        return
+    messages = result if isinstance(result, list) else []
+    for index, ((url, _, sha256, _), message) in enumerate(zip(photos, messages)):
+        if f'photo{index}' in files:
+            file_ids.put(url, sha256, largest_photo_id(message))
+
+async def deliver_digest(outbox: Outbox, client: TelegramClient) -> Tuple[int, int]:
+    """以汇总模式发送队列，每组通知发送一个封面相册和一条汇总消息"""
+    delivered = failed = 0
+    header_size = len('<b>🎉 模块更新汇总</b>（10 个模块，10/10）\n\n\n\n#模块更新')
+    chunks = digest_chunks(list(outbox.entries), header_size)
+    for part, chunk in enumerate(chunks, 1):
+        try:
+            if len(chunk) == 1:
+                await send_outbox_entry(client, chunk[0])
+            else:
+                with span('telegram_send', modules=len(chunk)):
+                    await send_digest_album(client, chunk)
+                    await send_telegram_message(client, digest_message(chunk, part, len(chunks)))
+        except Exception as e:
+            failed += len(chunk)
+            for entry in chunk:
+                outbox.mark_failed(entry, e)
+        else:
+            delivered += len(chunk)
+            for entry in chunk:
+                outbox.remove(entry['id'])
+        outbox.save()
+    return delivered, failed
+
+async def deliver_notifications(outbox: Outbox) -> Tuple[int, int]:
+    """在同一个事件循环和连接池中发送队列中的全部通知"""
+    async with TelegramClient(TELEGRAM_BOT_TOKEN) as client:
+        if TELEGRAM_DIGEST and len(outbox) >= TELEGRAM_DIGEST_MIN:
+            print(f"使用汇总模式发送 {len(outbox)} 条通知")
+            result = await deliver_digest(outbox, client)
+        else:
+            result = await deliver_outbox(outbox, client, send_outbox_entry)
+        print(client.report())
+        return result
+
+def find_previous_changelog(id: str) -> Optional[str]:
+    """预处理目录 PREVIOUS_MODULES_DIR 中该模块最新的 md 文件内容，没有时返回 None"""
+    if not PREVIOUS_MODULES_DIR:
+        return None
+    previous_module_dir = Path(PREVIOUS_MODULES_DIR) / id
+    print(f"检查预处理目录: {previous_module_dir}")
+    if previous_module_dir.is_dir():
+        md_files = list(previous_module_dir.glob("*.md"))
+        if md_files:
+            newest_file = max(md_files, key=lambda x: x.stat().st_mtime)
+            print(f"在预处理目录中找到更新日志文件: {newest_file}")
+            changelog_content = newest_file.read_text(encoding='utf-8').strip()
+            if changelog_content and changelog_content != NO_CHANGELOG:
+                print(f"使用预处理的更新日志，内容长度: {len(changelog_content)}")
+                return changelog_content
+    return None
+
+def find_changelog_legacy(id: str, version: str, version_code, latest: Dict) -> str:
     """
-    将Markdown格式转换为Telegram支持的HTML格式
-    支持：粗体，斜体，代码块，链接，列表等
+    更新日志索引中没有对应版本时，按目录扫描查找更新日志，返回 Markdown 原文
+
+    依次查找：模块目录中最新版本的更新日志、版本号匹配的 md 文件、最新修改的 md 文件、changelog.md。
     """
-    if not markdown_text or markdown_text == "暂无更新日志":
-        return "<i>暂无更新日志</i>"
-        
-    # 处理代码块 (必须先处理，避免内部格式被处理)
-    code_blocks = []
-    def replace_code_block(match):
-        code = match.group(1).strip()
-        code_blocks.append(code)
-        return f"CODE_BLOCK_{len(code_blocks)-1}_PLACEHOLDER"
-    
-    # 替换多行代码块
-    markdown_text = re.sub(r'```(?:\w+)?\n(.*?)\n```', replace_code_block, markdown_text, flags=re.DOTALL)
-    
-    # 替换标题为加粗 (# 标题)
-    markdown_text = re.sub(r'^#{1,6}\s+(.*?)$', r'<b>\1</b>', markdown_text, flags=re.MULTILINE)
-    
-    # 替换粗体 **文本** 或 __文本__
-    markdown_text = re.sub(r'\*\*(.*?)\*\*|__(.*?)__', r'<b>\1\2</b>', markdown_text)
-    
-    # 替换斜体 *文本* 或 _文本_
-    markdown_text = re.sub(r'(?<!\*)\*(?!\*)(.*?)(?<!\*)\*(?!\*)|(?<!_)_(?!_)(.*?)(?<!_)_(?!_)', r'<i>\1\2</i>', markdown_text)
-    
-    # 替换行内代码 `代码`
-    markdown_text = re.sub(r'`(.*?)`', r'<code>\1</code>', markdown_text)
-    
-    # 替换链接 [文本](URL)
-    markdown_text = re.sub(r'\[(.*?)\]\((.*?)\)', r'<a href="\2">\1</a>', markdown_text)
-    
-    # 替换有序列表项 1. 文本
-    markdown_text = re.sub(r'^\d+\.\s+(.*?)$', r'• \1', markdown_text, flags=re.MULTILINE)
-    
-    # 替换无序列表项 - 文本 或 * 文本
-    markdown_text = re.sub(r'^[\-\*]\s+(.*?)$', r'• \1', markdown_text, flags=re.MULTILINE)
-    
-    # 恢复代码块
-    for i, code in enumerate(code_blocks):
-        markdown_text = markdown_text.replace(f"CODE_BLOCK_{i}_PLACEHOLDER", f"<pre>{code}</pre>")
-    
-    # 替换段落分隔（保持适当的空行）
-    markdown_text = re.sub(r'\n{3,}', '\n\n', markdown_text)
-    
-    # 为每个换行处添加一些格式，使在Telegram中显示更美观
-    lines = markdown_text.split('\n')
-    formatted_lines = []
-    
-    for i, line in enumerate(lines):
-        # 如果是空行，直接添加
-        if not line.strip():
-            formatted_lines.append(line)
-            continue
-            
-        # 如果是列表项，给它添加适当的缩进
-        if line.strip().startswith('• '):
-            formatted_lines.append(line)
-        # 如果是标题（已转为加粗），添加前后空行
-        elif line.strip().startswith('<b>') and line.strip().endswith('</b>'):
-            if i > 0 and formatted_lines[-1].strip():
-                formatted_lines.append('')
-            formatted_lines.append(line)
-            formatted_lines.append('')
-        else:
-            formatted_lines.append(line)
-    
-    result = '\n'.join(formatted_lines)
-    
-    # 添加格式化标记以确保在Telegram中换行正常
-    result = result.replace('\n\n', '\n\n')
-    
-    return result
+    module_dir = REPO_ROOT / "modules" / id
+    print(f"正在查找模块 {id} 的更新日志文件...")
+    latest_version_file = module_dir / f"{latest.get('version')}_{latest.get('versionCode')}.md"
+    if latest_version_file.exists():
+        print(f"找到最新版本更新日志文件: {latest_version_file}")
+        return latest_version_file.read_text(encoding='utf-8').strip()
+
+    md_files = list(module_dir.glob("*.md"))
+    if md_files:
+        # 尝试根据版本号和构建号找到匹配的文件，没有则使用最新修改的md文件
+        version_files = [f for f in md_files if f.name.startswith(f"{version}_") or f.name.startswith(f"{version}{version_code}")]
+        changelog_file = version_files[0] if version_files else max(md_files, key=lambda x: x.stat().st_mtime)
+        print(f"找到更新日志文件: {changelog_file}")
+        return changelog_file.read_text(encoding='utf-8').strip()
+
+    for changelog_file in [module_dir / "changelog.md", module_dir / "CHANGELOG.md"]:
+        if changelog_file.exists():
+            print(f"找到标准更新日志文件: {changelog_file}")
+            return changelog_file.read_text(encoding='utf-8').strip()
+    return NO_CHANGELOG
 
 def check_for_module_updates() -> bool:
     """检查模块更新并发送通知，返回是否有更新"""
@@ -242,8 +375,11 @@ def check_for_module_updates() -> bool:
         validate_env()
 
         has_updates = False
-        main_data = load_json_file('modules.json', {"modules": []})
-        last_versions = load_json_file('last_versions.json', {})
+        outbox = Outbox()
+        changelog_store = ChangelogStore()
+        with span('config_load', file='modules.json'):
+            main_data = load_json_file('modules.json', {"modules": []})
+        store = get_state_store()
         
         print("="*50)
         print("开始检查模块更新")
@@ -254,7 +390,6 @@ def check_for_module_updates() -> bool:
             print(f"PREVIOUS_MODULES_DIR: {PREVIOUS_MODULES_DIR}")
         print("="*50)
         
-        # 增强版日志查找逻辑
         updated_modules = set()
         
         # 0. 首先尝试从环境变量中获取更新的模块列表
@@ -287,82 +422,31 @@ def check_for_module_updates() -> bool:
                 print(f"解析环境变量UPDATED_MODULES时出错: {e}")
                 print(f"环境变量内容: {UPDATED_MODULES_ENV}")
         
-        # 如果环境变量中没有找到更新的模块，则继续使用其他方式检测
+        # 1. 读取同步事件日志中上次处理位置之后的新事件；即使已从环境变量获得列表也要读取，以推进检查点
+        checkpoint = load_checkpoint(JOURNAL_CHECKPOINT_PATH)
+        events, next_checkpoint = read_events(checkpoint)
+        print(f"同步事件日志: 从偏移 {checkpoint['offset']} (seq {checkpoint['seq']}) 读取到 {len(events)} 条新事件")
         if not updated_modules:
-            # 1. 尝试从多个可能的位置查找日志文件
-            possible_log_dirs = [
-                REPO_ROOT / 'log',
-                REPO_ROOT,
-                Path('log'),
-                Path('.'),
-                Path('/github/workspace/log')
-            ]
-            
-            print("开始查找日志文件...")
-            for log_dir in possible_log_dirs:
-                if not log_dir.exists():
-                    print(f"目录不存在: {log_dir}")
+            for event in events:
+                if event.get('type') != 'update':
                     continue
-                    
-                print(f"在目录中查找日志: {log_dir}")
-                try:
-                    all_files = list(log_dir.glob('*'))
-                    print(f"该目录中的所有文件: {[str(f) for f in all_files]}")
-                    
-                    log_files = list(log_dir.glob('*sync*.log'))
-                    print(f"找到的日志文件: {[str(f) for f in log_files]}")
-                    
-                    for log_file in log_files:
-                        print(f"正在读取日志文件: {log_file}")
-                        try:
-                            with open(log_file, 'r', encoding='utf-8') as f:
-                                content = f.read()
-                                print(f"日志文件内容片段: {content[:200]}...")
-                                
-                                # 使用更精确的正则表达式匹配更新记录
-                                update_pattern = r"update: \[([^\]]+)\] -> update to"
-                                matches = re.findall(update_pattern, content)
-                                
-                                for module_id in matches:
-                                    updated_modules.add(module_id)
-                                    print(f"从日志中发现模块更新: {module_id}")
-                                    
-                                # 如果没有使用正则表达式找到匹配，退回到行匹配
-                                if not matches:
-                                    for line in content.splitlines():
-                                        if 'update: [' in line and '] -> update to' in line:
-                                            try:
-                                                module_id = line.split('[')[1].split(']')[0]
-                                                updated_modules.add(module_id)
-                                                print(f"从日志行中发现模块更新: {module_id}")
-                                            except:
-                                                print(f"无法从行中解析模块ID: {line}")
-                        except Exception as e:
-                            print(f"读取日志文件 {log_file} 时出错: {e}")
-                except Exception as e:
-                    print(f"处理目录 {log_dir} 时出错: {e}")
-            
-            # 2. 如果没有找到更新，尝试从modules.json和last_versions.json比较版本
-            if not updated_modules:
-                print("从日志中未找到更新，尝试比较版本文件...")
-                for module in main_data.get("modules", []):
-                    id = module.get("id")
-                    version_code = module.get("versionCode", 0)
-                    
-                    if id in last_versions:
-                        last_record = last_versions.get(id, {})
-                        
-                        # 处理不同的last_versions格式
-                        if isinstance(last_record, dict):
-                            last_version_code = last_record.get("versionCode", 0)
-                        else:  # 旧格式，直接存储版本代码
-                            last_version_code = last_record
-                        
-                        if isinstance(last_version_code, int) and isinstance(version_code, int):
-                            if version_code > last_version_code:
-                                updated_modules.add(id)
-                                print(f"通过版本比较发现更新: {id} ({last_version_code} -> {version_code})")
-            
+                module_id = event.get('id')
+                notified_code = store.notified_version_code(module_id)
+                if isinstance(notified_code, int) and isinstance(event.get('versionCode'), int) \
+                        and notified_code >= event['versionCode']:
+                    print(f"已通知过的事件，跳过: {module_id} ({event['versionCode']})")
+                    continue
+                updated_modules.add(module_id)
+                print(f"从同步事件中发现模块更新: {module_id} "
+                      f"({event.get('previousVersionCode')} -> {event.get('versionCode')})")
+
+        # 2. 如果没有找到更新，查询最新版本比最后通知版本新的模块
+        if not updated_modules:
+            print("同步事件中未找到更新，尝试比较版本...")
+            for id, latest_version_code, last_version_code in store.updated_since_notified():
+                updated_modules.add(id)
+                print(f"通过版本比较发现更新: {id} ({last_version_code} -> {latest_version_code})")
+        
         print(f"找到 {len(updated_modules)} 个更新的模块: {', '.join(updated_modules)}")
 
         for module in main_data.get("modules", []):
@@ -380,75 +464,21 @@ def check_for_module_updates() -> bool:
                 source = module.get("track", {}).get("source")
                 latest = module.get("versions", [{}])[-1]
 
-                changelog_content = "暂无更新日志"
-                try:
-                    # 首先检查是否有预处理好的上一版本的更新日志
-                    if PREVIOUS_MODULES_DIR:
-                        previous_module_dir = Path(PREVIOUS_MODULES_DIR) / id
-                        print(f"检查预处理目录: {previous_module_dir}")
-                        
-                        if previous_module_dir.exists() and previous_module_dir.is_dir():
-                            md_files = list(previous_module_dir.glob("*.md"))
-                            if md_files:
-                                # 找到最新的md文件
-                                newest_file = max(md_files, key=lambda x: x.stat().st_mtime)
-                                print(f"在预处理目录中找到更新日志文件: {newest_file}")
-                                with open(newest_file, 'r', encoding='utf-8') as f:
-                                    changelog_content = f.read().strip()
-                                
-                                # 如果找到了预处理的更新日志，就不再继续查找
-                                if changelog_content and changelog_content != "暂无更新日志":
-                                    print(f"使用预处理的更新日志，内容长度: {len(changelog_content)}")
-                    
-                    # 如果没有找到预处理的更新日志，则继续常规查找
-                    if changelog_content == "暂无更新日志":
-                        # 优先获取最新版本的更新日志文件
-                        module_dir = REPO_ROOT / "modules" / id
-                        print(f"正在查找模块 {id} 的更新日志文件...")
-                        
-                        # 优先尝试找最新版本的文件
-                        latest_version_file = module_dir / f"{latest.get('version')}_{latest.get('versionCode')}.md"
-                        if latest_version_file.exists():
-                            print(f"找到最新版本更新日志文件: {latest_version_file}")
-                            with open(latest_version_file, 'r', encoding='utf-8') as f:
-                                changelog_content = f.read().strip()
-                        else:
-                            # 查找模块目录下的所有md文件
-                            md_files = list(module_dir.glob("*.md"))
-                            if md_files:
-                                # 尝试根据版本号和构建号找到匹配的文件
-                                version_files = [f for f in md_files if f.name.startswith(f"{version}_") or f.name.startswith(f"{version}{version_code}")]
-                                if version_files:
-                                    changelog_file = version_files[0]
-                                    print(f"找到版本匹配的更新日志文件: {changelog_file}")
-                                    with open(changelog_file, 'r', encoding='utf-8') as f:
-                                        changelog_content = f.read().strip()
-                                else:
-                                    # 没有找到匹配的版本文件，查找最新修改的md文件
-                                    newest_file = max(md_files, key=lambda x: x.stat().st_mtime)
-                                    print(f"找到最新修改的MD文件: {newest_file}")
-                                    with open(newest_file, 'r', encoding='utf-8') as f:
-                                        changelog_content = f.read().strip()
-                            else:
-                                # 尝试标准的changelog文件
-                                for changelog_file in [module_dir / "changelog.md", module_dir / "CHANGELOG.md"]:
-                                    if changelog_file.exists():
-                                        print(f"找到标准更新日志文件: {changelog_file}")
-                                        with open(changelog_file, 'r', encoding='utf-8') as f:
-                                            changelog_content = f.read().strip()
-                                        break
-                    
-                    # 将Markdown转换为HTML格式
-                    if changelog_content != "暂无更新日志":
-                        changelog_content = convert_markdown_to_html(changelog_content)
-                        # 如果内容过长，进行裁剪
-                        if len(changelog_content) > 1500:
-                            changelog_content = changelog_content[:1497] + "..."
-                            
-                except Exception as e:
-                    print(f"读取更新日志失败 ({id}): {e}")
-                    import traceback
-                    traceback.print_exc()
+                # 预处理目录中的更新日志优先，其次是预渲染的索引，最后按目录扫描
+                previous_changelog = find_previous_changelog(id)
+                changelog_content = changelog_store.lookup(id, version_code) if previous_changelog is None else None
+                if previous_changelog is not None:
+                    changelog_content = render_changelog(previous_changelog)
+                elif changelog_content is not None:
+                    print(f"使用预渲染的更新日志: {id} ({version_code})")
+                else:
+                    try:
+                        changelog_content = render_changelog(find_changelog_legacy(id, version, version_code, latest))
+                    except Exception as e:
+                        print(f"读取更新日志失败 ({id}): {e}")
+                        import traceback
+                        traceback.print_exc()
+                        changelog_content = NO_CHANGELOG
 
                 update_note = ""
                 if module.get("note") and module.get("note").get("message"):
@@ -513,30 +543,42 @@ def check_for_module_updates() -> bool:
 
                 buttons = [section_1, support_urls, section_2]
 
-                try:
-                    print(f"开始发送模块 {id} 的更新通知...")
-                    if not module.get("cover"):
-                        result = asyncio.run(send_telegram_message(message, buttons))
-                    else:
-                        result = asyncio.run(send_telegram_photo(module.get("cover"), message, buttons))
-                        
-                    # 保存已通知的版本
-                    if isinstance(last_versions.get(id), dict):
-                        last_versions[id]["version"] = version
-                        last_versions[id]["versionCode"] = version_code
-                    else:
-                        last_versions[id] = {
-                            "version": version,
-                            "versionCode": version_code,
-                            "author": author,
-                            "name": name
-                        }
-                    print(f"通知结果: {result}")
-                except Exception as e:
-                    print(f"发送通知失败 (模块 {id}): {e}")
-                    continue
-
-        save_json_file('last_versions.json', last_versions)
+                # 通知送达（或放弃发送）后才记录已通知版本，未送达的版本下次运行时会再次入队
+                summary = {
+                    'id': id,
+                    'name': name,
+                    'author': author,
+                    'version': version,
+                    'versionCode': version_code,
+                    'zipUrl': latest.get("zipUrl"),
+                    'source': source,
+                    'changelog': plain_snippet(changelog_content),
+                }
+                outbox.add(f"{id}:{version_code}", 'sendMessage', build_payload(message, buttons),
+                           photo_url=module.get("cover"), summary=summary)
+                print(f"模块 {id} 的更新通知已加入发送队列")
+
+        outbox.save()
+        queued = list(outbox.entries)
+        if queued:
+            print(f"开始发送 {len(queued)} 条通知...")
+            delivered, failed = asyncio.run(deliver_notifications(outbox))
+            print(f"通知发送完成: 成功 {delivered} 条，失败 {failed} 条，队列剩余 {len(outbox)} 条")
+        # 只记录已离开队列（送达或放弃）的通知；仍在队列中的版本不写入 last_versions.json，
+        # 即使缓存目录中的发送队列丢失，下次运行比较版本时也会重新发现并发送
+        remaining = {entry['key'] for entry in outbox.entries}
+        with store.transaction():
+            for entry in queued:
+                summary = entry.get('summary') or {}
+                if entry['key'] not in remaining and summary.get('id'):
+                    store.record_notification(summary['id'], summary.get('version'), summary.get('versionCode'),
+                                              author=summary.get('author'), name=summary.get('name'))
+
+        if store.export_notifications():
+            print("last_versions.json 已更新")
+        # 通知已入队并记录送达的版本后才推进检查点，中途失败时下次运行会重新读取这些事件
+        save_checkpoint(JOURNAL_CHECKPOINT_PATH, next_checkpoint)
+        compact_journal(JOURNAL_CHECKPOINT_PATH, next_checkpoint)
         return has_updates
 
     except Exception as e:
@@ -547,4 +589,5 @@ def check_for_module_updates() -> bool:
 
 if __name__ == "__main__":
     has_updates = check_for_module_updates()
+    print(write_report())
     print(f"模块更新检查完成，{'有' if has_updates else '没有'}更新")
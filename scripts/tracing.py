@@ -0,0 +1,277 @@
+"""
+同步脚本的轻量级追踪
+
+用 span 包裹各个阶段（配置读取、GitHub 元数据、update_to 请求、zip 下载、分类、JSON 写入、
+Telegram 发送等），记录耗时以及 bytes、HTTP status、cache（hit / revalidated / miss）等属性：
+
+    with span('update_to', module=module_id) as s:
+        response = http_get(url)
+        s.set(status=response.status_code)
+
+span 可以嵌套，未指定 module 时沿用外层 span 的 module；共享 HTTP 会话的每个请求记录为
+http span，其状态码和响应字节数自动累加到外层 span 上。线程池中的任务不继承外层 span，
+需要在任务内部打开带 module 的 span。
+
+进程退出时按阶段汇总（次数、总耗时、p50/p95/最大值、字节数、缓存命中、状态码），
+打印汇总表并写入 JSON 运行报告，默认路径为缓存目录下的 traces/<脚本名>.json，
+可用 MMRL_TRACE_REPORT 指定。设置 MMRL_PROFILE_DIR 时同时用 cProfile 采样所有线程，
+退出时写入 <目录>/<脚本名>.prof，可用 python -m pstats 或 snakeviz 查看。
+多个线程中的 span 会重叠，阶段的总耗时可能大于进程的实际运行时间。
+"""
+
+import atexit
+import contextvars
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+TRACE_REPORT = os.environ.get('MMRL_TRACE_REPORT')
+PROFILE_DIR = os.environ.get('MMRL_PROFILE_DIR')
+# 报告中保留的最慢 span 数量
+SLOWEST_SPANS = 20
+
+_current: contextvars.ContextVar = contextvars.ContextVar('mmrl_span', default=None)
+
+
+class Span:
+    __slots__ = ('name', 'parent', 'attrs', 'start', 'seconds', 'error')
+
+    def __init__(self, name: str, parent: Optional['Span'], attrs: Dict[str, Any]):
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.seconds = 0.0
+        self.error = None
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def add_bytes(self, count: int) -> None:
+        self.attrs['bytes'] = self.attrs.get('bytes', 0) + count
+
+    @property
+    def module(self) -> Optional[str]:
+        span = self
+        while span is not None:
+            if span.attrs.get('module'):
+                return span.attrs['module']
+            span = span.parent
+        return None
+
+
+class ThreadProfiler:
+    """
+    采样主线程和之后启动的所有线程
+
+    cProfile 只能统计调用 enable() 的线程，新线程通过 threading.setprofile 在第一次
+    回调时为自己启用一个 Profile，退出时合并全部结果。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.profilers: List[cProfile.Profile] = []
+
+    def _enable(self) -> None:
+        profiler = cProfile.Profile()
+        with self._lock:
+            self.profilers.append(profiler)
+        profiler.enable()
+
+    def _thread_start(self, frame, event, arg) -> None:
+        sys.setprofile(None)
+        self._enable()
+
+    def start(self) -> None:
+        threading.setprofile(self._thread_start)
+        self._enable()
+
+    def dump(self, path: Path) -> None:
+        threading.setprofile(None)
+        with self._lock:
+            profilers = list(self.profilers)
+        stats = None
+        for profiler in profilers:
+            profiler.disable()
+            if stats is None:
+                stats = pstats.Stats(profiler)
+            else:
+                stats.add(profiler)
+        if stats is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            stats.dump_stats(str(path))
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Tracer:
+    """汇总进程内结束的 span，退出时输出运行报告"""
+
+    def __init__(self, run: str):
+        self.run = run
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+        self.stages: Dict[str, Dict[str, Any]] = defaultdict(
+            lambda: {'errors': 0, 'bytes': 0, 'cache': Counter(), 'status': Counter()})
+        self.modules: Dict[str, Dict[str, Dict[str, Any]]] = defaultdict(dict)
+        self.slowest: List[Dict[str, Any]] = []
+        self.profiler = None
+        if PROFILE_DIR:
+            self.profiler = ThreadProfiler()
+            self.profiler.start()
+
+    def finish(self, span: Span) -> None:
+        attrs = span.attrs
+        module = span.module
+        # 请求的状态码和字节数计入发起请求的外层 span
+        if span.name == 'http' and span.parent is not None:
+            if 'bytes' in attrs:
+                span.parent.add_bytes(attrs['bytes'])
+            if 'status' in attrs:
+                span.parent.attrs['status'] = attrs['status']
+        with self._lock:
+            self.durations[span.name].append(span.seconds)
+            stage = self.stages[span.name]
+            stage['bytes'] += attrs.get('bytes', 0)
+            if span.error:
+                stage['errors'] += 1
+            if 'cache' in attrs:
+                stage['cache'][attrs['cache']] += 1
+            if 'status' in attrs:
+                stage['status'][str(attrs['status'])] += 1
+            if span.name == 'http':
+                return
+            if module:
+                record = self.modules[module].setdefault(span.name, {'count': 0, 'seconds': 0.0, 'bytes': 0})
+                record['count'] += 1
+                record['seconds'] += span.seconds
+                record['bytes'] += attrs.get('bytes', 0)
+                for key in ('status', 'cache'):
+                    if key in attrs:
+                        record[key] = attrs[key]
+                if span.error:
+                    record['error'] = span.error
+            if len(self.slowest) < SLOWEST_SPANS or span.seconds > self.slowest[-1]['seconds']:
+                self.slowest.append(dict(attrs, name=span.name, module=module, seconds=span.seconds,
+                                         **({'error': span.error} if span.error else {})))
+                self.slowest.sort(key=lambda item: item['seconds'], reverse=True)
+                del self.slowest[SLOWEST_SPANS:]
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {}
+            for name, values in sorted(self.durations.items()):
+                stage = self.stages[name]
+                stages[name] = {
+                    'count': len(values),
+                    'errors': stage['errors'],
+                    'seconds': round(sum(values), 4),
+                    'p50': round(percentile(values, 0.5), 4),
+                    'p95': round(percentile(values, 0.95), 4),
+                    'max': round(max(values), 4),
+                    'bytes': stage['bytes'],
+                    'cache': dict(stage['cache']),
+                    'status': dict(stage['status']),
+                }
+            modules = {
+                module: {name: dict(record, seconds=round(record['seconds'], 4)) for name, record in records.items()}
+                for module, records in sorted(self.modules.items())
+            }
+            slowest = [dict(item, seconds=round(item['seconds'], 4)) for item in self.slowest]
+        return {
+            'run': self.run,
+            'started_at': self.started_at,
+            'seconds': round(time.perf_counter() - self._started, 3),
+            'stages': stages,
+            'slowest': slowest,
+            'modules': modules,
+        }
+
+    def report(self, summary: Optional[Dict[str, Any]] = None) -> str:
+        summary = summary or self.summary()
+        lines = [f"Trace of {self.run} ({summary['seconds']:.1f}s):"]
+        for name, stage in summary['stages'].items():
+            cache = ', '.join(f'{key} {value}' for key, value in sorted(stage['cache'].items()))
+            lines.append(
+                f"  {name}: {stage['count']} spans, {stage['seconds']:.2f}s total, p50 {stage['p50'] * 1000:.0f} ms, "
+                f"p95 {stage['p95'] * 1000:.0f} ms, max {stage['max'] * 1000:.0f} ms, "
+                f"{stage['bytes'] / 1024:.0f} KB, {stage['errors']} errors" + (f", cache: {cache}" if cache else '')
+            )
+        return '\n'.join(lines)
+
+    def report_path(self) -> Path:
+        if TRACE_REPORT:
+            return Path(TRACE_REPORT)
+        from http_cache import CACHE_ROOT
+        return CACHE_ROOT / 'traces' / f'{self.run}.json'
+
+    def save(self) -> Optional[Path]:
+        """写入运行报告（以及 cProfile 结果），没有任何 span 时不写入"""
+        if self.profiler is not None:
+            self.profiler.dump(Path(PROFILE_DIR) / f'{self.run}.prof')
+        summary = self.summary()
+        if not summary['stages']:
+            return None
+        from json_writer import write_bytes_atomic
+        path = self.report_path()
+        write_bytes_atomic(path, json.dumps(summary, ensure_ascii=False, indent=1).encode('utf-8'))
+        print(self.report(summary))
+        print(f"Trace report written to {path}")
+        return path
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def _save_tracer() -> None:
+    if _tracer is not None:
+        _tracer.save()
+
+
+def get_tracer() -> Tracer:
+    """返回进程内共享的追踪器（以脚本名命名），进程退出时写入运行报告"""
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer(Path(sys.argv[0]).stem or 'python')
+            atexit.register(_save_tracer)
+        return _tracer
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Span]:
+    tracer = get_tracer()
+    current = Span(name, _current.get(), attrs)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.seconds = time.perf_counter() - current.start
+        _current.reset(token)
+        tracer.finish(current)
+
+
+def annotate(**attrs: Any) -> None:
+    """给当前 span 添加属性，不在 span 中时忽略"""
+    current = _current.get()
+    if current is not None:
+        current.set(**attrs)
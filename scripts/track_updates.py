@@ -1,306 +1,196 @@
-import json
 import os
-import tempfile
+import posixpath
 import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
 from pathlib import Path
-import requests
 import re
 
-def load_config():
-    config_path = Path(__file__).parent.parent / "json" / "track_config.json"
-    with open(config_path, 'r') as f:
-        return json.load(f)
+from download_cache import get_download_cache
+from github_graphql import fetch_repositories
+from http_cache import METADATA_TTL, cached_get
+from http_client import host_slot
+from module_rules import match_antifeatures, match_categories
+from state_store import get_state_store
+from tracing import span
+from zip_inspect import list_local_zip_entries, list_zip_entries
 
-def download_and_extract_zip(url):
+# 并发同步的线程数，每个主机的并发上限见 http_client.HOST_CONCURRENCY
+MAX_WORKERS = int(os.environ.get('TRACK_WORKERS', 16))
+GITHUB_API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
+
+def http_get(url, ttl=0, **kwargs):
+    """
+    带主机并发限制和条件请求缓存的 GET，ttl 秒内的缓存直接返回不发请求
+    """
+    with host_slot(url):
+        return cached_get(url, ttl=ttl, **kwargs)
+
+def get_zip_file_names(url):
+    """
+    通过 Range 请求只读取 zip 的中央目录，返回所有文件名（小写，不含路径）
+
+    下载缓存中已有该 zip 时复用本地文件，只需一次条件请求。
+    """
     try:
-        response = requests.get(url, stream=True)
-        if response.status_code != 200:
+        cache = get_download_cache()
+        with host_slot(url), span('zip_download') as zip_span:
+            if cache.lookup(url):
+                zip_span.set(mode='local')
+                entries = list_local_zip_entries(cache.fetch(url))
+            else:
+                zip_span.set(mode='range')
+                entries = list_zip_entries(url)
+        if entries is None:
             return None
-        
-        # 创建临时目录
-        with tempfile.TemporaryDirectory() as temp_dir:
-            zip_path = Path(temp_dir) / "module.zip"
-            # 下载zip文件
-            with open(zip_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            
-            try:
-                # 解压文件
-                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                    zip_ref.extractall(temp_dir)
-            except zipfile.BadZipFile:
-                print(f"Error: Invalid zip file from {url}")
-                return None
-            except NotImplementedError as e:
-                print(f"Error downloading/extracting zip: {e}")
-                return None
-            
-            # 获取所有文件名
-            files = []
-            for root, _, filenames in os.walk(temp_dir):
-                for filename in filenames:
-                    files.append(filename.lower())
-            return files
+        return [posixpath.basename(name).lower() for name in entries]
+    except zipfile.BadZipFile:
+        print(f"Error: Invalid zip file from {url}")
+        return None
     except Exception as e:
-        print(f"Error downloading/extracting zip: {e}")
+        print(f"Error reading zip: {e}")
         return None
 
 def get_antifeatures_from_files(files):
     """
-    根据MMRL定义的antifeatures进行检测
+    根据MMRL定义的antifeatures进行检测，规则表见 module_rules.ANTIFEATURE_RULES
     """
-    antifeatures = []
-    
-    # 检查广告相关文件 - 修复误将"去广告"识别为广告的问题
-    ad_patterns = [r'\bad[s]?\b', r'\badvertis(ing|ement)\b', r'广告']
-    ad_exclusion_patterns = [r'去广告', r'block[-_]?ads?', r'ad[-_]?block', r'no[-_]?ads?', r'remove[-_]?ads?']
-    
-    # 先检查是否是去广告类模块
-    is_ad_blocker = any(any(re.search(pattern, f, re.I) for pattern in ad_exclusion_patterns) for f in files)
-    
-    # 如果不是去广告类模块，再检查是否包含广告
-    if not is_ad_blocker and any(any(re.search(pattern, f, re.I) for pattern in ad_patterns) for f in files):
-        antifeatures.append('ads')
-    
-    # 检查追踪相关文件
-    track_patterns = [r'\btrack(er|ing)?\b', r'\banalytics?\b', r'\bstatistics?\b', r'\btelemetry\b']
-    if any(any(re.search(pattern, f, re.I) for pattern in track_patterns) for f in files):
-        antifeatures.append('tracking')
-    
-    # 检查非自由网络服务
-    net_patterns = [
-        r'\b(google|facebook|amazon|azure|aws)[-_]?(api|sdk|service)\b',
-        r'\bcloud[-_]?(api|service)\b'
-    ]
-    if any(any(re.search(pattern, f, re.I) for pattern in net_patterns) for f in files):
-        antifeatures.append('nonfreenet')
-    
-    # 检查非自由资产
-    asset_patterns = ['.mp3', '.aac', '.wma', '.m4p', '.m4v', 'proprietary', 'nonfree']
-    if any(f.lower().endswith(tuple(asset_patterns)) or any(p in f.lower() for p in asset_patterns) for f in files):
-        antifeatures.append('nonfreeassets')
-    
-    # 检查非自由依赖
-    dep_patterns = [r'nonfree[-_]?dep', r'proprietary[-_]?dep']
-    if any(any(re.search(pattern, f, re.I) for pattern in dep_patterns) for f in files):
-        antifeatures.append('nonfreedep')
-    
-    # 检查非自由附加组件
-    addon_patterns = [r'nonfree[-_]?addon', r'premium[-_]?feature']
-    if any(any(re.search(pattern, f, re.I) for pattern in addon_patterns) for f in files):
-        antifeatures.append('nonfreeadd')
-    
-    # 检查NSFW内容
-    nsfw_patterns = [r'\bnsfw\b', r'\badult\b', r'\bmature\b']
-    if any(any(re.search(pattern, f, re.I) for pattern in nsfw_patterns) for f in files):
-        antifeatures.append('nsfw')
-    
-    # 检查用户数据收集
-    data_collection_patterns = [r'collect[-_]?data', r'user[-_]?data', r'data[-_]?collection', r'收集数据']
-    if any(any(re.search(pattern, f, re.I) for pattern in data_collection_patterns) for f in files):
-        antifeatures.append('tracking')
-    
-    # 检查已知漏洞
-    vuln_patterns = [r'cve-\d+', r'vulnerability', r'exploit', r'security[-_]?issue', r'漏洞']
-    if any(any(re.search(pattern, f, re.I) for pattern in vuln_patterns) for f in files):
-        antifeatures.append('knownvuln')
-    
-    return antifeatures
+    return match_antifeatures(files)
 
-def get_github_repo_info(repo_url):
-    # 检查是否是GitHub URL
+def parse_github_repo(repo_url):
+    """从 GitHub 仓库地址中提取 (owner, repo)，不是 GitHub 地址时返回 None"""
     if not repo_url.startswith('https://github.com/'):
-        return {
-            'license': '',
-            'antifeatures': [],
-            'updated_at': ''
-        }
-    
-    # 从URL中提取owner和repo名称
+        return None
     match = re.match(r'https://github.com/([^/]+)/([^/]+)', repo_url)
     if not match:
-        return {
-            'license': '',
-            'antifeatures': [],
-            'updated_at': ''
-        }
-    
-    owner, repo = match.groups()
+        return None
+    return match.groups()
+
+def fetch_rest_metadata(owner, repo, headers):
+    """
+    通过 REST 接口获取与 github_graphql.normalize_repository 相同字段的元数据
+    """
+    api_url = f'{GITHUB_API_URL}/repos/{owner}/{repo}'
+    response = http_get(api_url, ttl=METADATA_TTL, headers=headers)
+    if response.status_code != 200:
+        return None
+    repo_info = response.json()
+
+    files = None
+    dependencies_url = f'{GITHUB_API_URL}/repos/{owner}/{repo}/contents'
+    try:
+        response = http_get(dependencies_url, headers=headers)
+        if response.status_code == 200:
+            files = [f['name'].lower() for f in response.json()]
+    except:
+        pass
+
+    return {
+        'archived': repo_info.get('archived', False),
+        'disabled': repo_info.get('disabled', False),
+        'private': repo_info.get('private', False),
+        'license': (repo_info.get('license') or {}).get('spdx_id') or '',
+        'updated_at': repo_info.get('updated_at', ''),
+        'files': files,
+    }
+
+def prefetch_github_metadata(repositories):
+    """
+    用 GraphQL 批量获取所有仓库的元数据，返回 {(owner, repo): 元数据}（键为小写）
+    """
+    pairs = [parsed for parsed in (parse_github_repo(repo["url"]) for repo in repositories) if parsed]
+    with span('github_graphql', repositories=len(pairs)):
+        metadata = fetch_repositories(pairs)
+    if pairs:
+        print(f"GraphQL metadata: {len(metadata)}/{len(set((o.lower(), r.lower()) for o, r in pairs))} repositories")
+    return metadata
+
+def get_github_repo_info(repo_url, metadata=None):
+    """
+    获取仓库许可证、更新时间和 antifeatures
+
+    metadata 为 prefetch_github_metadata 的批量结果，命中时不再请求仓库信息和根目录列表
+    """
+    empty = {
+        'license': '',
+        'antifeatures': [],
+        'updated_at': ''
+    }
+    parsed = parse_github_repo(repo_url)
+    if not parsed:
+        return empty
+
+    owner, repo = parsed
     headers = {}
     if 'GITHUB_TOKEN' in os.environ:
         headers['Authorization'] = f'token {os.environ["GITHUB_TOKEN"]}'
-    
-    # 获取仓库信息
-    api_url = f'https://api.github.com/repos/{owner}/{repo}'
+
     try:
-        response = requests.get(api_url, headers=headers)
-        if response.status_code != 200:
-            return {
-                'license': '',
-                'antifeatures': [],
-                'updated_at': ''
-            }
-        
-        repo_info = response.json()
-        
+        repo_meta = (metadata or {}).get((owner.lower(), repo.lower()))
+        if repo_meta is None:
+            repo_meta = fetch_rest_metadata(owner, repo, headers)
+        if repo_meta is None:
+            return empty
+
         # 检查仓库状态
         antifeatures = []
-        
+
         # 检查源代码可用性
-        if repo_info.get('archived', False) or repo_info.get('disabled', False):
+        if repo_meta['archived'] or repo_meta['disabled']:
             antifeatures.append('nosourcesince')
-        
+
         # 检查是否是私有仓库或闭源
-        if repo_info.get('private', False) or not repo_info.get('license'):
+        if repo_meta['private'] or not repo_meta['license']:
             antifeatures.append('upstreamnonfree')
-        
-        # 检查已知漏洞
+
+        # 检查已知漏洞（GraphQL 没有仓库安全公告字段，仍使用带缓存的 REST 请求）
         try:
-            vuln_url = f'https://api.github.com/repos/{owner}/{repo}/security/advisories'
-            response = requests.get(vuln_url, headers=headers)
+            vuln_url = f'{GITHUB_API_URL}/repos/{owner}/{repo}/security/advisories'
+            response = http_get(vuln_url, ttl=METADATA_TTL, headers=headers)
             if response.status_code == 200 and response.json():
                 antifeatures.append('knownvuln')
         except:
             pass
-        
+
         # 检查上游依赖
-        dependencies_url = f'https://api.github.com/repos/{owner}/{repo}/contents'
-        try:
-            response = requests.get(dependencies_url, headers=headers)
-            if response.status_code == 200:
-                files = [f['name'].lower() for f in response.json()]
-                antifeatures.extend(get_antifeatures_from_files(files))
-        except:
-            pass
-        
+        if repo_meta['files']:
+            antifeatures.extend(get_antifeatures_from_files(repo_meta['files']))
+
         return {
-            'license': repo_info.get('license', {}).get('spdx_id', ''),
-            'antifeatures': list(set(antifeatures)),  # 去重
-            'updated_at': repo_info.get('updated_at', '')
+            'license': repo_meta['license'],
+            'antifeatures': sorted(set(antifeatures)),  # 去重并固定顺序
+            'updated_at': repo_meta['updated_at']
         }
     except:
-        return {
-            'license': '',
-            'antifeatures': [],
-            'updated_at': ''
-        }
+        return empty
 
 def get_module_categories(files):
-    categories = []
-    
-    # Zygisk模块
-    zygisk_patterns = [r'zygisk', r'zygote', r'riru']
-    if any(any(pattern in f.lower() for pattern in zygisk_patterns) for f in files):
-        categories.append('Zygisk')
-    
-    # 脚本模块
-    script_files = ['service.sh', 'post-fs-data.sh', 'customize.sh', 'install.sh']
-    if any(f.lower() in [sf.lower() for sf in script_files] for f in files):
-        categories.append('Script')
-    
-    # 系统模块
-    system_patterns = [r'system', r'system\.prop', r'vendor', r'product', r'boot', r'recovery']
-    if any(any(pattern in f.lower() for pattern in system_patterns) for f in files):
-        categories.append('System')
-    
-    # 主题模块
-    theme_patterns = [r'theme', r'style', r'overlay', r'skin', r'color', r'appearance', r'icon', r'ui', r'interface']
-    if any(any(pattern in f.lower() for pattern in theme_patterns) for f in files):
-        categories.append('Theme')
-    
-    # 字体模块
-    font_patterns = [r'font', r'typeface', r'\.ttf$', r'\.otf$', r'\.woff2?$', r'emoji']
-    if any(any(re.search(pattern, f.lower()) for pattern in font_patterns) for f in files):
-        categories.append('Font')
-    
-    # 音频模块
-    audio_patterns = [r'audio', r'sound', r'music', r'ringtone', r'\.wav$', r'\.mp3$', r'\.m4a$', r'\.ogg$', r'dolby', r'equalizer', r'speaker']
-    if any(any(re.search(pattern, f.lower()) for pattern in audio_patterns) for f in files):
-        categories.append('Audio')
-    
-    # 框架模块
-    framework_patterns = [r'framework', r'xposed', r'lsposed', r'edxposed', r'taichi', r'hook', r'inject']
-    if any(any(pattern in f.lower() for pattern in framework_patterns) for f in files):
-        categories.append('Framework')
-    
-    # 安全模块
-    security_patterns = [r'security', r'privacy', r'protect', r'safe', r'crypto', r'permission', r'lock', r'hide', r'mask']
-    if any(any(pattern in f.lower() for pattern in security_patterns) for f in files):
-        categories.append('Security')
-    
-    # 网络模块
-    network_patterns = [r'network', r'wifi', r'proxy', r'vpn', r'dns', r'hosts', r'firewall', r'internet', r'data', r'5g', r'4g']
-    if any(any(pattern in f.lower() for pattern in network_patterns) for f in files):
-        categories.append('Network')
-    
-    # 性能模块
-    perf_patterns = [r'performance', r'boost', r'tweak', r'optimize', r'governor', r'kernel', r'cpu', r'gpu', r'ram', r'memory', r'battery']
-    if any(any(pattern in f.lower() for pattern in perf_patterns) for f in files):
-        categories.append('Performance')
-    
-    # 实用工具
-    util_patterns = [r'util', r'tool', r'helper', r'manager', r'settings?', r'config', r'backup', r'restore', r'clean']
-    if any(any(pattern in f.lower() for pattern in util_patterns) for f in files):
-        categories.append('Utility')
-
-    # 游戏相关
-    game_patterns = [r'game', r'gaming', r'fps', r'pubg', r'codm', r'unity', r'unreal']
-    if any(any(pattern in f.lower() for pattern in game_patterns) for f in files):
-        categories.append('Gaming')
-
-    # 相机相关
-    camera_patterns = [r'camera', r'photo', r'video', r'gcam', r'lens']
-    if any(any(pattern in f.lower() for pattern in camera_patterns) for f in files):
-        categories.append('Camera')
-
-    # 调试工具
-    debug_patterns = [r'debug', r'log', r'trace', r'test', r'monitor', r'analyze']
-    if any(any(pattern in f.lower() for pattern in debug_patterns) for f in files):
-        categories.append('Debug')
-
-    # 多媒体
-    media_patterns = [r'media', r'player', r'codec', r'stream', r'record']
-    if any(any(pattern in f.lower() for pattern in media_patterns) for f in files):
-        categories.append('Multimedia')
-    
-    # 广告拦截类
-    adblock_patterns = [r'去广告', r'ad[-_]?block', r'block[-_]?ads?', r'no[-_]?ads?', r'remove[-_]?ads?']
-    if any(any(re.search(pattern, f, re.I) for pattern in adblock_patterns) for f in files):
-        categories.append('AdBlock')
-    
-    # 国际化/本地化
-    i18n_patterns = [r'i18n', r'l10n', r'locali[sz]e', r'translate', r'language', r'国际化', r'本地化']
-    if any(any(re.search(pattern, f, re.I) for pattern in i18n_patterns) for f in files):
-        categories.append('Localization')
-    
-    # 输入法相关
-    input_patterns = [r'input[-_]?method', r'keyboard', r'ime', r'输入法']
-    if any(any(re.search(pattern, f, re.I) for pattern in input_patterns) for f in files):
-        categories.append('Input')
-    
-    # 去重并返回
-    return list(set(categories))
+    """
+    根据文件名判断模块分类，规则表见 module_rules.CATEGORY_RULES
+    """
+    return match_categories(files)
 
-def create_track_json(repo_info):
+def create_track_json(repo_info, metadata=None):
     # 获取GitHub仓库信息
-    github_info = get_github_repo_info(repo_info["url"])
+    with span('github_metadata'):
+        github_info = get_github_repo_info(repo_info["url"], metadata)
     if not github_info:
         return None
 
     # 获取update.json内容和模块文件内容
     try:
-        response = requests.get(repo_info["update_to"])
+        with span('update_to'):
+            response = http_get(repo_info["update_to"])
         if response.status_code == 200:
             update_json = response.json()
             if 'zipUrl' in update_json:
                 # 下载并解析模块文件
-                files = download_and_extract_zip(update_json['zipUrl'])
+                files = get_zip_file_names(update_json['zipUrl'])
                 if files:
-                    categories = get_module_categories(files)
-                    # 从zip文件内容检测antifeatures
-                    zip_antifeatures = get_antifeatures_from_files(files)
+                    with span('classification', files=len(files)):
+                        categories = get_module_categories(files)
+                        # 从zip文件内容检测antifeatures
+                        zip_antifeatures = get_antifeatures_from_files(files)
                     
                     # 检查模块版本和兼容性
                     module_version = update_json.get('version', '')
@@ -319,7 +209,7 @@ def create_track_json(repo_info):
         zip_antifeatures = []
 
     # 合并所有来源的 antifeatures
-    antifeatures = list(set(github_info['antifeatures'] + zip_antifeatures))
+    antifeatures = sorted(set(github_info['antifeatures'] + zip_antifeatures))
 
     # 生成readme链接
     if repo_info["url"].startswith('https://github.com/'):
@@ -354,22 +244,48 @@ def create_track_json(repo_info):
         
     return track
 
-def update_tracks():
-    config = load_config()
+def sync_repository(repo_info, metadata=None):
+    """在以模块 ID 命名的 span 中生成 track.json 内容（在线程池中运行）"""
+    with span('module', module=repo_info["module_id"]):
+        return create_track_json(repo_info, metadata)
+
+def update_tracks(max_workers=None):
+    """
+    并发处理所有仓库，单个模块失败不会中断整体同步，返回 {module_id: 错误信息}
+    """
+    store = get_state_store()
     root_dir = Path(__file__).parent.parent
-    
-    for repo in config["repositories"]:
-        module_dir = root_dir / "modules" / repo["module_id"]
-        module_dir.mkdir(parents=True, exist_ok=True)
-        
-        track_path = module_dir / "track.json"
-        track_data = create_track_json(repo)
-        
-        if track_data:
-            with open(track_path, 'w') as f:
-                json.dump(track_data, f, indent=4)
-        else:
-            print(f"Failed to process repository: {repo['url']}")
+    with span('state_refresh', source='track_config.json'):
+        repositories = store.repositories()
+    failures = {}
+    changed = 0
+
+    metadata = prefetch_github_metadata(repositories)
+
+    with ThreadPoolExecutor(max_workers=max_workers or MAX_WORKERS) as executor:
+        futures = {executor.submit(sync_repository, repo, metadata): repo for repo in repositories}
+        for future in as_completed(futures):
+            repo = futures[future]
+            try:
+                track_data = future.result()
+            except Exception as e:
+                failures[repo["module_id"]] = str(e)
+                print(f"Failed to process repository: {repo['url']} ({e})")
+                continue
+
+            if track_data:
+                module_dir = root_dir / "modules" / repo["module_id"]
+                module_dir.mkdir(parents=True, exist_ok=True)
+                if store.put_track(module_dir, track_data):
+                    changed += 1
+            else:
+                failures[repo["module_id"]] = "no track data"
+                print(f"Failed to process repository: {repo['url']}")
+
+    print(f"Processed {len(repositories)} repositories, {len(failures)} failed, {changed} track.json changed")
+    for module_id, error in sorted(failures.items()):
+        print(f"  {module_id}: {error}")
+    return failures
             
 if __name__ == "__main__":
-    update_tracks()
+    update_tracks()
\ No newline at end of file
@@ -0,0 +1,152 @@
+import io
+import re
+import zipfile
+from typing import List, Optional
+
+import requests
+
+from http_client import get_session
+from tracing import annotate
+
+# 结束记录（22 字节）加最大注释长度，一次后缀请求即可覆盖 EOCD
+TAIL_SIZE = 22 + 65535
+# 后续范围请求的最小块大小，减少读取中央目录时的往返次数
+BLOCK_SIZE = 256 * 1024
+
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
+
+class RangeNotSupported(Exception):
+    """服务器忽略了 Range 头，response 为返回完整内容的流式响应（可能为 None）"""
+
+    def __init__(self, url: str, response=None):
+        super().__init__(url)
+        self.response = response
+
+
+class HttpRangeFile(io.RawIOBase):
+    """
+    通过 HTTP Range 请求按需读取远程文件的只读文件对象
+
+    打开时先请求文件末尾 TAIL_SIZE 字节，zipfile 读取 EOCD 和较小的中央目录
+    时不会再产生额外请求；服务器不支持 Range 时抛出 RangeNotSupported，
+    并把已经收到的完整响应附在异常上供回退使用。
+    """
+
+    def __init__(self, url: str, session=None, timeout: int = 30):
+        self.url = url
+        self.session = session or get_session()
+        self.timeout = timeout
+        self.bytes_fetched = 0
+        self.requests_made = 0
+        self._pos = 0
+        self._chunks = []
+
+        response = self._request(f'bytes=-{TAIL_SIZE}', stream=True)
+        if response.status_code == 200:
+            raise RangeNotSupported(url, response)
+        if response.status_code != 206:
+            response.close()
+            raise requests.HTTPError(f'{response.status_code} for {url}', response=response)
+        match = _CONTENT_RANGE.match(response.headers.get('content-range', ''))
+        if not match:
+            response.close()
+            raise RangeNotSupported(url)
+        start, _, self.size = (int(x) for x in match.groups())
+        try:
+            self._add_chunk(start, response.content)
+        finally:
+            response.close()
+
+    def _request(self, byte_range: str, stream: bool = False):
+        self.requests_made += 1
+        return self.session.get(self.url, headers={'Range': byte_range},
+                                timeout=self.timeout, stream=stream)
+
+    def _add_chunk(self, start: int, data: bytes) -> None:
+        self.bytes_fetched += len(data)
+        self._chunks.append((start, data))
+
+    def _cached(self, start: int, end: int) -> Optional[bytes]:
+        for chunk_start, data in self._chunks:
+            if chunk_start <= start and end <= chunk_start + len(data):
+                return data[start - chunk_start:end - chunk_start]
+        return None
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        else:
+            self._pos = self.size + offset
+        return self._pos
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.size - self._pos
+        start = self._pos
+        end = min(self.size, start + size)
+        if start >= end:
+            return b''
+        data = self._cached(start, end)
+        if data is None:
+            fetch_end = min(self.size, max(end, start + BLOCK_SIZE))
+            response = self._request(f'bytes={start}-{fetch_end - 1}')
+            if response.status_code != 206:
+                response.close()
+                raise RangeNotSupported(self.url)
+            self._add_chunk(start, response.content)
+            data = response.content[:end - start]
+        self._pos = start + len(data)
+        return data
+
+
+def list_zip_entries(url: str, session=None, timeout: int = 30) -> Optional[List[str]]:
+    """
+    只读取中央目录列出远程 zip 内的文件路径（不含目录），无需下载或解压整个文件
+
+    服务器不支持 Range 时（包括读取中央目录途中的后续范围请求）回退为流式读入内存后再解析。
+    Range 请求的次数和字节数记录在当前 span 上。
+    """
+    session = session or get_session()
+    try:
+        remote = HttpRangeFile(url, session=session, timeout=timeout)
+    except RangeNotSupported as e:
+        annotate(mode='stream')
+        response = e.response if e.response is not None else session.get(url, stream=True, timeout=timeout)
+        return _list_from_stream(response)
+    try:
+        with zipfile.ZipFile(remote) as zf:
+            return [info.filename for info in zf.infolist() if not info.is_dir()]
+    except RangeNotSupported:
+        annotate(mode='stream')
+        return _list_from_stream(session.get(url, stream=True, timeout=timeout))
+    finally:
+        annotate(range_requests=remote.requests_made, range_bytes=remote.bytes_fetched)
+
+
+def _list_from_stream(response) -> Optional[List[str]]:
+    with response:
+        if response.status_code != 200:
+            return None
+        buffer = io.BytesIO()
+        for chunk in response.iter_content(chunk_size=65536):
+            buffer.write(chunk)
+    with zipfile.ZipFile(buffer) as zf:
+        return [info.filename for info in zf.infolist() if not info.is_dir()]
+
+
+def list_local_zip_entries(path) -> List[str]:
+    """列出本地 zip 内的文件路径（不含目录）"""
+    with zipfile.ZipFile(path) as zf:
+        return [info.filename for info in zf.infolist() if not info.is_dir()]
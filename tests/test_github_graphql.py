@@ -0,0 +1,228 @@
+"""
+github_graphql 与 track_updates 中 REST 回退的测试
+
+GitHub 接口由本地 http.server 替代，不访问网络：
+    python -m pytest tests
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+# 缓存目录（HTTP 缓存、状态库、追踪报告）放到临时目录，必须在导入脚本模块之前设置
+os.environ['MMRL_CACHE_DIR'] = tempfile.mkdtemp(prefix='mmrl-test-')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'scripts'))
+
+import github_graphql  # noqa: E402
+import track_updates  # noqa: E402
+from github_graphql import build_query, fetch_repositories, normalize_repository  # noqa: E402
+
+GRAPHQL_NODES = {
+    ('alpha', 'module-a'): {
+        'isArchived': False,
+        'isDisabled': False,
+        'isPrivate': False,
+        'updatedAt': '2025-01-01T00:00:00Z',
+        'licenseInfo': {'spdxId': 'MIT'},
+        'object': {'entries': [{'name': 'module.prop'}, {'name': 'Service.sh'}]},
+    },
+    ('beta', 'module-b'): {
+        'isArchived': True,
+        'isDisabled': False,
+        'isPrivate': False,
+        'updatedAt': '2024-06-01T00:00:00Z',
+        'licenseInfo': None,
+        'object': None,
+    },
+}
+
+REST_REPOS = {
+    ('gamma', 'module-c'): {
+        'archived': False,
+        'disabled': False,
+        'private': False,
+        'license': {'spdx_id': 'GPL-3.0'},
+        'updated_at': '2025-02-02T00:00:00Z',
+    },
+}
+REST_CONTENTS = {
+    ('gamma', 'module-c'): [{'name': 'module.prop'}, {'name': 'customize.sh'}],
+}
+
+
+class GitHubStandIn(BaseHTTPRequestHandler):
+    """按 GRAPHQL_NODES / REST_REPOS 应答 GraphQL 与 REST 请求，记录收到的请求"""
+
+    requests = []
+    graphql_status = 200
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        query = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['query']
+        type(self).requests.append(('POST', self.path, self.headers.get('Authorization')))
+        if type(self).graphql_status != 200:
+            return self._send(type(self).graphql_status, {'message': 'unavailable'})
+        data, errors = {}, []
+        for line in query.splitlines():
+            if ': repository(' not in line:
+                continue
+            alias = line.split(':', 1)[0].strip()
+            owner = json.loads(line.split('owner: ', 1)[1].split(', name:', 1)[0])
+            name = json.loads(line.split('name: ', 1)[1].split(')', 1)[0])
+            data[alias] = GRAPHQL_NODES.get((owner, name))
+            if data[alias] is None:
+                errors.append({'message': f'Could not resolve to a Repository with the name {owner}/{name}.'})
+        self._send(200, {'data': data, 'errors': errors})
+
+    def do_GET(self):
+        type(self).requests.append(('GET', self.path, self.headers.get('Authorization')))
+        parts = self.path.strip('/').split('/')
+        if len(parts) < 3 or parts[0] != 'repos':
+            return self._send(404, {'message': 'Not Found'})
+        key = (parts[1], parts[2])
+        if len(parts) == 3 and key in REST_REPOS:
+            return self._send(200, REST_REPOS[key])
+        if parts[3:] == ['contents'] and key in REST_CONTENTS:
+            return self._send(200, REST_CONTENTS[key])
+        if parts[3:] == ['security', 'advisories'] and key in REST_REPOS:
+            return self._send(200, [])
+        self._send(404, {'message': 'Not Found'})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), GitHubStandIn)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        GitHubStandIn.requests = []
+        GitHubStandIn.graphql_status = 200
+        patcher = mock.patch.object(github_graphql, 'GITHUB_GRAPHQL_URL', f'{self.base_url}/graphql')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class BuildQueryTest(unittest.TestCase):
+    def test_aliases_follow_input_order(self):
+        query = build_query([('alpha', 'module-a'), ('beta', 'module-b')])
+        self.assertTrue(query.startswith('query {'))
+        self.assertIn('r0: repository(owner: "alpha", name: "module-a")', query)
+        self.assertIn('r1: repository(owner: "beta", name: "module-b")', query)
+        self.assertLess(query.index('r0:'), query.index('r1:'))
+
+    def test_names_are_quoted(self):
+        query = build_query([('evil', 'name") { id } x: repository(owner: "y')])
+        self.assertIn('name: "name\\") { id } x: repository(owner: \\"y")', query)
+
+
+class NormalizeRepositoryTest(unittest.TestCase):
+    def test_maps_fields_to_rest_names(self):
+        self.assertEqual(normalize_repository(GRAPHQL_NODES[('alpha', 'module-a')]), {
+            'archived': False,
+            'disabled': False,
+            'private': False,
+            'license': 'MIT',
+            'updated_at': '2025-01-01T00:00:00Z',
+            'files': ['module.prop', 'service.sh'],
+        })
+
+    def test_missing_license_and_tree(self):
+        metadata = normalize_repository(GRAPHQL_NODES[('beta', 'module-b')])
+        self.assertTrue(metadata['archived'])
+        self.assertEqual(metadata['license'], '')
+        self.assertIsNone(metadata['files'])
+
+    def test_empty_tree(self):
+        self.assertEqual(normalize_repository({'object': {'entries': []}})['files'], [])
+
+
+class FetchRepositoriesTest(StandInTestCase):
+    def test_batches_and_skips_unresolved_repositories(self):
+        repos = [('Alpha', 'Module-A'), ('alpha', 'module-a'), ('beta', 'module-b'), ('missing', 'repo')]
+        results = fetch_repositories(repos, token='secret', batch_size=2)
+
+        self.assertEqual(set(results), {('alpha', 'module-a'), ('beta', 'module-b')})
+        self.assertEqual(results[('alpha', 'module-a')]['license'], 'MIT')
+        # 重复的仓库只查询一次：3 个仓库、每批 2 个，共 2 次请求
+        self.assertEqual(GitHubStandIn.requests, [('POST', '/graphql', 'bearer secret')] * 2)
+
+    def test_without_token_sends_nothing(self):
+        with mock.patch.dict(os.environ, {}, clear=False):
+            os.environ.pop('GITHUB_TOKEN', None)
+            self.assertEqual(fetch_repositories([('alpha', 'module-a')]), {})
+        self.assertEqual(GitHubStandIn.requests, [])
+
+    def test_failed_batch_returns_nothing(self):
+        GitHubStandIn.graphql_status = 502
+        self.assertEqual(fetch_repositories([('alpha', 'module-a')], token='secret'), {})
+
+
+class RestFallbackTest(StandInTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(track_updates, 'GITHUB_API_URL', self.base_url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repository_missing_from_graphql_uses_rest(self):
+        metadata = fetch_repositories([('gamma', 'module-c')], token='secret')
+        self.assertEqual(metadata, {})
+
+        info = track_updates.get_github_repo_info('https://github.com/gamma/module-c', metadata)
+        self.assertEqual(info, {'license': 'GPL-3.0', 'antifeatures': [], 'updated_at': '2025-02-02T00:00:00Z'})
+        paths = [path for method, path, _ in GitHubStandIn.requests if method == 'GET']
+        self.assertIn('/repos/gamma/module-c', paths)
+        self.assertIn('/repos/gamma/module-c/contents', paths)
+
+    def test_rest_and_graphql_metadata_agree(self):
+        rest = track_updates.fetch_rest_metadata('gamma', 'module-c', {})
+        node = {
+            'isArchived': False,
+            'isDisabled': False,
+            'isPrivate': False,
+            'updatedAt': '2025-02-02T00:00:00Z',
+            'licenseInfo': {'spdxId': 'GPL-3.0'},
+            'object': {'entries': [{'name': 'module.prop'}, {'name': 'customize.sh'}]},
+        }
+        self.assertEqual(rest, normalize_repository(node))
+
+    def test_prefetched_repository_skips_rest_metadata(self):
+        metadata = fetch_repositories([('beta', 'module-b')], token='secret')
+        info = track_updates.get_github_repo_info('https://github.com/beta/module-b', metadata)
+
+        self.assertEqual(info['antifeatures'], ['nosourcesince', 'upstreamnonfree'])
+        paths = [path for method, path, _ in GitHubStandIn.requests if method == 'GET']
+        self.assertNotIn('/repos/beta/module-b', paths)
+        self.assertNotIn('/repos/beta/module-b/contents', paths)
+
+    def test_unknown_repository(self):
+        info = track_updates.get_github_repo_info('https://github.com/nobody/nothing', {})
+        self.assertEqual(info, {'license': '', 'antifeatures': [], 'updated_at': ''})
+
+
+if __name__ == '__main__':
+    unittest.main()